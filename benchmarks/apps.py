@@ -0,0 +1,187 @@
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+from lecture_1 import math_example
+from lecture_1.hw import math_plain_asgi
+
+APPS = {
+    "plain": math_plain_asgi.app,
+    "fastapi": math_example.app,
+}
+
+
+def cases() -> list[tuple[str, str, str, bytes, bytes]]:
+    # (endpoint, input size, path, query string, body)
+    rng = random.Random(0)
+    result = []
+    for n in (10, 1_000, 10_000):
+        result.append(("factorial", str(n), "/factorial", b"n=%d" % n, b""))
+    for n in (10, 10_000, 100_000):
+        result.append(("fibonacci", str(n), f"/fibonacci/{n}", b"", b""))
+    for size in (10, 1_000, 100_000):
+        body = json.dumps([rng.uniform(-1e6, 1e6) for _ in range(size)]).encode()
+        result.append(("mean", str(size), "/mean", b"", body))
+    return result
+
+
+async def call(app, path: str, query_string: bytes, body: bytes) -> None:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query_string,
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 1),
+        "server": ("bench", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    status = None
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # the request is over, park like a server would until disconnect
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    if status != 200:
+        raise RuntimeError(f"{path}?{query_string.decode()} answered {status}")
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def measure(app, case, requests: int, max_seconds: float, warm: bool) -> dict:
+    endpoint, size, path, query_string, body = case
+
+    def prepare():
+        # the plain app answers repeated inputs from its response cache;
+        # unless asked otherwise every request calculates, like FastAPI does
+        if not warm:
+            math_plain_asgi.response_cache.clear()
+
+    for _ in range(3):
+        prepare()
+        await call(app, path, query_string, body)
+
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < requests and (
+        len(latencies) < 10 or time.perf_counter() - started < max_seconds
+    ):
+        prepare()
+        start = time.perf_counter()
+        await call(app, path, query_string, body)
+        latencies.append(time.perf_counter() - start)
+
+    # allocations are traced in a separate pass, tracing slows everything
+    peaks = []
+    tracemalloc.start()
+    for _ in range(min(len(latencies), 20)):
+        prepare()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        try:
+            await call(app, path, query_string, body)
+        finally:
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    latencies.sort()
+    peaks.sort()
+    return {
+        "endpoint": endpoint,
+        "size": size,
+        "requests": len(latencies),
+        "rps": len(latencies) / sum(latencies),
+        "p50_us": percentile(latencies, 0.5) * 1e6,
+        "p99_us": percentile(latencies, 0.99) * 1e6,
+        "alloc_peak_kib": percentile(peaks, 0.5) / 1024,
+    }
+
+
+def commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> dict:
+    results = []
+    print(
+        f"{'app':>8} {'endpoint':>10} {'size':>7} {'req/s':>10}"
+        f" {'p50':>10} {'p99':>10} {'alloc':>10}"
+    )
+    for case in cases():
+        if args.endpoint and case[0] not in args.endpoint:
+            continue
+        for name in args.app or list(APPS):
+            try:
+                result = await measure(
+                    APPS[name], case, args.requests, args.max_seconds, args.warm
+                )
+            except Exception as e:
+                # an app that cannot serve an input is part of the comparison
+                results.append(
+                    {"app": name, "endpoint": case[0], "size": case[1], "error": str(e)}
+                )
+                print(f"{name:>8} {case[0]:>10} {case[1]:>7}  failed: {str(e)[:60]}")
+                continue
+            result["app"] = name
+            results.append(result)
+            print(
+                f"{name:>8} {result['endpoint']:>10} {result['size']:>7}"
+                f" {result['rps']:>10.0f} {result['p50_us']:>8.0f}us"
+                f" {result['p99_us']:>8.0f}us {result['alloc_peak_kib']:>7.0f}KiB"
+            )
+    math_plain_asgi.offloader.shutdown()
+    return {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "warm": args.warm,
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="plain ASGI vs FastAPI, in process")
+    parser.add_argument("--app", action="append", choices=list(APPS))
+    parser.add_argument("--endpoint", action="append", choices=["factorial", "fibonacci", "mean"])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--max-seconds", type=float, default=2.0)
+    parser.add_argument("--warm", action="store_true", help="keep the plain app response cache")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import math
+import timeit
+from sys import argv
+
+from lecture_1.hw import factorial as engine
+
+
+def loop_factorial(n: int) -> int:
+    # the original calculate_factorial from math_plain_asgi.py
+    result = 1
+    for i in range(2, n + 1):
+        result *= i
+    return result
+
+
+def best_of(func, setup=lambda: None, repeat: int = 3) -> float:
+    return min(timeit.repeat(func, setup=setup, number=1, repeat=repeat))
+
+
+def run(sizes: list[int]) -> None:
+    print(f"{'n':>8} {'loop':>10} {'math':>10} {'cold':>10} {'cached':>10} {'nearby':>10}")
+    for n in sizes:
+        loop = best_of(lambda: loop_factorial(n))
+        builtin = best_of(lambda: math.factorial(n))
+
+        cold_time = best_of(lambda: engine.factorial(n), setup=engine.cache.clear)
+        cached = best_of(lambda: engine.factorial(n))
+
+        checkpoint = math.factorial(n)
+
+        def seed_checkpoint():
+            engine.cache.clear()
+            engine.cache.put(n, checkpoint)
+
+        nearby_time = best_of(lambda: engine.factorial(n + n // 10), setup=seed_checkpoint)
+        print(
+            f"{n:>8} {loop * 1e3:>8.2f}ms {builtin * 1e3:>8.2f}ms {cold_time * 1e3:>8.2f}ms"
+            f" {cached * 1e6:>8.2f}us {nearby_time * 1e3:>8.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    run([int(arg) for arg in argv[1:]] or [1_000, 10_000, 50_000, 100_000])
@@ -0,0 +1,57 @@
+import asyncio
+import json
+import random
+import struct
+import time
+from sys import argv
+
+from lecture_1.hw.math_plain_asgi import app
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def call_mean(body: bytes, content_type: bytes) -> float:
+    chunks = [body[i : i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE)]
+    last = len(chunks) - 1
+    messages = iter(
+        {"type": "http.request", "body": chunk, "more_body": i < last}
+        for i, chunk in enumerate(chunks)
+    )
+
+    async def receive():
+        return next(messages)
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200, message
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/mean",
+        "query_string": b"",
+        "headers": [(b"content-type", content_type)],
+    }
+    start = time.perf_counter()
+    await app(scope, receive, send)
+    return time.perf_counter() - start
+
+
+def run(sizes: list[int]) -> None:
+    print(f"{'values':>10} {'format':>8} {'size':>10} {'MB/s':>10} {'Mvalues/s':>10}")
+    for size in sizes:
+        values = [random.uniform(-1e6, 1e6) for _ in range(size)]
+        bodies = {
+            "json": (json.dumps(values).encode(), b"application/json"),
+            "float64": (struct.pack(f"<{size}d", *values), b"application/octet-stream"),
+        }
+        for name, (body, content_type) in bodies.items():
+            elapsed = min(asyncio.run(call_mean(body, content_type)) for _ in range(3))
+            print(
+                f"{size:>10} {name:>8} {len(body) / 1e6:>8.1f}MB"
+                f" {len(body) / 1e6 / elapsed:>10.1f} {size / 1e6 / elapsed:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    run([int(arg) for arg in argv[1:]] or [10_000, 1_000_000, 5_000_000])
@@ -0,0 +1,52 @@
+import math
+import time
+from sys import argv
+
+from lecture_1.hw import primes as engine
+
+SPAN = 10**6
+SEMIPRIMES = {
+    "10^12": 999983 * 1000003,
+    "10^18": (10**9 + 7) * (10**9 + 9),
+    "10^24": (10**12 + 39) * (10**12 + 61),
+}
+
+
+def naive_segment(lo: int, hi: int) -> list[int]:
+    # a fresh byte-per-number sieve of [lo, hi] with no reuse between calls
+    flags = bytearray([1]) * (hi - lo + 1)
+    for p in range(2, math.isqrt(hi) + 1):
+        start = max(p * p, -(-lo // p) * p)
+        flags[start - lo::p] = bytes(len(range(start - lo, len(flags), p)))
+    return [lo + i for i, flag in enumerate(flags) if flag and lo + i > 1]
+
+
+def timed(func, *args) -> tuple[float, object]:
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def run(exponents: list[int]) -> None:
+    print(f"{'lo':>6} {'primes':>8} {'naive':>12} {'cold':>12} {'cached':>12}")
+    for exponent in exponents:
+        lo = 10**exponent
+        engine.clear_segments()
+        naive, _ = timed(naive_segment, lo, lo + SPAN)
+        cold, found = timed(engine.primes, lo, lo + SPAN)
+        cached, _ = timed(engine.primes, lo, lo + SPAN)
+        print(
+            f"{'10^' + str(exponent):>6} {len(found):>8}"
+            f" {SPAN / naive / 1e6:>8.1f}M/s {SPAN / cold / 1e6:>8.1f}M/s"
+            f" {SPAN / cached / 1e6:>8.1f}M/s"
+        )
+
+    print()
+    print(f"{'n':>6} {'factorize':>10}")
+    for name, n in SEMIPRIMES.items():
+        elapsed, _ = timed(engine.factorize, n)
+        print(f"{name:>6} {elapsed * 1e3:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    run([int(arg) for arg in argv[1:]] or [6, 8, 10])
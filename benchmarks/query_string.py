@@ -0,0 +1,39 @@
+import timeit
+from urllib.parse import parse_qs
+
+from lecture_1.hw.query_string import QueryParams
+
+QUERIES = {
+    "short": b"n=1000",
+    "typical": b"n=1000&mod=1000000007&encoding=hex",
+    "escaped": b"city=New%20York&name=%D0%98%D0%B2%D0%B0%D0%BD&q=a+b+c&n=10",
+    "50 params": b"&".join(b"key%d=value%d" % (i, i) for i in range(50)) + b"&n=10",
+}
+
+
+def with_parse_qs(query_string: bytes) -> None:
+    # what query_params did before: decode everything, then look up one key
+    parse_qs(query_string.decode()).get("n")
+
+
+def with_query_params(query_string: bytes) -> None:
+    QueryParams(query_string).get("n")
+
+
+def per_call(func, query_string: bytes, number: int = 20_000) -> float:
+    return min(timeit.repeat(lambda: func(query_string), number=number, repeat=5)) / number
+
+
+def run() -> None:
+    print(f"{'query':>10} {'parse_qs':>10} {'bytes':>10} {'speedup':>8}")
+    for name, query_string in QUERIES.items():
+        reference = per_call(with_parse_qs, query_string)
+        ours = per_call(with_query_params, query_string)
+        print(
+            f"{name:>10} {reference * 1e9:>8.0f}ns {ours * 1e9:>8.0f}ns"
+            f" {reference / ours:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,66 @@
+import timeit
+from sys import argv
+
+from lecture_1.hw.math_plain_asgi import router as app_router
+from lecture_1.hw.routing import RouteNotFound, Router
+
+PATHS = {
+    "static": ("GET", "/factorial"),
+    "param": ("GET", "/fibonacci/12345"),
+    "missing": ("GET", "/not_found/at/all"),
+}
+
+
+async def noop(scope, receive, params):
+    return 200, ""
+
+
+def if_chain(method: str, path: str) -> None:
+    # the dispatch from the original app(): a chain of comparisons
+    if path == '/factorial' and method == 'GET':
+        return
+    elif path.startswith('/fibonacci/') and method == 'GET':
+        int(path.split('/')[-1])
+    elif path == '/mean' and method == 'GET':
+        return
+
+
+def padded_router(extra_routes: int) -> Router:
+    router = Router()
+    for i in range(extra_routes):
+        router.add("GET", f"/static_{i}", noop)
+        router.add("GET", f"/dynamic_{i}/{{n:int}}", noop)
+    router.add("GET", "/factorial", noop)
+    router.add("GET", "/fibonacci/{n:int}", noop)
+    return router
+
+
+def resolve(router: Router, method: str, path: str) -> None:
+    try:
+        router.resolve(method, path)
+    except RouteNotFound:
+        pass
+
+
+def per_call(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e9
+
+
+def run(number: int) -> None:
+    routers = {"app": app_router} | {
+        f"+{n} routes": padded_router(n) for n in (10, 1_000, 100_000)
+    }
+    print(f"{'router':>16} " + " ".join(f"{kind:>10}" for kind in PATHS))
+    print(
+        f"{'if-chain':>16} "
+        + " ".join(f"{per_call(lambda: if_chain(*PATHS[kind]), number):>8.0f}ns" for kind in PATHS)
+    )
+    for name, router in routers.items():
+        timings = [
+            per_call(lambda: resolve(router, *PATHS[kind]), number) for kind in PATHS
+        ]
+        print(f"{name:>16} " + " ".join(f"{t:>8.0f}ns" for t in timings))
+
+
+if __name__ == "__main__":
+    run(int(argv[1]) if len(argv) > 1 else 100_000)
@@ -0,0 +1,102 @@
+import itertools
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import timeit
+from sys import argv
+
+from lecture_2.hw.shop_api.api.item.contracts import ItemRequest
+from lecture_2.hw.shop_api.store import queries, shared
+from lecture_2.hw.shop_api.store.shared import SharedCatalog
+
+READ_SECONDS = 2.0
+
+
+def fill(catalog: SharedCatalog, size: int) -> float:
+    rng = random.Random(size)
+    start = time.perf_counter()
+    for i in range(size):
+        price = rng.uniform(0.0, 1000.0)
+        catalog.create(f"item {i}", price)
+        queries.create_item(ItemRequest(name=f"item {i}", price=price))
+    return time.perf_counter() - start
+
+
+def per_call(func, *args, number: int = 200) -> float:
+    return min(timeit.repeat(lambda: func(*args), number=number, repeat=3)) / number
+
+
+def read(path: str, size: int, counter, ready, start) -> None:
+    # one worker answering GET /item/{id} and GET /item pages
+    catalog = SharedCatalog(path)
+    rng = random.Random(os.getpid())
+    done = 0
+    ready.release()
+    start.wait()
+    deadline = time.perf_counter() + READ_SECONDS
+    while time.perf_counter() < deadline:
+        catalog.get(rng.randrange(size))
+        catalog.find_page(0, 10, None, None, False)
+        done += 1
+    catalog.close()
+    with counter.get_lock():
+        counter.value += done
+
+
+def readers(path: str, size: int, processes: int) -> float:
+    context = multiprocessing.get_context("spawn")
+    counter = context.Value("q", 0)
+    ready, start = context.Semaphore(0), context.Event()
+    workers = [
+        context.Process(target=read, args=(path, size, counter, ready, start)) for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    # every worker reads during the same window
+    for _ in workers:
+        ready.acquire()
+    start.set()
+    for worker in workers:
+        worker.join()
+    return counter.value / READ_SECONDS
+
+
+def run(size: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog")
+        catalog = SharedCatalog(path)
+        create = fill(catalog, size) / size
+        print(f"{size} items, create (catalog + memory) {create * 1e6:.1f}us")
+
+        prices = itertools.count(0.5)
+        print(f"{'operation':>14} {'memory':>10} {'catalog':>10} {'no numpy':>10}")
+        cases = [
+            ("get", lambda: queries.find_item(size // 2), lambda: catalog.get(size // 2), 2000),
+            ("page by id", lambda: queries.find_items(0, 10, None, None, False),
+             lambda: catalog.find_page(0, 10, None, None, False), 2000),
+            ("page by price", lambda: queries.find_items(0, 10, 500.0, 501.0, False),
+             lambda: catalog.find_page(0, 10, 500.0, 501.0, False), 2000),
+            # a price change, then a page that has to take it into its index
+            ("update + page", lambda: (queries.update_item(1, ItemRequest(name="item 1", price=next(prices))),
+                                       queries.find_items(0, 10, 500.0, 501.0, False)),
+             lambda: (catalog.update(1, None, next(prices)), catalog.find_page(0, 10, 500.0, 501.0, False)), 2000),
+        ]
+        for name, memory, shared_call, number in cases:
+            numpy, shared.numpy = shared.numpy, None
+            fallback = per_call(shared_call, number=number)
+            shared.numpy = numpy
+            print(
+                f"{name:>14} {per_call(memory, number=number) * 1e6:>8.1f}us"
+                f" {per_call(shared_call, number=number) * 1e6:>8.1f}us {fallback * 1e6:>8.1f}us"
+            )
+
+        print(f"{os.cpu_count()} cpus, get + page by id per second:")
+        for processes in (1, 2, 4):
+            print(f"{processes:>4} workers {readers(path, size, processes):>10.0f}")
+        catalog.close()
+
+
+if __name__ == "__main__":
+    run(int(argv[1]) if len(argv) > 1 else 1_000_000)
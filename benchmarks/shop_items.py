@@ -0,0 +1,58 @@
+import random
+import time
+import timeit
+from sys import argv
+
+from lecture_2.hw.shop_api.api.item.contracts import ItemRequest
+from lecture_2.hw.shop_api.store import queries
+from lecture_2.hw.shop_api.store.indexes import SortedIndex
+
+QUERIES = {
+    "narrow": (500.0, 501.0),
+    "min": (900.0, None),
+    "wide": (0.0, 1000.0),
+}
+
+
+def scan_find_items(offset, limit, min_price, max_price, show_deleted):
+    # the original find_items: filter the whole catalog, then slice
+    result = [
+        item for item in queries.item_data.values()
+        if (min_price is None or item.price >= min_price) and
+           (max_price is None or item.price <= max_price) and
+           (show_deleted or not item.deleted)
+    ]
+    return result[offset: offset + limit]
+
+
+def fill(size: int) -> float:
+    queries.item_data.clear()
+    queries.item_price_index = SortedIndex()
+    queries.deleted_item_price_index = SortedIndex()
+    rng = random.Random(size)
+    start = time.perf_counter()
+    for i in range(size):
+        queries.create_item(ItemRequest(name=f"item {i}", price=rng.uniform(0.0, 1000.0)))
+    return time.perf_counter() - start
+
+
+def per_call(func, *args, number: int = 20) -> float:
+    return min(timeit.repeat(lambda: func(*args), number=number, repeat=3)) / number
+
+
+def run(sizes: list[int]) -> None:
+    print(f"{'items':>8} {'create':>9} {'query':>7} {'scan':>10} {'index':>10}")
+    for size in sizes:
+        create = fill(size) / size
+        for name, (min_price, max_price) in QUERIES.items():
+            args = (0, 10, min_price, max_price, False)
+            scan = per_call(scan_find_items, *args, number=3)
+            index = per_call(queries.find_items, *args, number=200)
+            print(
+                f"{size:>8} {create * 1e6:>7.1f}us {name:>7}"
+                f" {scan * 1e3:>8.2f}ms {index * 1e6:>8.1f}us"
+            )
+
+
+if __name__ == "__main__":
+    run([int(arg) for arg in argv[1:]] or [10_000, 100_000, 1_000_000])
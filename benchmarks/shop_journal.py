@@ -0,0 +1,72 @@
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+from sys import argv
+
+from lecture_2.hw.shop_api.api.item.contracts import ItemRequest
+from lecture_2.hw.shop_api.store import queries
+from lecture_2.hw.shop_api.store.indexes import SortedIndex
+from lecture_2.hw.shop_api.store.journal import SNAPSHOT_EVERY, Journal
+from lecture_2.hw.shop_api.store.repository import MemoryRepository
+
+# requests in flight at once, like a server under load
+CONCURRENCY = 64
+
+
+def reset_store() -> None:
+    for name in ("item_data", "cart_data", "item_carts"):
+        setattr(queries, name, {})
+    for name in ("item_ids", "cart_ids"):
+        setattr(queries, name, [])
+    for name in ("item_price_index", "deleted_item_price_index", "cart_price_index", "cart_quantity_index"):
+        setattr(queries, name, SortedIndex())
+    queries._item_id_generator = queries.int_id_generator()
+    queries._cart_id_generator = queries.int_id_generator()
+
+
+async def fill(repository: MemoryRepository, size: int, concurrency: int) -> float:
+    rng = random.Random(size)
+    requests = [ItemRequest(name=f"item {i}", price=rng.uniform(0.0, 1000.0)) for i in range(size)]
+    start = time.perf_counter()
+    for i in range(0, size, concurrency):
+        await asyncio.gather(*(repository.create_item(request) for request in requests[i : i + concurrency]))
+    return time.perf_counter() - start
+
+
+def measure(size: int, concurrency: int, directory: Path | None, snapshot_every: int) -> tuple[float, Journal | None]:
+    reset_store()
+    journal = None if directory is None else Journal.open(directory, snapshot_every)
+    repository = MemoryRepository(journal)
+    elapsed = asyncio.run(fill(repository, size, concurrency))
+    repository.close()
+    return size / elapsed, journal
+
+
+def restart(directory: Path) -> float:
+    reset_store()
+    start = time.perf_counter()
+    Journal.open(directory, 1 << 62).close()
+    return time.perf_counter() - start
+
+
+def run(size: int) -> None:
+    print(f"{'mode':>22} {'writes/s':>10} {'syncs':>8} {'restart':>9}")
+    for concurrency in (1, CONCURRENCY):
+        # one writer at a time pays a full sync per write, keep it short
+        n = size if concurrency > 1 else min(size, 20_000)
+        base, _ = measure(n, concurrency, None, SNAPSHOT_EVERY)
+        print(f"{f'memory c={concurrency}':>22} {base:>10.0f}")
+        for snapshot_every, label in ((SNAPSHOT_EVERY, "snapshots"), (1 << 62, "journal only")):
+            with tempfile.TemporaryDirectory(dir=".") as directory:
+                rate, journal = measure(n, concurrency, Path(directory), snapshot_every)
+                seconds = restart(Path(directory))
+            print(
+                f"{f'{label} c={concurrency}':>22} {rate:>10.0f} {journal.syncs:>8}"
+                f" {seconds:>8.2f}s   overhead {base / rate - 1:>6.1%}"
+            )
+
+
+if __name__ == "__main__":
+    run(int(argv[1]) if len(argv) > 1 else 1_000_000)
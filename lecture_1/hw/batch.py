@@ -0,0 +1,59 @@
+import math
+
+from lecture_1.hw import factorial as factorial_engine
+from lecture_1.hw import fibonacci as fibonacci_engine
+
+OPS = ('factorial', 'fibonacci')
+MAX_JOBS = 10_000
+# results of one request together, in bits: computing and printing 4M bits
+# takes about two seconds, well inside offload.TIMEOUT, which matters as a
+# call that times out keeps its worker until it returns
+MAX_RESULT_BITS = 1 << 22
+LOG2_PHI = math.log2((1 + math.sqrt(5)) / 2)
+# between two requested fibonacci numbers at most this far apart the sweep
+# keeps adding instead of jumping with fast doubling
+SWEEP_GAP = 64
+
+
+def result_bits(op: str, n: int) -> float:
+    # the size of n! (log-gamma) or of F(n), about n * log2 of the golden ratio
+    if n >= 1 << 53:
+        return math.inf
+    if op == 'factorial':
+        return math.lgamma(n + 1) / math.log(2)
+    return n * LOG2_PHI
+
+
+def factorial_sweep(ns: list[int]) -> dict[int, int]:
+    # ascending n, each factorial extends the previous one by the product
+    # of the gap, so the whole batch costs about as much as its largest n!
+    results = {}
+    previous_n, previous = None, 1
+    for n in sorted(set(ns)):
+        if previous_n is None:
+            previous = factorial_engine.factorial(n)
+        else:
+            previous *= factorial_engine.product_range(previous_n + 1, n)
+        previous_n = n
+        results[n] = previous
+    return results
+
+
+def fibonacci_sweep(ns: list[int]) -> dict[int, int]:
+    results = {}
+    k, (a, b) = None, (0, 1)
+    for n in sorted(set(ns)):
+        if k is None or n - k > SWEEP_GAP:
+            a, b = fibonacci_engine.fibonacci_pair(n)
+        else:
+            for _ in range(n - k):
+                a, b = b, a + b
+        k = n
+        results[n] = a
+    return results
+
+
+def calculate_batch(jobs: list[tuple[str, int]]) -> list[int]:
+    factorials = factorial_sweep([n for op, n in jobs if op == 'factorial'])
+    fibonaccis = fibonacci_sweep([n for op, n in jobs if op == 'fibonacci'])
+    return [factorials[n] if op == 'factorial' else fibonaccis[n] for op, n in jobs]
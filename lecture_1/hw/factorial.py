@@ -0,0 +1,100 @@
+import math
+from bisect import bisect_right, insort
+from collections import OrderedDict
+
+# below this n a plain C factorial is cheaper than any cache bookkeeping
+CACHE_MIN_N = 256
+# leaf size of the binary splitting recursion
+SPLIT_LEAF = 16
+# a cached k! is reused for n! only when n - k <= n / CHECKPOINT_RATIO
+CHECKPOINT_RATIO = 4
+# per process, the offload workers keep their own cache
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def product_range(lo: int, hi: int) -> int:
+    # lo * (lo + 1) * ... * hi with balanced operand sizes (binary splitting)
+    if lo > hi:
+        return 1
+    if hi - lo < SPLIT_LEAF:
+        result = lo
+        for i in range(lo + 1, hi + 1):
+            result *= i
+        return result
+    mid = (lo + hi) // 2
+    return product_range(lo, mid) * product_range(mid + 1, hi)
+
+
+def _size(value: int) -> int:
+    return (value.bit_length() + 7) // 8
+
+
+class FactorialCache:
+    # LRU of computed factorials, bounded by their total size like the
+    # response cache: 200000! alone takes 404 KB, 300! takes 256 bytes
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._values = OrderedDict[int, int]()
+        self._keys: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def get(self, n: int) -> int | None:
+        value = self._values.get(n)
+        if value is not None:
+            self._values.move_to_end(n)
+        return value
+
+    def floor(self, n: int) -> tuple[int, int] | None:
+        i = bisect_right(self._keys, n)
+        if i == 0:
+            return None
+        k = self._keys[i - 1]
+        self._values.move_to_end(k)
+        return k, self._values[k]
+
+    def put(self, n: int, value: int) -> None:
+        if n in self._values:
+            self._values.move_to_end(n)
+            return
+        if _size(value) > self.max_bytes:
+            return
+        self._values[n] = value
+        self.size += _size(value)
+        insort(self._keys, n)
+        while self.size > self.max_bytes:
+            evicted, evicted_value = self._values.popitem(last=False)
+            self.size -= _size(evicted_value)
+            del self._keys[bisect_right(self._keys, evicted) - 1]
+
+    def clear(self) -> None:
+        self._values.clear()
+        self._keys.clear()
+        self.size = 0
+
+
+cache = FactorialCache()
+
+
+def factorial(n: int) -> int:
+    if n < 0:
+        raise ValueError("n must be a non-negative")
+    if n < CACHE_MIN_N:
+        return math.factorial(n)
+
+    result = cache.get(n)
+    if result is not None:
+        return result
+
+    checkpoint = cache.floor(n)
+    if checkpoint is not None and (n - checkpoint[0]) * CHECKPOINT_RATIO <= n:
+        k, k_factorial = checkpoint
+        result = k_factorial * product_range(k + 1, n)
+    else:
+        result = math.factorial(n)
+
+    cache.put(n, result)
+    return result
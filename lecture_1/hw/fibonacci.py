@@ -0,0 +1,54 @@
+from functools import lru_cache
+
+# every request leaves its chain of binary prefixes here as checkpoints,
+# so n, n + 1, 2n and friends reuse most of the doubling steps
+CHECKPOINTS = 256
+# every doubling step multiplies numbers as wide as mod: with n of the
+# longest parsable size a 4096-bit modulus takes about 1.6 s
+MAX_MOD_BITS = 4096
+
+
+@lru_cache(maxsize=CHECKPOINTS)
+def _pair(n: int) -> tuple[int, int]:
+    # (F(n), F(n + 1)) by fast doubling:
+    # F(2k) = F(k) * (2 * F(k + 1) - F(k)), F(2k + 1) = F(k) ** 2 + F(k + 1) ** 2
+    if n == 0:
+        return 0, 1
+    a, b = _pair(n >> 1)
+    c = a * (2 * b - a)
+    d = a * a + b * b
+    if n & 1:
+        return d, c + d
+    return c, d
+
+
+def _pair_mod(n: int, mod: int) -> tuple[int, int]:
+    a, b = 0, 1
+    for bit in bin(n)[2:]:
+        c = a * (2 * b - a) % mod
+        d = (a * a + b * b) % mod
+        if bit == "1":
+            a, b = d, (c + d) % mod
+        else:
+            a, b = c, d
+    return a % mod, b % mod
+
+
+def fibonacci(n: int, mod: int | None = None) -> int:
+    if n < 0:
+        raise ValueError("n must be a non-negative integer")
+    if mod is None:
+        return _pair(n)[0]
+    if mod < 1:
+        raise ValueError("mod must be a positive integer")
+    return _pair_mod(n, mod)[0]
+
+
+def fibonacci_pair(n: int) -> tuple[int, int]:
+    if n < 0:
+        raise ValueError("n must be a non-negative integer")
+    return _pair(n)
+
+
+def clear_checkpoints() -> None:
+    _pair.cache_clear()
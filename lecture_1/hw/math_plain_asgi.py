@@ -1,12 +1,76 @@
+import asyncio
 import json
-from urllib.parse import parse_qs
+import time
+from logging import getLogger
 from typing import Any, Awaitable, Callable
 
+from lecture_1.hw import batch as batch_engine
+from lecture_1.hw import factorial as factorial_engine
+from lecture_1.hw import fibonacci as fibonacci_engine
+from lecture_1.hw import modular
+from lecture_1.hw import primes as primes_engine
+from lecture_1.hw.offload import (
+    ClientDisconnected,
+    OffloadTimeout,
+    Offloader,
+    Overloaded,
+)
+from lecture_1.hw.query_string import QueryParams, TooManyParams
+from lecture_1.hw.response_cache import ResponseCache
+from lecture_1.hw.result_encoding import DEFAULT_ENCODING, ENCODINGS, encode_int
+from lecture_1.hw.routing import (
+    InvalidPathParam,
+    MethodNotAllowed,
+    RouteNotFound,
+    Router,
+)
+from lecture_1.hw.single_flight import SingleFlight
+from lecture_1.hw.stats import StatsAccumulator
+from lecture_1.hw.streaming import (
+    Float64Parser,
+    MeanAccumulator,
+    NonFiniteError,
+    NumberArrayParser,
+    iter_body,
+)
+from lecture_1.hw.warmup import WarmupSettings
+
+RESPONSE_CHUNK_SIZE = 64 * 1024
+# inputs from which a calculation leaves the event loop for a worker process
+FACTORIAL_OFFLOAD_N = 5_000
+FIBONACCI_OFFLOAD_N = 200_000
+# F(n) mod m costs about n.bit_length() * m.bit_length() bit operations
+FIBONACCI_MOD_OFFLOAD_BITS = 1 << 18
+# a batch leaves the event loop once its results together outweigh the
+# smallest single result that would
+BATCH_OFFLOAD_BITS = min(
+    batch_engine.result_bits('factorial', FACTORIAL_OFFLOAD_N),
+    batch_engine.result_bits('fibonacci', FIBONACCI_OFFLOAD_N),
+)
+# n! mod m leaves the event loop past this share of modular.terms_limit(m):
+# a couple of milliseconds of multiplications with either backend
+FACTORIAL_MOD_OFFLOAD_SHARE = 1 << 13
+PRIMES_OFFLOAD_SPAN = 4 * primes_engine.SEGMENT
+# sieving cost grows with hi too, see primes.sieve_steps
+PRIMES_OFFLOAD_STEPS = 1 << 13
+# below this Pollard's rho needs at most a few thousand steps
+FACTORIZE_OFFLOAD_N = 10**15
+
+router = Router()
+response_cache = ResponseCache()
+offloader = Offloader()
+single_flight = SingleFlight()
+logger = getLogger(__name__)
+
 async def app(
     scope: dict[str, Any],
     receive: Callable[[], Awaitable[dict[str, Any]]],
     send: Callable[[dict[str, Any]], Awaitable[None]],
 ) -> None: 
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+
     if scope['type'] != 'http':
         await send({
             'type': 'http.response.start',
@@ -34,107 +98,387 @@ async def app(
         })
         return
 
-    status_code = 404
-    response_body = json.dumps({"error": "Not Found"})
-
-    if path == '/factorial' and method == 'GET':
-        query_string = scope.get('query_string', b'').decode()
-        query_params = parse_qs(query_string)
-        n_values = query_params.get('n')
-        status_code, response_body = await factorial(n_values)
-
-    elif path.startswith('/fibonacci/') and method == 'GET':
-        status_code, response_body = await fibonacci(path)
-
-    elif path == '/mean' and method == 'GET':
-        body = await receive_body(receive)
-        status_code, response_body = await mean(body)
+    headers = [(b'content-type', b'application/json')]
+    try:
+        handler, params = router.resolve(method, path)
+    except RouteNotFound:
+        status_code = 404
+        response_body = json.dumps({"error": "Not Found"})
+    except MethodNotAllowed as e:
+        status_code = 405
+        response_body = json.dumps({"error": "Method Not Allowed"})
+        headers.append((b'allow', ', '.join(e.allowed).encode()))
+    except InvalidPathParam as e:
+        status_code = 422
+        response_body = json.dumps({"error": str(e)})
+    else:
+        try:
+            status_code, response_body = await handler(scope, receive, params)
+        except Overloaded:
+            status_code = 503
+            response_body = json.dumps({"error": "server is busy, retry later"})
+            headers.append((b'retry-after', b'1'))
+        except OffloadTimeout:
+            status_code = 504
+            response_body = json.dumps({"error": "computation timed out"})
+        except TooManyParams as e:
+            status_code = 400
+            response_body = json.dumps({"error": str(e)})
+        except ClientDisconnected:
+            return
 
     await send({
         'type': 'http.response.start',
         'status': status_code,
-        'headers': [(b'content-type', b'application/json')],
+        'headers': headers,
     })
 
-    await send({
-        'type': 'http.response.body',
-        'body': response_body.encode(),
+    if isinstance(response_body, str):
+        response_body = response_body.encode()
+    await send_body(send, response_body)
+
+async def lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await warm_up(WarmupSettings.from_env())
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            offloader.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def warm_up(settings: WarmupSettings) -> None:
+    # the first requests after a deploy find their results already encoded
+    # in the response cache and the engine checkpoints filled
+    started = time.perf_counter()
+    if settings.start_workers:
+        await offloader.start()
+    # no more values at once than there are workers: the offloader refuses
+    # calls beyond its queue, and that would fail the startup
+    slots = asyncio.Semaphore(offloader.max_workers)
+
+    async def limited(calculation):
+        async with slots:
+            return await calculation
+
+    results = await asyncio.gather(
+        *(limited(factorial([str(n)])) for n in settings.factorial),
+        *(limited(fibonacci(n)) for n in settings.fibonacci),
+    )
+    for status_code, response_body in results:
+        if status_code != 200:
+            raise ValueError(f"warm-up failed: {response_body}")
+    logger.info(
+        "warm-up finished in %.3f s: %d factorial, %d fibonacci results cached",
+        time.perf_counter() - started, len(settings.factorial), len(settings.fibonacci),
+    )
+
+async def send_body(send, body: bytes) -> None:
+    # huge results go out in slices so the server can start writing before
+    # the whole body is handed over. ASGI wants bytes, so every slice is a
+    # copy and chunking saves no copying; a body within one slice is sent
+    # as it is, since slicing all of a bytes object returns the object
+    for start in range(0, max(len(body), 1), RESPONSE_CHUNK_SIZE):
+        end = start + RESPONSE_CHUNK_SIZE
+        await send({
+            'type': 'http.response.body',
+            'body': body[start:end],
+            'more_body': end < len(body),
+        })
+
+@router.route('GET', '/factorial')
+async def get_factorial(scope, receive, params):
+    query = query_params(scope)
+    encoding = result_encoding(query.get('encoding'))
+    if encoding is None:
+        return invalid_encoding()
+    return await factorial(query.get('n'), query.get('mod'), receive, encoding)
+
+@router.route('GET', '/fibonacci/{n:int}')
+async def get_fibonacci(scope, receive, params):
+    query = query_params(scope)
+    encoding = result_encoding(query.get('encoding'))
+    if encoding is None:
+        return invalid_encoding()
+    return await fibonacci(params['n'], query.get('mod'), receive, encoding)
+
+@router.route('GET', '/mean')
+async def get_mean(scope, receive, params):
+    return await mean(receive, content_type(scope))
+
+@router.route('GET', '/stats')
+async def get_stats(scope, receive, params):
+    return await stats(receive, content_type(scope))
+
+@router.route('POST', '/batch')
+async def post_batch(scope, receive, params):
+    encoding = result_encoding(query_params(scope).get('encoding'))
+    if encoding is None:
+        return invalid_encoding()
+    return await batch(await receive_body(receive), receive, encoding)
+
+@router.route('GET', '/primes')
+async def get_primes(scope, receive, params):
+    query = query_params(scope)
+    return await primes(query.get('lo'), query.get('hi'), receive)
+
+@router.route('GET', '/factorize/{n:int}')
+async def get_factorize(scope, receive, params):
+    return await factorize(params['n'], receive)
+
+@router.route('GET', '/metrics')
+async def get_metrics(scope, receive, params):
+    return 200, json.dumps({
+        "response_cache": response_cache.metrics(),
+        "offload": offloader.metrics(),
+        "single_flight": single_flight.metrics(),
     })
 
-async def factorial(n_values: list):
+async def factorial(
+    n_values: list,
+    mod_values: list | None = None,
+    receive=None,
+    encoding: str = DEFAULT_ENCODING,
+):
     if not n_values or len(n_values) != 1:
-        status_code = 422
-        response_body = json.dumps({"error": "invalid n"})
+        return 422, json.dumps({"error": "invalid n"})
+    try:
+        n = int(n_values[0])
+    except ValueError:
+        return 422, json.dumps({"error": "n must be integer"})
+    try:
+        mod = int(mod_values[0]) if mod_values else None
+    except ValueError:
+        return 422, json.dumps({"error": "mod must be integer"})
+
+    if n < 0:
+        status_code = 400
+        response_body = json.dumps({"error": "n must be a non-negative"})
+    elif mod is not None and mod < 1:
+        status_code = 400
+        response_body = json.dumps({"error": "mod must be a positive integer"})
+    elif mod is not None and modular.terms(n, mod) > modular.terms_limit(mod):
+        status_code = 400
+        response_body = json.dumps({"error": "n is too large for this modulus"})
+    elif mod is None and batch_engine.result_bits('factorial', n) > batch_engine.MAX_RESULT_BITS:
+        status_code = 400
+        response_body = json.dumps({"error": "n is too large"})
     else:
-        try:
-            n = int(n_values[0])
-            if n < 0:
-                status_code = 400
-                response_body = json.dumps({"error": "n must be a non-negative"})
-            else:
-                result = calculate_factorial(n)
-                status_code = 200
-                response_body = json.dumps({"result": result})
-        except ValueError:
-            status_code = 422
-            response_body = json.dumps({"error": "n must be integer"})
+        if mod is None:
+            offload = n >= FACTORIAL_OFFLOAD_N
+        else:
+            offload = modular.terms(n, mod) * FACTORIAL_MOD_OFFLOAD_SHARE >= modular.terms_limit(mod)
+        status_code = 200
+        response_body = await cached_result(
+            ('factorial', n, mod, encoding),
+            encode_result, encoding, calculate_factorial, n, mod,
+            offload=offload, receive=receive,
+        )
     return status_code, response_body
 
-async def fibonacci(path: str):
+async def fibonacci(
+    n: int, mod_values: list | None = None, receive=None, encoding: str = DEFAULT_ENCODING
+):
     try:
-        n = int(path.split('/')[-1])
+        mod = int(mod_values[0]) if mod_values else None
         if n < 0:
             status_code = 400
             response_body = json.dumps({"error": "n must be a non-negative integer"})
+        elif mod is not None and mod < 1:
+            status_code = 400
+            response_body = json.dumps({"error": "mod must be a positive integer"})
+        elif mod is None and batch_engine.result_bits('fibonacci', n) > batch_engine.MAX_RESULT_BITS:
+            status_code = 400
+            response_body = json.dumps({"error": "n is too large"})
+        elif mod is not None and mod.bit_length() > fibonacci_engine.MAX_MOD_BITS:
+            status_code = 400
+            response_body = json.dumps({"error": "mod is too large"})
         else:
-            result = calculate_fibonacci(n)
+            if mod is None:
+                offload = n >= FIBONACCI_OFFLOAD_N
+            else:
+                offload = n.bit_length() * mod.bit_length() >= FIBONACCI_MOD_OFFLOAD_BITS
             status_code = 200
-            response_body = json.dumps({"result": result})
+            response_body = await cached_result(
+                ('fibonacci', n, mod, encoding),
+                encode_result, encoding, calculate_fibonacci, n, mod,
+                offload=offload, receive=receive,
+            )
     except ValueError:
         status_code = 422
-        response_body = json.dumps({"error": "n must be integer"})
+        response_body = json.dumps({"error": "mod must be integer"})
     return status_code, response_body
 
-async def mean(body: bytes):
+async def primes(lo_values: list | None, hi_values: list | None, receive=None):
+    if not hi_values or len(hi_values) != 1 or (lo_values and len(lo_values) != 1):
+        return 422, json.dumps({"error": "invalid range"})
     try:
-        numbers = json.loads(body)
-        if not isinstance(numbers, list) or not all(isinstance(num, (int, float)) for num in numbers):
-            status_code = 422
-            response_body = json.dumps({"error": "elements must be valid floats"})
-        elif not numbers:
-            status_code = 400
-            response_body = json.dumps({"error": "array cant be empty"})
-        else:
-            result = calculate_mean(numbers)
-            status_code = 200
-            response_body = json.dumps({"result": result})
-    except json.JSONDecodeError:
-        status_code = 422
-        response_body = json.dumps({"error": "invalid format"})
-    return status_code, response_body
+        lo = int(lo_values[0]) if lo_values else 0
+        hi = int(hi_values[0])
+    except ValueError:
+        return 422, json.dumps({"error": "lo and hi must be integers"})
 
-async def receive_body(receive):
-    body = b''
-    more_body = True
-    while more_body:
-        message = await receive()
-        body += message.get('body', b'')
-        more_body = message.get('more_body', False)
+    if lo < 0 or hi < lo:
+        return 400, json.dumps({"error": "expected 0 <= lo <= hi"})
+    if hi > primes_engine.MAX_HI or hi - lo > primes_engine.MAX_SPAN:
+        return 400, json.dumps({"error": "range is too large"})
+    return 200, await cached_result(
+        ('primes', lo, hi), encode_list_result, calculate_primes, lo, hi,
+        offload=hi - lo >= PRIMES_OFFLOAD_SPAN or primes_engine.sieve_steps(lo, hi) >= PRIMES_OFFLOAD_STEPS,
+        receive=receive,
+    )
+
+async def factorize(n: int, receive=None):
+    if n < 1:
+        return 400, json.dumps({"error": "n must be a positive integer"})
+    if n > primes_engine.MAX_FACTORIZE:
+        return 400, json.dumps({"error": "n is too large"})
+    return 200, await cached_result(
+        ('factorize', n), encode_list_result, calculate_factors, n,
+        offload=n >= FACTORIZE_OFFLOAD_N, receive=receive,
+    )
+
+async def cached_result(
+    key: tuple,
+    encode: Callable[..., bytes],
+    *args,
+    offload: bool = False,
+    receive=None,
+) -> bytes:
+    body = response_cache.get(key)
+    if body is not None:
+        return body
+    if offload:
+        # identical requests arriving while a worker is busy wait for it
+        return await single_flight.do(
+            key, lambda: offloaded_result(key, encode, *args), receive
+        )
+    body = encode(*args)
+    response_cache.put(key, body)
+    return body
+
+async def offloaded_result(key: tuple, encode: Callable[..., bytes], *args) -> bytes:
+    body = await offloader.run(encode, *args)
+    response_cache.put(key, body)
     return body
 
-def calculate_factorial(n: int) -> int:
-    if n == 0 or n == 1:
-        return 1
-    result = 1
-    for i in range(2, n + 1):
-        result *= i
-    return result
-
-def calculate_fibonacci(n: int) -> int:
-    a, b = 0, 1
-    for _ in range(n):
-        a, b = b, a + b
-    return a
+def encode_result(encoding: str, calculate: Callable[..., int], *args) -> bytes:
+    return b'{"result": ' + encode_int(calculate(*args), encoding) + b'}'
+
+def encode_list_result(calculate: Callable[..., list[int]], *args) -> bytes:
+    return b'{"result": [' + ', '.join(map(str, calculate(*args))).encode() + b']}'
+
+def result_encoding(encoding_values: list | None) -> str | None:
+    if not encoding_values:
+        return DEFAULT_ENCODING
+    if len(encoding_values) != 1 or encoding_values[0] not in ENCODINGS:
+        return None
+    return encoding_values[0]
+
+def invalid_encoding():
+    return 422, json.dumps({"error": f"encoding must be one of {', '.join(ENCODINGS)}"})
+
+async def batch(body: bytes, receive=None, encoding: str = DEFAULT_ENCODING):
+    try:
+        jobs_data = json.loads(body)
+    except ValueError:
+        return 422, json.dumps({"error": "invalid format"})
+    if not isinstance(jobs_data, list):
+        return 422, json.dumps({"error": "jobs must be a list"})
+    if not jobs_data:
+        return 400, json.dumps({"error": "jobs cant be empty"})
+    if len(jobs_data) > batch_engine.MAX_JOBS:
+        return 422, json.dumps({"error": f"at most {batch_engine.MAX_JOBS} jobs are allowed"})
+
+    jobs = []
+    for job in jobs_data:
+        if not isinstance(job, dict) or job.get('op') not in batch_engine.OPS:
+            return 422, json.dumps({"error": f"op must be one of {', '.join(batch_engine.OPS)}"})
+        n = job.get('n')
+        if not isinstance(n, int) or isinstance(n, bool):
+            return 422, json.dumps({"error": "n must be integer"})
+        if n < 0:
+            return 400, json.dumps({"error": "n must be a non-negative"})
+        jobs.append((job['op'], n))
+    bits = sum(batch_engine.result_bits(op, n) for op, n in jobs)
+    if bits > batch_engine.MAX_RESULT_BITS:
+        return 400, json.dumps({"error": "results are too large"})
+
+    if bits >= BATCH_OFFLOAD_BITS:
+        response_body = await offloader.run(encode_batch, jobs, encoding, receive=receive)
+    else:
+        response_body = encode_batch(jobs, encoding)
+    return 200, response_body
+
+def encode_batch(jobs: list[tuple[str, int]], encoding: str = DEFAULT_ENCODING) -> bytes:
+    results = batch_engine.calculate_batch(jobs)
+    return b'{"results": [' + b', '.join(encode_int(r, encoding) for r in results) + b']}'
+
+async def mean(receive, media_type: str = 'application/json'):
+    accumulator = MeanAccumulator()
+    error = await read_numbers(receive, media_type, accumulator)
+    if error is not None:
+        return error
+    return 200, json.dumps({"result": accumulator.mean()})
+
+async def stats(receive, media_type: str = 'application/json'):
+    accumulator = StatsAccumulator()
+    error = await read_numbers(receive, media_type, accumulator)
+    if error is not None:
+        return error
+    return 200, json.dumps(accumulator.summary())
+
+async def read_numbers(receive, media_type: str, accumulator):
+    if media_type == 'application/octet-stream':
+        parser = Float64Parser()
+    else:
+        parser = NumberArrayParser()
+    try:
+        async for chunk in iter_body(receive):
+            accumulator.add(parser.feed(chunk))
+        parser.close()
+    except (TypeError, OverflowError):
+        return 422, json.dumps({"error": "elements must be valid floats"})
+    except NonFiniteError:
+        # the packed float64 body carries infinities and NaNs as easily as
+        # numbers, and json.dumps would answer with the invalid token NaN
+        return 422, json.dumps({"error": "elements must be finite"})
+    except ValueError:
+        return 422, json.dumps({"error": "invalid format"})
+    if not accumulator.count:
+        return 400, json.dumps({"error": "array cant be empty"})
+    return None
+
+def query_params(scope: dict[str, Any]) -> QueryParams:
+    return QueryParams(scope.get('query_string', b''))
+
+def content_type(scope: dict[str, Any]) -> str:
+    for name, value in scope.get('headers', []):
+        if name == b'content-type':
+            return value.decode('latin-1').split(';')[0].strip().lower()
+    return 'application/json'
+
+async def receive_body(receive):
+    return b''.join([chunk async for chunk in iter_body(receive)])
+
+def calculate_factorial(n: int, mod: int | None = None) -> int:
+    if mod is None:
+        return factorial_engine.factorial(n)
+    return modular.factorial_mod(n, mod)
+
+def calculate_fibonacci(n: int, mod: int | None = None) -> int:
+    return fibonacci_engine.fibonacci(n, mod)
+
+def calculate_primes(lo: int, hi: int) -> list[int]:
+    return primes_engine.primes(lo, hi)
+
+def calculate_factors(n: int) -> list[int]:
+    return primes_engine.factorize(n)
 
 def calculate_mean(numbers: list) -> float:
     return sum(numbers) / len(numbers)
\ No newline at end of file
@@ -0,0 +1,142 @@
+import threading
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, products fall back to plain python
+    numpy = None
+
+# prefix products n! mod m are remembered at every multiple of SEGMENT
+SEGMENT = 1 << 20
+CHECKPOINT_MODULI = 8
+# more multiplications than terms_limit(m) are refused instead of pinning a
+# worker; numpy multiplies about 19 ns a term, plain python about 95 ns while
+# m fits WORD_BITS and proportionally more beyond, so every limit stays well
+# inside offload.TIMEOUT
+NUMPY_MAX_TERMS = 10**9
+MAX_TERMS = 10**8
+WORD_BITS = 128
+# residues below this multiply without overflowing int64
+NUMPY_MAX_MODULUS = 3_037_000_499
+# deterministic Miller-Rabin witnesses for every m below PRIME_CERTAIN_BELOW;
+# above it is_prime may accept a composite
+_WITNESSES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+PRIME_CERTAIN_BELOW = 3_317_044_064_679_887_385_961_981
+
+# FastAPI calls factorial_mod from several threads: each table grows only
+# under its own lock, the lock of the OrderedDict guards the tables' order
+_checkpoints = OrderedDict[int, tuple[threading.Lock, list[int]]]()
+_checkpoints_lock = threading.Lock()
+
+
+def is_prime(m: int) -> bool:
+    if m < 2:
+        return False
+    for p in _WITNESSES:
+        if m % p == 0:
+            return m == p
+    d, s = m - 1, 0
+    while d % 2 == 0:
+        d, s = d // 2, s + 1
+    for a in _WITNESSES:
+        x = pow(a, d, m)
+        if x in (1, m - 1):
+            continue
+        for _ in range(s - 1):
+            x = x * x % m
+            if x == m - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def uses_numpy(m: int) -> bool:
+    return numpy is not None and m <= NUMPY_MAX_MODULUS
+
+
+def terms_limit(m: int) -> int:
+    # the multiplications allowed for modulus m with the backend it gets
+    if uses_numpy(m):
+        return NUMPY_MAX_TERMS
+    return MAX_TERMS * WORD_BITS // max(WORD_BITS, m.bit_length())
+
+
+def product_mod(lo: int, hi: int, m: int) -> int:
+    # lo * (lo + 1) * ... * hi mod m
+    if uses_numpy(m) and hi - lo > 64:
+        result = 1
+        for start in range(lo, hi + 1, SEGMENT):
+            terms = numpy.arange(start, min(start + SEGMENT, hi + 1), dtype=numpy.int64) % m
+            # pairwise tree reduction keeps every product below m ** 2
+            while terms.size > 1:
+                if terms.size % 2:
+                    terms = numpy.append(terms, 1)
+                terms = terms[0::2] * terms[1::2] % m
+            result = result * int(terms[0]) % m
+        return result
+
+    result = 1 % m
+    for k in range(lo, hi + 1):
+        result = result * k % m
+    return result
+
+
+def _prefix(n: int, m: int) -> int:
+    with _checkpoints_lock:
+        entry = _checkpoints.get(m)
+        if entry is None:
+            entry = _checkpoints[m] = (threading.Lock(), [1 % m])
+            while len(_checkpoints) > CHECKPOINT_MODULI:
+                _checkpoints.popitem(last=False)
+        else:
+            _checkpoints.move_to_end(m)
+    lock, table = entry
+
+    segment = n // SEGMENT
+    if len(table) <= segment:
+        with lock:
+            # another thread may have grown the table while this one waited
+            while len(table) <= segment:
+                last = len(table) - 1
+                table.append(table[-1] * product_mod(last * SEGMENT + 1, (last + 1) * SEGMENT, m) % m)
+    return table[segment] * product_mod(segment * SEGMENT + 1, n, m) % m
+
+
+def _wilson(n: int, m: int) -> bool:
+    # Wilson's theorem only holds for a prime m, so it is used only where
+    # is_prime cannot be wrong
+    return n > (m - 1) // 2 and m < PRIME_CERTAIN_BELOW and is_prime(m)
+
+
+def terms(n: int, m: int) -> int:
+    # multiplications factorial_mod(n, m) needs without checkpoints
+    if n >= m:
+        return 0
+    if _wilson(n, m):
+        return m - 1 - n
+    return n
+
+
+def factorial_mod(n: int, m: int) -> int:
+    if n < 0:
+        raise ValueError("n must be a non-negative")
+    if m < 1:
+        raise ValueError("mod must be a positive integer")
+    if n >= m:
+        # m itself is one of the factors
+        return 0
+    if terms(n, m) > terms_limit(m):
+        raise ValueError("n is too large for this modulus")
+
+    if _wilson(n, m):
+        # Wilson: n! * (p - 1 - n)! = (-1) ** (n + 1) (mod p), so only the
+        # shorter side of p - 1 is ever multiplied out
+        k = m - 1 - n
+        result = pow(_prefix(k, m), -1, m)
+        return result if n % 2 else (m - result) % m
+    return _prefix(n, m)
+
+
+def clear_checkpoints() -> None:
+    _checkpoints.clear()
@@ -0,0 +1,130 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Awaitable, Callable
+
+TIMEOUT = 30.0
+
+
+class Overloaded(RuntimeError):
+    pass
+
+
+class OffloadTimeout(TimeoutError):
+    pass
+
+
+class ClientDisconnected(ConnectionError):
+    pass
+
+
+async def wait_disconnect(receive: Callable[[], Awaitable[dict[str, Any]]]) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+class Offloader:
+    # Runs CPU-heavy calls in worker processes so the event loop keeps
+    # serving small requests. At most max_workers + max_queue calls are in
+    # flight; anything beyond that is rejected instead of piling up.
+
+    def __init__(
+        self,
+        max_workers: int | None = None,
+        max_queue: int | None = None,
+        timeout: float = TIMEOUT,
+    ) -> None:
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = self.max_workers * 2 if max_queue is None else max_queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self._executor: ProcessPoolExecutor | None = None
+
+    async def run(
+        self,
+        func: Callable[..., Any],
+        *args: Any,
+        receive: Callable[[], Awaitable[dict[str, Any]]] | None = None,
+    ) -> Any:
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise Overloaded("too many pending computations")
+        executor = self._ensure_executor()
+
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        future = executor.submit(func, *args)
+        result = asyncio.wrap_future(future)
+        waiters = {result}
+        if receive is not None:
+            waiters.add(asyncio.ensure_future(wait_disconnect(receive)))
+        try:
+            done, _ = await asyncio.wait(
+                waiters, timeout=self.timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            # cancelling the wrapper also cancels a call that is still queued;
+            # one that already started keeps its worker busy until it
+            # returns, its result is dropped and the slot is freed only then,
+            # so callers cap their inputs to finish well inside the timeout
+            future.add_done_callback(lambda _: self._release(loop))
+            for waiter in waiters:
+                waiter.cancel()
+
+        if not done:
+            self.timeouts += 1
+            raise OffloadTimeout("computation timed out")
+        if result not in done:
+            self.cancelled += 1
+            raise ClientDisconnected()
+        self.completed += 1
+        return result.result()
+
+    async def start(self) -> None:
+        # spawning workers takes a while, pay for it before the first request
+        executor = self._ensure_executor()
+        await asyncio.gather(*(
+            asyncio.wrap_future(executor.submit(int)) for _ in range(self.max_workers)
+        ))
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # forking a running server with its event loop and executor
+            # threads is unsafe, workers start from a fresh interpreter
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return self._executor
+
+    def _release(self, loop: asyncio.AbstractEventLoop) -> None:
+        try:
+            loop.call_soon_threadsafe(self._decrement)
+        except RuntimeError:  # the loop is already closed
+            pass
+
+    def _decrement(self) -> None:
+        self.in_flight -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def metrics(self) -> dict[str, int]:
+        return {
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+        }
@@ -0,0 +1,161 @@
+import math
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import compress
+from random import Random
+
+from lecture_1.hw.modular import is_prime
+
+# the number line is sieved in aligned blocks of SEGMENT numbers; a block
+# keeps one byte per odd number and stays cached for the following requests
+SEGMENT = 1 << 20
+CACHED_SEGMENTS = 16
+# largest range one request may ask for and the largest number in it
+MAX_SPAN = 10**7
+MAX_HI = 10**12
+# is_prime is deterministic below 3.3 * 10**24
+MAX_FACTORIZE = 3 * 10**24
+_TRIAL_PRIMES = 1000
+
+_base_limit = 1
+_base_primes: list[int] = []
+_segments = OrderedDict[int, bytearray]()
+
+
+def _sieve(limit: int) -> list[int]:
+    # odd primes up to limit, the plain sieve the segments start from
+    flags = bytearray([1]) * (limit // 2 + 1)
+    flags[0] = 0
+    for i in range(1, (math.isqrt(limit) - 1) // 2 + 1):
+        if flags[i]:
+            p = 2 * i + 1
+            start = p * p // 2
+            flags[start::p] = bytes(len(range(start, len(flags), p)))
+    return [2 * i + 1 for i in compress(range(len(flags)), flags) if 2 * i + 1 <= limit]
+
+
+def base_primes(limit: int) -> list[int]:
+    # odd primes up to at least limit; the list only ever grows, doubling so
+    # a slowly increasing hi does not re-sieve on every request
+    global _base_limit, _base_primes
+    if limit > _base_limit:
+        _base_limit = max(limit, 2 * _base_limit)
+        _base_primes = _sieve(_base_limit)
+    return _base_primes
+
+
+def _segment(k: int) -> bytearray:
+    flags = _segments.get(k)
+    if flags is not None:
+        _segments.move_to_end(k)
+        return flags
+
+    # flags[i] describes the odd number lo + 2i + 1
+    lo = k * SEGMENT
+    size = SEGMENT // 2
+    flags = bytearray([1]) * size
+    if k == 0:
+        flags[0] = 0  # 1 is not a prime
+    top = math.isqrt(lo + SEGMENT - 1)
+    for p in base_primes(top):
+        if p > top:
+            break
+        first = max(p * p, -(-lo // p) * p)
+        if first % 2 == 0:
+            first += p
+        start = (first - lo - 1) // 2
+        if start < size:
+            flags[start::p] = bytes(len(range(start, size, p)))
+
+    _segments[k] = flags
+    while len(_segments) > CACHED_SEGMENTS:
+        _segments.popitem(last=False)
+    return flags
+
+
+def sieve_steps(lo: int, hi: int) -> int:
+    # base primes primes(lo, hi) still has to walk: every segment that is not
+    # cached crosses off the primes up to its square root, about 3 us each
+    top = math.isqrt(hi)
+    per_segment = top / math.log(top) if top > 2 else 1
+    missing = sum(k not in _segments for k in range(lo // SEGMENT, hi // SEGMENT + 1))
+    return int(missing * per_segment)
+
+
+def primes(lo: int, hi: int) -> list[int]:
+    # every prime p with lo <= p <= hi
+    if lo < 0 or hi < lo:
+        raise ValueError("expected 0 <= lo <= hi")
+    result = [2] if lo <= 2 <= hi else []
+    for k in range(lo // SEGMENT, hi // SEGMENT + 1):
+        start = k * SEGMENT
+        first = max(0, (lo - start) // 2)
+        last = min(SEGMENT // 2, (hi - start + 1) // 2)
+        if first < last:
+            flags = memoryview(_segment(k))[first:last]
+            numbers = range(start + 2 * first + 1, start + 2 * last + 1, 2)
+            result.extend(compress(numbers, flags))
+    return result
+
+
+def _pollard_rho(n: int, rng: Random) -> int:
+    # Brent's variant, gcd taken once per batch of products
+    while True:
+        y, c, m = rng.randrange(1, n), rng.randrange(1, n), 128
+        g = r = q = 1
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % n
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for _ in range(min(m, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                g = math.gcd(q, n)
+                k += m
+            r *= 2
+        if g == n:
+            # the batch overshot, walk it again one step at a time
+            while True:
+                ys = (ys * ys + c) % n
+                g = math.gcd(abs(x - ys), n)
+                if g > 1:
+                    break
+        if g != n:
+            return g
+
+
+def factorize(n: int) -> list[int]:
+    # prime factors of n in ascending order, repeated by multiplicity
+    if n < 1:
+        raise ValueError("n must be a positive integer")
+    if n > MAX_FACTORIZE:
+        raise ValueError("n is too large")
+    factors = []
+    # /primes may have grown the base primes far past the trial bound
+    small = base_primes(_TRIAL_PRIMES)
+    for p in [2] + small[: bisect_right(small, _TRIAL_PRIMES)]:
+        if p * p > n:
+            break
+        while n % p == 0:
+            factors.append(p)
+            n //= p
+
+    rng = Random(n)
+    pending = [n] if n > 1 else []
+    while pending:
+        m = pending.pop()
+        if m < _TRIAL_PRIMES**2 or is_prime(m):
+            # no factor below _TRIAL_PRIMES is left, so small m is a prime
+            factors.append(m)
+        else:
+            d = _pollard_rho(m, rng)
+            pending += [d, m // d]
+    factors.sort()
+    return factors
+
+
+def clear_segments() -> None:
+    _segments.clear()
@@ -0,0 +1,95 @@
+from typing import Iterator
+from urllib.parse import unquote_to_bytes
+
+# parse_qs has no limit by default, a request is refused beyond this many pairs
+MAX_PARAMS = 100
+
+
+class TooManyParams(ValueError):
+    pass
+
+
+def unquote(raw: bytes) -> str:
+    # '+' and %XX escapes as parse_qs reads them, invalid UTF-8 is replaced
+    if b'+' in raw:
+        raw = raw.replace(b'+', b' ')
+    if b'%' in raw:
+        raw = unquote_to_bytes(raw)
+    return raw.decode('utf-8', 'replace')
+
+
+class QueryParams:
+    # Reads the raw query string of an ASGI scope. Pairs are split on the
+    # first lookup and a value is percent-decoded only when its key is asked
+    # for; results match urllib.parse.parse_qs, so get() returns a list.
+
+    __slots__ = ('_query_string', '_keep_blank_values', '_escaped', '_raw', '_decoded')
+
+    def __init__(
+        self,
+        query_string: bytes,
+        max_params: int = MAX_PARAMS,
+        keep_blank_values: bool = False,
+    ) -> None:
+        if query_string.count(b'&') >= max_params:
+            raise TooManyParams(f"at most {max_params} query parameters are allowed")
+        self._query_string = query_string
+        self._keep_blank_values = keep_blank_values
+        # most query strings have nothing to unescape, their keys and values
+        # are decoded without looking for escapes one by one
+        self._escaped = b'%' in query_string or b'+' in query_string
+        self._raw: dict[str, list[bytes]] | None = None
+        self._decoded: dict[str, list[str]] = {}
+
+    def _split(self) -> dict[str, list[bytes]]:
+        raw: dict[str, list[bytes]] = {}
+        escaped = self._escaped
+        keep_blank_values = self._keep_blank_values
+        for pair in self._query_string.split(b'&'):
+            key, _, value = pair.partition(b'=')
+            # like parse_qs: empty pairs are skipped, and so are 'n=' and a
+            # bare 'n' unless blank values are kept
+            if value or (keep_blank_values and pair):
+                name = unquote(key) if escaped else key.decode('utf-8', 'replace')
+                values = raw.get(name)
+                if values is None:
+                    raw[name] = [value]
+                else:
+                    values.append(value)
+        self._raw = raw
+        return raw
+
+    def get(self, name: str, default: list[str] | None = None) -> list[str] | None:
+        values = self._decoded.get(name)
+        if values is not None:
+            return values
+        raw = self._raw if self._raw is not None else self._split()
+        if name not in raw:
+            return default
+        if self._escaped:
+            values = [unquote(value) for value in raw[name]]
+        else:
+            values = [value.decode('utf-8', 'replace') for value in raw[name]]
+        self._decoded[name] = values
+        return values
+
+    def __getitem__(self, name: str) -> list[str]:
+        values = self.get(name)
+        if values is None:
+            raise KeyError(name)
+        return values
+
+    def __contains__(self, name: object) -> bool:
+        raw = self._raw if self._raw is not None else self._split()
+        return name in raw
+
+    def __iter__(self) -> Iterator[str]:
+        raw = self._raw if self._raw is not None else self._split()
+        return iter(raw)
+
+    def __len__(self) -> int:
+        raw = self._raw if self._raw is not None else self._split()
+        return len(raw)
+
+    def to_dict(self) -> dict[str, list[str]]:
+        return {name: self[name] for name in self}
@@ -0,0 +1,57 @@
+from collections import OrderedDict
+from typing import Hashable
+
+MAX_BYTES = 64 * 1024 * 1024
+
+
+class ResponseCache:
+    # LRU of final response bodies, bounded by the total size of the bodies
+    # rather than by their number: one 5 MB factorial weighs as much as
+    # thousands of small results.
+
+    def __init__(self, max_bytes: int = MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bodies = OrderedDict[Hashable, bytes]()
+
+    def __len__(self) -> int:
+        return len(self._bodies)
+
+    def get(self, key: Hashable) -> bytes | None:
+        body = self._bodies.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._bodies.move_to_end(key)
+        return body
+
+    def put(self, key: Hashable, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        previous = self._bodies.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self._bodies[key] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, evicted = self._bodies.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._bodies.clear()
+        self.size = 0
+
+    def metrics(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._bodies),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+        }
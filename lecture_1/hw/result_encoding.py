@@ -0,0 +1,50 @@
+import base64
+import json
+import math
+import sys
+
+ENCODINGS = ('decimal', 'hex', 'base64', 'digits')
+DEFAULT_ENCODING = 'decimal'
+
+
+def decimal_bytes(value: int) -> bytes:
+    # results are produced by the service, not parsed from user input, so
+    # the int -> str length limit is lifted for this one (subquadratic in
+    # 3.12+) conversion; the limit is interpreter-wide, hence the restore
+    limit = sys.get_int_max_str_digits()
+    sys.set_int_max_str_digits(0)
+    try:
+        return str(value).encode('ascii')
+    finally:
+        sys.set_int_max_str_digits(limit)
+
+
+def decimal_digits(value: int) -> int:
+    if value == 0:
+        return 1
+    log = math.log10(value)
+    digits = int(log) + 1
+    # log10 of a huge int is only off by a hair, so the exact (and costly)
+    # power of ten comparison is needed right next to an integer only
+    if min(log % 1, 1 - log % 1) < max(1e-9, log * 1e-13):
+        if 10 ** (digits - 1) > value:
+            digits -= 1
+        elif 10**digits <= value:
+            digits += 1
+    return digits
+
+
+def encode_int(value: int, encoding: str = DEFAULT_ENCODING) -> bytes:
+    if encoding == 'decimal':
+        return decimal_bytes(value)
+    if encoding == 'hex':
+        return b'"' + format(value, 'x').encode('ascii') + b'"'
+    if encoding == 'base64':
+        raw = value.to_bytes(max(1, (value.bit_length() + 7) // 8), 'big')
+        return b'"' + base64.b64encode(raw) + b'"'
+    if encoding == 'digits':
+        return json.dumps({
+            "digits": decimal_digits(value),
+            "log10": math.log10(value) if value > 0 else None,
+        }).encode()
+    raise ValueError(f"unknown encoding: {encoding}")
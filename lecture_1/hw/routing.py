@@ -0,0 +1,119 @@
+from typing import Any, Awaitable, Callable
+
+Handler = Callable[..., Awaitable[tuple[int, str]]]
+
+# path parameter types: {name:type} in a pattern, parsed after the match
+CONVERTERS: dict[str, tuple[Callable[[str], Any], str]] = {
+    'int': (int, 'integer'),
+    'str': (str, 'string'),
+}
+
+
+class RouteNotFound(LookupError):
+    pass
+
+
+class MethodNotAllowed(LookupError):
+    def __init__(self, allowed: list[str]) -> None:
+        super().__init__(', '.join(allowed))
+        self.allowed = allowed
+
+
+class InvalidPathParam(ValueError):
+    def __init__(self, name: str, type_name: str) -> None:
+        super().__init__(f"{name} must be {type_name}")
+        self.name = name
+
+
+class _Node:
+    __slots__ = ('children', 'param', 'param_child', 'methods')
+
+    def __init__(self) -> None:
+        self.children: dict[str, _Node] = {}
+        self.param: tuple[str, str] | None = None
+        self.param_child: _Node | None = None
+        self.methods: dict[str, Handler] | None = None
+
+
+class Router:
+    # Paths without parameters are answered by a single dict lookup; the
+    # rest walk a trie one segment at a time, so neither depends on the
+    # number of registered routes.
+
+    def __init__(self) -> None:
+        self._static: dict[str, dict[str, Handler]] = {}
+        self._root = _Node()
+
+    def add(self, method: str, pattern: str, handler: Handler) -> None:
+        if '{' not in pattern:
+            self._static.setdefault(pattern, {})[method] = handler
+            return
+
+        node = self._root
+        for segment in pattern.split('/')[1:]:
+            if segment.startswith('{') and segment.endswith('}'):
+                name, _, type_name = segment[1:-1].partition(':')
+                param = (name, type_name or 'str')
+                if param[1] not in CONVERTERS:
+                    raise ValueError(f"unknown path parameter type: {param[1]}")
+                if node.param_child is None:
+                    node.param, node.param_child = param, _Node()
+                elif node.param != param:
+                    raise ValueError(f"conflicting path parameter in {pattern}")
+                node = node.param_child
+            else:
+                node = node.children.setdefault(segment, _Node())
+        if node.methods is None:
+            node.methods = {}
+        node.methods[method] = handler
+
+    def route(self, method: str, pattern: str) -> Callable[[Handler], Handler]:
+        def decorator(handler: Handler) -> Handler:
+            self.add(method, pattern, handler)
+            return handler
+
+        return decorator
+
+    def resolve(self, method: str, path: str) -> tuple[Handler, dict[str, Any]]:
+        methods = self._static.get(path)
+        if methods is not None:
+            return self._select(methods, method), {}
+
+        raw_params: list[tuple[tuple[str, str], str]] = []
+        node = self._match(self._root, path.split('/')[1:], 0, raw_params)
+        if node is None:
+            raise RouteNotFound(path)
+        handler = self._select(node.methods, method)
+
+        params = {}
+        for (name, type_name), value in raw_params:
+            converter, description = CONVERTERS[type_name]
+            try:
+                params[name] = converter(value)
+            except ValueError:
+                raise InvalidPathParam(name, description) from None
+        return handler, params
+
+    @staticmethod
+    def _select(methods: dict[str, Handler], method: str) -> Handler:
+        handler = methods.get(method)
+        if handler is None:
+            raise MethodNotAllowed(sorted(methods))
+        return handler
+
+    def _match(self, node: _Node, segments: list[str], i: int, params: list) -> _Node | None:
+        if i == len(segments):
+            return node if node.methods is not None else None
+
+        child = node.children.get(segments[i])
+        if child is not None:
+            found = self._match(child, segments, i + 1, params)
+            if found is not None:
+                return found
+        if node.param_child is not None:
+            params.append((node.param, segments[i]))
+            found = self._match(node.param_child, segments, i + 1, params)
+            if found is not None:
+                return found
+            params.pop()
+        return None
@@ -0,0 +1,70 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+from lecture_1.hw.offload import ClientDisconnected, wait_disconnect
+
+
+class _Call:
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task: asyncio.Task) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share one running task. Every
+    # caller watches its own connection; the task is cancelled only when
+    # the last interested caller has gone away.
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self._calls: dict[Hashable, _Call] = {}
+
+    async def do(
+        self,
+        key: Hashable,
+        func: Callable[[], Awaitable[Any]],
+        receive: Callable[[], Awaitable[dict[str, Any]]] | None = None,
+    ) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(func()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            if receive is None:
+                return await asyncio.shield(call.task)
+            watcher = asyncio.ensure_future(wait_disconnect(receive))
+            done, _ = await asyncio.wait(
+                {call.task, watcher}, return_when=asyncio.FIRST_COMPLETED
+            )
+            watcher.cancel()
+            if call.task not in done:
+                raise ClientDisconnected()
+            return call.task.result()
+        finally:
+            call.waiters -= 1
+            if not call.waiters and not call.task.done():
+                call.task.cancel()
+                self._forget(key, call)
+                self.cancelled += 1
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def metrics(self) -> dict[str, int]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+            "in_flight": len(self._calls),
+        }
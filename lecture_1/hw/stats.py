@@ -0,0 +1,134 @@
+import math
+from array import array
+from collections import Counter
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, batches fall back to plain python
+    numpy = None
+
+from lecture_1.hw.streaming import SCALE, NonFiniteError, scaled_fsum
+
+PERCENTILES = (25, 50, 75, 90, 95, 99)
+RELATIVE_ACCURACY = 0.01
+
+
+class QuantileSketch:
+    # DDSketch: values are counted in logarithmic buckets, so every quantile
+    # is reported within RELATIVE_ACCURACY of a true value of that rank, and
+    # memory depends on the value range rather than on the number of values.
+
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY) -> None:
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = Counter[int]()
+        self.negative = Counter[int]()
+        self.zero = 0
+        self.count = 0
+
+    def add(self, values: list | memoryview | array) -> None:
+        log_gamma = self._log_gamma
+        for x in values:
+            if x > 0:
+                self.positive[math.ceil(math.log(x) / log_gamma)] += 1
+            elif x < 0:
+                self.negative[math.ceil(math.log(-x) / log_gamma)] += 1
+            else:
+                self.zero += 1
+        self.count += len(values)
+
+    def add_array(self, values: "numpy.ndarray") -> None:
+        for store, magnitudes in (
+            (self.positive, values[values > 0]),
+            (self.negative, -values[values < 0]),
+        ):
+            if magnitudes.size:
+                keys = numpy.ceil(numpy.log(magnitudes) / self._log_gamma)
+                keys, counts = numpy.unique(keys.astype(numpy.int64), return_counts=True)
+                store.update(dict(zip(keys.tolist(), counts.tolist())))
+        self.zero += int(numpy.count_nonzero(values == 0))
+        self.count += values.size
+
+    def quantile(self, q: float) -> float:
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive))
+
+    def _value(self, key: int) -> float:
+        return 2 * self.gamma**key / (self.gamma + 1)
+
+
+class StatsAccumulator:
+    # Batches are reduced on their own and merged with the parallel form of
+    # Welford's update (Chan et al.), so the stream is read exactly once.
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._m2 = 0.0
+        self.sketch = QuantileSketch()
+
+    def add(self, values: list | memoryview | array) -> None:
+        if not values:
+            return
+        count = len(values)
+        # fsum also rejects non-numeric json elements with a TypeError
+        try:
+            mean = math.fsum(values) / count
+        except OverflowError:
+            # finite values whose sum is beyond the float range
+            mean = scaled_fsum(values, SCALE) / count * SCALE
+        except ValueError:
+            # fsum refuses to add an infinity to its opposite
+            raise NonFiniteError("elements must be finite") from None
+        if not math.isfinite(mean):
+            raise NonFiniteError("elements must be finite")
+        if numpy is not None:
+            batch = numpy.asarray(values, dtype=numpy.float64)
+            m2 = float(numpy.square(batch - mean).sum())
+            low, high = float(batch.min()), float(batch.max())
+            self.sketch.add_array(batch)
+        else:
+            m2 = math.fsum((x - mean) ** 2 for x in values)
+            low, high = float(min(values)), float(max(values))
+            self.sketch.add(values)
+
+        total = self.count + count
+        delta = mean - self.mean
+        # the weights first: delta * count alone can leave the float range
+        self.mean += delta * (count / total)
+        self._m2 += m2 + delta * (self.count * count / total) * delta
+        self.count = total
+        self.min = min(self.min, low)
+        self.max = max(self.max, high)
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / self.count
+
+    def percentile(self, p: float) -> float:
+        return min(max(self.sketch.quantile(p / 100), self.min), self.max)
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "variance": self.variance,
+            "stddev": math.sqrt(self.variance),
+            "min": self.min,
+            "max": self.max,
+            "percentiles": {str(p): self.percentile(p) for p in PERCENTILES},
+        }
@@ -0,0 +1,174 @@
+import json
+import math
+import sys
+from array import array
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+# longest run of bytes without a comma that may be carried between chunks
+MAX_TOKEN_SIZE = 64 * 1024
+
+
+class InvalidFormatError(ValueError):
+    pass
+
+
+class NonFiniteError(ValueError):
+    # infinities and NaNs parse as floats, but no mean or spread of them
+    # can be sent back as JSON
+    pass
+
+
+async def iter_body(
+    receive: Callable[[], Awaitable[dict[str, Any]]],
+) -> AsyncIterator[bytes]:
+    more_body = True
+    while more_body:
+        message = await receive()
+        yield message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+
+class NumberArrayParser:
+    # Incremental parser for a flat JSON array. Every complete run of
+    # elements in a chunk goes through the C json decoder in one call; only
+    # the unfinished element after the last comma is carried over.
+
+    def __init__(self, max_token_size: int = MAX_TOKEN_SIZE) -> None:
+        self.max_token_size = max_token_size
+        self._tail = b''
+        self._opened = False
+        self._closed = False
+        self._seen_comma = False
+
+    def feed(self, chunk: bytes) -> list:
+        if self._closed:
+            if chunk.strip():
+                raise InvalidFormatError("unexpected data after array")
+            return []
+
+        data = self._tail + chunk if self._tail else chunk
+        if not self._opened:
+            data = data.lstrip()
+            if not data:
+                return []
+            if data[:1] != b'[':
+                raise InvalidFormatError("body must be a json array")
+            self._opened = True
+            data = data[1:]
+
+        end = data.find(b']')
+        if end != -1:
+            self._closed = True
+            self._tail = b''
+            if data[end + 1:].strip():
+                raise InvalidFormatError("unexpected data after array")
+            return self._decode(data[:end], last=True)
+
+        comma = data.rfind(b',')
+        if comma == -1:
+            if len(data) > self.max_token_size:
+                raise InvalidFormatError("array element is too long")
+            self._tail = data
+            return []
+        self._tail = data[comma + 1:]
+        values = self._decode(data[:comma], last=False)
+        self._seen_comma = True
+        return values
+
+    def close(self) -> None:
+        if not self._closed:
+            raise InvalidFormatError("unterminated json array")
+
+    def _decode(self, elements: bytes, last: bool) -> list:
+        values = json.loads(b'[' + elements + b']')
+        # a run cut at a comma must hold an element, and so must the final
+        # run of a non-empty array: rejects "[,1]", "[1,,2]" and "[1,]"
+        if not values and (not last or self._seen_comma):
+            raise InvalidFormatError("missing array element")
+        return values
+
+
+class Float64Parser:
+    # Packed little-endian float64 values. Complete values are handed out as
+    # a memoryview over the chunk, so no list of floats is ever built; at
+    # most 7 bytes of a split value are carried to the next chunk.
+
+    itemsize = 8
+
+    def __init__(self) -> None:
+        self._tail = b''
+
+    def feed(self, chunk: bytes) -> memoryview | array:
+        data = self._tail + chunk if self._tail else chunk
+        usable = len(data) - len(data) % self.itemsize
+        self._tail = bytes(data[usable:])
+        if sys.byteorder == 'little':
+            return memoryview(data)[:usable].cast('d')
+        values = array('d')
+        values.frombytes(memoryview(data)[:usable])
+        values.byteswap()
+        return values
+
+    def close(self) -> None:
+        if self._tail:
+            raise InvalidFormatError("body length must be a multiple of 8")
+
+
+# dividing by a power of two is exact, sums beyond the float range are kept
+# in these units instead
+SCALE = 2.0**64
+
+
+def scaled_fsum(values: list | memoryview | array, scale: float) -> float:
+    # huge JSON integers still raise OverflowError converting to float
+    return math.fsum(x / scale for x in values)
+
+
+class MeanAccumulator:
+    def __init__(self) -> None:
+        self.count = 0
+        self._sum = 0.0
+        self._compensation = 0.0
+        self._scale = 1.0
+
+    def _rescale(self) -> None:
+        self._scale = SCALE
+        self._sum /= SCALE
+        self._compensation /= SCALE
+
+    def add(self, values: list | memoryview | array) -> None:
+        if not values:
+            return
+        # fsum is exact within a batch; batches are combined with Neumaier
+        # summation so the error does not grow with the number of chunks
+        try:
+            if self._scale == 1.0:
+                try:
+                    batch = math.fsum(values)
+                except OverflowError:
+                    # finite values whose sum is not; unless one of them is
+                    # itself too large, the scaled sum fits
+                    self._rescale()
+                    batch = scaled_fsum(values, self._scale)
+            else:
+                batch = scaled_fsum(values, self._scale)
+        except ValueError:
+            # fsum refuses to add an infinity to its opposite
+            raise NonFiniteError("elements must be finite") from None
+        # the compensation below would turn an infinity into a NaN
+        if not math.isfinite(batch):
+            raise NonFiniteError("elements must be finite")
+        total = self._sum + batch
+        if math.isinf(total) and math.isfinite(self._sum) and math.isfinite(batch):
+            self._rescale()
+            batch /= SCALE
+            total = self._sum + batch
+        if abs(self._sum) >= abs(batch):
+            self._compensation += (self._sum - total) + batch
+        else:
+            self._compensation += (batch - total) + self._sum
+        self._sum = total
+        self.count += len(values)
+
+    def mean(self) -> float:
+        return (self._sum + self._compensation) / self.count * self._scale
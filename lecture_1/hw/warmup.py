@@ -0,0 +1,27 @@
+import os
+from dataclasses import dataclass, field
+
+
+def _int_list(name: str) -> list[int]:
+    value = os.environ.get(name, '')
+    try:
+        return [int(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise ValueError(f"{name} must be a comma separated list of integers") from None
+
+
+@dataclass(slots=True)
+class WarmupSettings:
+    # n values whose results are calculated and encoded before the worker
+    # reports ready, and whether worker processes are started up front
+    factorial: list[int] = field(default_factory=list)
+    fibonacci: list[int] = field(default_factory=list)
+    start_workers: bool = False
+
+    @classmethod
+    def from_env(cls) -> 'WarmupSettings':
+        return cls(
+            factorial=_int_list('MATH_WARMUP_FACTORIAL'),
+            fibonacci=_int_list('MATH_WARMUP_FIBONACCI'),
+            start_workers=os.environ.get('MATH_WARMUP_WORKERS', '') in ('1', 'true', 'yes'),
+        )
@@ -1,42 +1,109 @@
 import math
 from http import HTTPStatus
-from typing import Annotated
+from typing import Annotated, Any, Callable, Coroutine
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import APIRouter, FastAPI, HTTPException, Query, Request, Response
 from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import TypeAdapter, ValidationError
+
+from lecture_1.hw import modular
+from lecture_1.hw.fibonacci import MAX_MOD_BITS, fibonacci
 
 app = FastAPI()
+# parses the raw JSON and checks every element in one compiled pass, without
+# building the intermediate list that FastAPI validates element by element
+numbers_adapter = TypeAdapter(list[float])
+
+
+def fast_mean(request: Request, body: bytes) -> float | None:
+    # the mean of a non-empty array of numbers; None sends anything else
+    # through the validated endpoint, so errors are exactly FastAPI's
+    content_type = request.headers.get("content-type", "application/json")
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type != "application/json" and not (
+        media_type.startswith("application/") and media_type.endswith("+json")
+    ):
+        return None
+    try:
+        data = numbers_adapter.validate_json(body)
+    except ValidationError:
+        return None
+    if not data:
+        return None
+    return math.fsum(data) / len(data)
+
+
+class FastMeanRoute(APIRoute):
+    # json.loads and per-element validation cost far more than the sum, so
+    # well-formed bodies skip both; errors still come from FastAPI itself
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        validated_handler = super().get_route_handler()
+
+        async def handler(request: Request) -> Response:
+            result = fast_mean(request, await request.body())
+            if result is None:
+                return await validated_handler(request)
+            return JSONResponse({"result": result})
+
+        return handler
+
+
+mean_router = APIRouter(route_class=FastMeanRoute)
 
 
 @app.get("/factorial")
-def get_factorial(n: Annotated[int, Query()]) -> JSONResponse:
+def get_factorial(
+    n: Annotated[int, Query()], mod: Annotated[int | None, Query()] = None
+) -> JSONResponse:
     if n < 0:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
             detail="Invalid value for n, must be non-negative",
         )
+    if mod is not None and mod < 1:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail="Invalid value for mod, must be positive",
+        )
+    if mod is not None and modular.terms(n, mod) > modular.terms_limit(mod):
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail="Invalid value for n, too large for this modulus",
+        )
 
-    result = math.factorial(n)
+    result = math.factorial(n) if mod is None else modular.factorial_mod(n, mod)
 
     return JSONResponse({"result": result})
 
 
 @app.get("/fibonacci/{n}")
-def get_fibonacci(n: int) -> JSONResponse:
+def get_fibonacci(
+    n: int, mod: Annotated[int | None, Query()] = None
+) -> JSONResponse:
     if n < 0:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
             detail="Invalid value for n, must be non-negative",
         )
+    if mod is not None and mod < 1:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail="Invalid value for mod, must be positive",
+        )
+    if mod is not None and mod.bit_length() > MAX_MOD_BITS:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail="Invalid value for mod, too large",
+        )
 
-    a, b = 0, 1
-    for _ in range(n):
-        a, b = b, a + b
+    result = fibonacci(n, mod)
 
-    return JSONResponse({"result": b})
+    return JSONResponse({"result": result})
 
 
-@app.get("/mean")
+@mean_router.get("/mean")
 def get_mean(data: list[float]) -> JSONResponse:
     if len(data) == 0:
         raise HTTPException(
@@ -47,3 +114,6 @@ def get_mean(data: list[float]) -> JSONResponse:
     result = sum(data) / len(data)
 
     return JSONResponse({"result": result})
+
+
+app.include_router(mean_router)
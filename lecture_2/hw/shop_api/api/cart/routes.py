@@ -2,8 +2,9 @@ from starlette.responses import Response
 from http import HTTPStatus
 from typing import List, Optional
 from fastapi import APIRouter, HTTPException, Query
-from lecture_2.hw.shop_api.store import queries
+from lecture_2.hw.shop_api.api.dependencies import RepositoryDep
 from lecture_2.hw.shop_api.api.cart.contracts import CartResponse
+from lecture_2.hw.shop_api.store.repository import ForeignCart
 
 router = APIRouter()
 
@@ -20,9 +21,9 @@ router = APIRouter()
         },
     },
 )
-async def add_cart(response: Response) -> CartResponse:
+async def add_cart(response: Response, repository: RepositoryDep) -> CartResponse:
     try:
-        cart = queries.add_cart()
+        cart = await repository.add_cart()
         response.headers["location"] = f"/cart/{cart.id}"
         return cart
     except ValueError as e:
@@ -39,15 +40,20 @@ async def add_cart(response: Response) -> CartResponse:
         HTTPStatus.NOT_FOUND: {
             "description": "Cart was not found",
         },
+        HTTPStatus.MISDIRECTED_REQUEST: {
+            "description": "Cart is held by another worker: with a shared catalog carts stay in the worker that created them",
+        },
     },
 )
-async def find_cart(cart_id: int) -> CartResponse:
+async def find_cart(cart_id: int, repository: RepositoryDep) -> CartResponse:
     try:
-        cart = queries.find_cart(cart_id)
+        cart = await repository.find_cart(cart_id)
         if cart is None:
             raise HTTPException(
                 status_code=HTTPStatus.NOT_FOUND, detail="Cart was not found"
             )
+    except ForeignCart as e:
+        raise HTTPException(status_code=HTTPStatus.MISDIRECTED_REQUEST, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail=str(e))
     return cart
@@ -56,6 +62,7 @@ async def find_cart(cart_id: int) -> CartResponse:
     "/",
     status_code=HTTPStatus.OK,
     response_model=List[CartResponse],
+    description="With a shared catalog only the carts of the worker answering are listed.",
     responses={
         HTTPStatus.OK: {
             "description": "Cart successfully returned",
@@ -69,25 +76,30 @@ async def find_cart(cart_id: int) -> CartResponse:
     },
 )
 async def find_carts(
+    response: Response,
+    repository: RepositoryDep,
     offset: int = Query(0, ge=0),
     limit: int = Query(10, gt=0),
     min_price: Optional[float] = Query(None, ge=0),
     max_price: Optional[float] = Query(None, ge=0),
     min_quantity: Optional[int] = Query(None, ge=0),
     max_quantity: Optional[int] = Query(None, ge=0),
+    cursor: Optional[str] = None,
 ) -> List[CartResponse]:
     try:
-        carts = queries.find_carts(
-            min_price, max_price, min_quantity, max_quantity, offset, limit
+        carts, next_cursor = await repository.find_carts_page(
+            min_price, max_price, min_quantity, max_quantity, offset, limit, cursor
         )
-        if not carts:
-            raise HTTPException(
-                status_code=HTTPStatus.NOT_FOUND, detail="Cart with these request parameters was not found"
-            )
-    except Exception as e:
-        raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="Internal error occurred")        
     except ValueError as e:
         raise HTTPException(status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail=f"Invalid input: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="Internal error occurred")        
+    if not carts:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND, detail="Cart with these request parameters was not found"
+        )
+    if next_cursor is not None:
+        response.headers["x-next-cursor"] = next_cursor
     return carts
 
 @router.post(
@@ -101,11 +113,16 @@ async def find_carts(
         HTTPStatus.UNPROCESSABLE_ENTITY: {
             "description": "failed to add item to cart",
         },
+        HTTPStatus.MISDIRECTED_REQUEST: {
+            "description": "Cart is held by another worker: with a shared catalog carts stay in the worker that created them",
+        },
     },
 )
-async def add_item(cart_id: int, item_id: int) -> CartResponse:
+async def add_item(cart_id: int, item_id: int, repository: RepositoryDep) -> CartResponse:
     try:
-        cart = queries.add_item(cart_id, item_id)
+        cart = await repository.add_item(cart_id, item_id)
+    except ForeignCart as e:
+        raise HTTPException(status_code=HTTPStatus.MISDIRECTED_REQUEST, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail=str(e))
     return cart
\ No newline at end of file
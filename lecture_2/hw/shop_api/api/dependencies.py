@@ -0,0 +1,7 @@
+from typing import Annotated
+
+from fastapi import Depends
+
+from lecture_2.hw.shop_api.store.repository import Repository, get_repository
+
+RepositoryDep = Annotated[Repository, Depends(get_repository)]
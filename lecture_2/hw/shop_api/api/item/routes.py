@@ -3,7 +3,7 @@ from http import HTTPStatus
 from typing import List, Optional
 from fastapi import APIRouter, HTTPException, Query
 
-from lecture_2.hw.shop_api.store import queries
+from lecture_2.hw.shop_api.api.dependencies import RepositoryDep
 from lecture_2.hw.shop_api.api.item.contracts import (
     Item,
     PatchItemRequest, 
@@ -25,9 +25,9 @@ router = APIRouter()
         },
     },
 )
-async def create_item(item_request: ItemRequest, response: Response) -> Item:
+async def create_item(item_request: ItemRequest, response: Response, repository: RepositoryDep) -> Item:
     try:
-        item = queries.create_item(item_request)
+        item = await repository.create_item(item_request)
         response.headers["location"] = f"/item/{item.id}"
         return item
     except ValueError as e:
@@ -46,8 +46,8 @@ async def create_item(item_request: ItemRequest, response: Response) -> Item:
         },
     },
 )
-async def find_item(id: int) -> Item:
-    item = queries.find_item(id)
+async def find_item(id: int, repository: RepositoryDep) -> Item:
+    item = await repository.find_item(id)
     if item is None or item.deleted:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="item not found")
     return item
@@ -66,14 +66,21 @@ async def find_item(id: int) -> Item:
     },
 )
 async def find_items(
+    response: Response,
+    repository: RepositoryDep,
     offset: int = Query(0, ge=0),
     limit: int = Query(10, gt=0),
     min_price: Optional[float] = Query(None, ge=0),
     max_price: Optional[float] = Query(None, ge=0),
     show_deleted: bool = False,
+    cursor: Optional[str] = None,
 ):
     try:
-        items = queries.find_items(offset, limit, min_price, max_price, show_deleted)
+        items, next_cursor = await repository.find_items_page(
+            offset, limit, min_price, max_price, show_deleted, cursor
+        )
+        if next_cursor is not None:
+            response.headers["x-next-cursor"] = next_cursor
     except Exception as e:
         raise HTTPException(status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail=str(e))
     if items is None:
@@ -93,9 +100,9 @@ async def find_items(
         },
     },
 )
-async def update_item(id: int, item_request: ItemRequest) -> Item:
+async def update_item(id: int, item_request: ItemRequest, repository: RepositoryDep) -> Item:
     try:
-        updated_item = queries.update_item(id, item_request)
+        updated_item = await repository.update_item(id, item_request)
         if updated_item is None:
             raise HTTPException(HTTPStatus.NOT_FOUND, "Item not found")
     except Exception as e:
@@ -116,9 +123,9 @@ async def update_item(id: int, item_request: ItemRequest) -> Item:
     },
 
 )
-async def patch_item(id: int, patch_item_request: PatchItemRequest) -> Item:
+async def patch_item(id: int, patch_item_request: PatchItemRequest, repository: RepositoryDep) -> Item:
     try:
-        patched_item = queries.patch_item(id, patch_item_request)
+        patched_item = await repository.patch_item(id, patch_item_request)
         if patched_item is None:
             raise HTTPException(HTTPStatus.NOT_FOUND, "Item not found")
     except Exception as e:
@@ -134,9 +141,9 @@ async def patch_item(id: int, patch_item_request: PatchItemRequest) -> Item:
         HTTPStatus.NOT_FOUND: {"description": "failed to delete item"},
     },
 )
-async def delete_item(id: int):
+async def delete_item(id: int, repository: RepositoryDep):
     try:
-        item = queries.delete_item(id)
+        item = await repository.delete_item(id)
     except Exception as e:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=str(e))
     return item
\ No newline at end of file
@@ -1,12 +1,24 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from lecture_2.hw.shop_api.api.cart.routes import router as cart
 from lecture_2.hw.shop_api.api.item.routes import router as item
+from lecture_2.hw.shop_api.store.repository import close_repository, get_repository
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # opening the store replays its journal, do it before the first request
+    get_repository()
+    yield
+    close_repository()
+
 
-app = FastAPI(title="My Shop API")
+app = FastAPI(title="My Shop API", lifespan=lifespan)
 
 app.include_router(cart, prefix="/cart", tags=["Cart"])
 app.include_router(item, prefix="/item", tags=["Item"])
 
 @app.get("/")
 def read_root():
-    return {"message": "Hi! Welcome to my Shop API"}
\ No newline at end of file
+    return {"message": "Hi! Welcome to my Shop API"}
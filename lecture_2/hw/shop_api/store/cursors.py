@@ -0,0 +1,34 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from lecture_2.hw.shop_api.store.indexes import Entry
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(order: str, entry: Entry) -> str:
+    # the (key, id) of the last row served, tagged with the order it was
+    # served in; base64 keeps clients from building cursors by hand
+    raw = json.dumps([order, *entry], separators=(",", ":")).encode()
+    return urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str | None, order: str) -> Entry | None:
+    if cursor is None:
+        return None
+    try:
+        raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_order, key, id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor("invalid cursor") from None
+    if (
+        cursor_order != order
+        or not isinstance(key, (int, float))
+        or isinstance(key, bool)
+        or not isinstance(id, int)
+        or isinstance(id, bool)
+    ):
+        raise InvalidCursor("cursor does not match these filters")
+    return key, id
@@ -0,0 +1,95 @@
+from bisect import bisect_left, bisect_right, insort
+from itertools import chain
+from math import inf
+from typing import Iterable, Iterator, List, Tuple
+
+Entry = Tuple[float, int]
+
+# entries per bucket; a bucket twice this size is split in half
+BUCKET_SIZE = 1024
+
+
+class SortedIndex:
+    # (key, id) pairs kept in ascending order, so a range query bisects to
+    # its first match and walks forward only as far as the caller reads.
+    # Entries live in short sorted buckets: an insert shifts one bucket
+    # instead of the whole index, which matters with a million items.
+
+    def __init__(self) -> None:
+        self._buckets: List[List[Entry]] = []
+        self._maxes: List[Entry] = []
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def add(self, key: float, id: int) -> None:
+        entry = (key, id)
+        if not self._buckets:
+            self._buckets.append([entry])
+            self._maxes.append(entry)
+            self._len += 1
+            return
+
+        b = min(bisect_left(self._maxes, entry), len(self._maxes) - 1)
+        bucket = self._buckets[b]
+        insort(bucket, entry)
+        self._maxes[b] = bucket[-1]
+        if len(bucket) > 2 * BUCKET_SIZE:
+            tail = bucket[BUCKET_SIZE:]
+            del bucket[BUCKET_SIZE:]
+            self._buckets.insert(b + 1, tail)
+            self._maxes[b] = bucket[-1]
+            self._maxes.insert(b + 1, tail[-1])
+        self._len += 1
+
+    def remove(self, key: float, id: int) -> None:
+        entry = (key, id)
+        b = bisect_left(self._maxes, entry)
+        if b == len(self._maxes):
+            return
+        bucket = self._buckets[b]
+        i = bisect_left(bucket, entry)
+        if i == len(bucket) or bucket[i] != entry:
+            return
+        del bucket[i]
+        if bucket:
+            self._maxes[b] = bucket[-1]
+        else:
+            del self._buckets[b]
+            del self._maxes[b]
+        self._len -= 1
+
+    def extend(self, entries: Iterable[Entry]) -> None:
+        # bulk load: one sort and fresh buckets instead of an insort per entry
+        merged = sorted(chain(chain.from_iterable(self._buckets), entries))
+        self._buckets = [merged[i : i + BUCKET_SIZE] for i in range(0, len(merged), BUCKET_SIZE)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        self._len = len(merged)
+
+    def move(self, old_key: float, new_key: float, id: int) -> None:
+        if old_key != new_key:
+            self.remove(old_key, id)
+            self.add(new_key, id)
+
+    def range(
+        self, lo: float | None = None, hi: float | None = None, after: Entry | None = None
+    ) -> Iterator[Entry]:
+        # entries with lo <= key <= hi, resuming past `after` when given
+        first = (-inf, -inf) if lo is None else (lo, -inf)
+        bisect = bisect_left
+        if after is not None and after >= first:
+            first, bisect = after, bisect_right
+        last = (inf, inf) if hi is None else (hi, inf)
+        b = bisect(self._maxes, first)
+        if b == len(self._maxes):
+            return
+        i = bisect(self._buckets[b], first)
+        for k in range(b, len(self._buckets)):
+            bucket = self._buckets[k]
+            for j in range(i, len(bucket)):
+                entry = bucket[j]
+                if entry > last:
+                    return
+                yield entry
+            i = 0
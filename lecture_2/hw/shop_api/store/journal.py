@@ -0,0 +1,335 @@
+import asyncio
+import gc
+import os
+import struct
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import accumulate
+from logging import getLogger
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+from lecture_2.hw.shop_api.api.item.contracts import ItemRequest
+from lecture_2.hw.shop_api.store import queries
+from lecture_2.hw.shop_api.store.models import Cart, Item, ItemInCart
+
+logger = getLogger(__name__)
+
+# a snapshot after this many journal records keeps replay around a second
+SNAPSHOT_EVERY = 100_000
+
+ADD_CART, CREATE_ITEM, ADD_ITEM, SET_ITEM, DELETE_ITEM = range(1, 6)
+
+# every record is framed as (body length, crc32 of body) + body; the body
+# starts with the operation and the ids it applies to, item names last
+FRAME = struct.Struct("<II")
+ID = struct.Struct("<Bq")
+TWO_IDS = struct.Struct("<Bqq")
+ITEM = struct.Struct("<Bqd")
+
+SNAPSHOT_MAGIC = b"SHOPSNP1"
+SNAPSHOT_HEADER = struct.Struct("<8sQQQ")
+SNAPSHOT_ITEM = struct.Struct("<qdBI")
+SNAPSHOT_CART = struct.Struct("<qdqI")
+SNAPSHOT_LINE = struct.Struct("<qqB")
+CRC = struct.Struct("<I")
+
+
+class CorruptJournal(ValueError):
+    pass
+
+
+class JournalFailed(OSError):
+    pass
+
+
+def _frame(body: bytes) -> bytes:
+    return FRAME.pack(len(body), zlib.crc32(body)) + body
+
+
+def add_cart_record(cart_id: int) -> bytes:
+    return _frame(ID.pack(ADD_CART, cart_id))
+
+
+def create_item_record(item: Item) -> bytes:
+    return _frame(ITEM.pack(CREATE_ITEM, item.id, item.price) + item.name.encode())
+
+
+def add_item_record(cart_id: int, item_id: int) -> bytes:
+    return _frame(TWO_IDS.pack(ADD_ITEM, cart_id, item_id))
+
+
+def set_item_record(item: Item) -> bytes:
+    # PUT and PATCH both log the state they left the item in
+    return _frame(ITEM.pack(SET_ITEM, item.id, item.price) + item.name.encode())
+
+
+def delete_item_record(item_id: int) -> bytes:
+    return _frame(ID.pack(DELETE_ITEM, item_id))
+
+
+def read_records(data: bytes) -> Iterator[bytes]:
+    # stops at the first torn or damaged record: it was never acknowledged
+    # and nothing written after it in the same segment was either
+    offset = 0
+    while offset + FRAME.size <= len(data):
+        length, crc = FRAME.unpack_from(data, offset)
+        body = data[offset + FRAME.size : offset + FRAME.size + length]
+        if len(body) < length or zlib.crc32(body) != crc:
+            logger.warning("journal ends with %d unreadable bytes", len(data) - offset)
+            return
+        yield body
+        offset += FRAME.size + length
+
+
+def apply_record(body: bytes) -> None:
+    op = body[0]
+    if op == ADD_CART:
+        _, cart_id = ID.unpack_from(body)
+        cart = queries.add_cart()
+        if cart.id != cart_id:
+            raise CorruptJournal(f"cart {cart_id} replayed as {cart.id}")
+    elif op == CREATE_ITEM:
+        _, item_id, price = ITEM.unpack_from(body)
+        name = body[ITEM.size :].decode()
+        item = queries.create_item(ItemRequest.model_construct(name=name, price=price))
+        if item.id != item_id:
+            raise CorruptJournal(f"item {item_id} replayed as {item.id}")
+    elif op == ADD_ITEM:
+        _, cart_id, item_id = TWO_IDS.unpack_from(body)
+        queries.add_item(cart_id, item_id)
+    elif op == SET_ITEM:
+        _, item_id, price = ITEM.unpack_from(body)
+        name = body[ITEM.size :].decode()
+        queries.update_item(item_id, ItemRequest.model_construct(name=name, price=price))
+    elif op == DELETE_ITEM:
+        _, item_id = ID.unpack_from(body)
+        queries.delete_item(item_id)
+    else:
+        raise CorruptJournal(f"unknown journal operation {op}")
+
+
+def encode_snapshot(items: List[tuple], carts: List[tuple]) -> bytes:
+    # fixed size item records followed by one arena with all their names
+    names = [name.encode() for _, _, _, name in items]
+    parts = [SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(items), len(carts), sum(map(len, names)))]
+    parts += [
+        SNAPSHOT_ITEM.pack(id, price, deleted, len(name))
+        for (id, price, deleted, _), name in zip(items, names)
+    ]
+    parts += names
+    for id, price, quantity, lines in carts:
+        parts.append(SNAPSHOT_CART.pack(id, price, quantity, len(lines)))
+        parts += [SNAPSHOT_LINE.pack(*line) for line in lines]
+    data = b"".join(parts)
+    return data + CRC.pack(zlib.crc32(data))
+
+
+def decode_snapshot(data: bytes) -> Tuple[List[Item], List[Cart]]:
+    if len(data) < SNAPSHOT_HEADER.size + CRC.size:
+        raise CorruptJournal("damaged snapshot")
+    (crc,) = CRC.unpack_from(data, len(data) - CRC.size)
+    if zlib.crc32(memoryview(data)[: -CRC.size]) != crc:
+        raise CorruptJournal("damaged snapshot")
+    magic, n_items, n_carts, names_size = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise CorruptJournal("not a shop snapshot")
+
+    offset = SNAPSHOT_HEADER.size
+    records = memoryview(data)[offset : offset + n_items * SNAPSHOT_ITEM.size]
+    rows = list(SNAPSHOT_ITEM.iter_unpack(records))
+    offset += n_items * SNAPSHOT_ITEM.size
+    arena = data[offset : offset + names_size]
+    offset += names_size
+    ends = list(accumulate(row[3] for row in rows))
+    names = [arena[start:end].decode() for start, end in zip([0, *ends], ends)]
+    items = [Item(id, name, price, deleted == 1) for (id, price, deleted, _), name in zip(rows, names)]
+
+    names_by_id = {item.id: item.name for item in items}
+    carts = []
+    for _ in range(n_carts):
+        id, price, quantity, n_lines = SNAPSHOT_CART.unpack_from(data, offset)
+        offset += SNAPSHOT_CART.size
+        cart = Cart(id=id, price=price, quantity=quantity)
+        lines = data[offset : offset + n_lines * SNAPSHOT_LINE.size]
+        offset += len(lines)
+        for item_id, item_quantity, available in SNAPSHOT_LINE.iter_unpack(lines):
+            cart.items.append(ItemInCart(item_id, names_by_id[item_id], item_quantity, available == 1))
+        carts.append(cart)
+    return items, carts
+
+
+def capture_store() -> Tuple[List[tuple], List[tuple]]:
+    # plain tuples, so the snapshot can be encoded off the event loop while
+    # the store keeps changing
+    items = [(item.id, item.price, item.deleted, item.name) for item in queries.item_data.values()]
+    carts = [
+        (cart.id, cart.price, cart.quantity, [(line.id, line.quantity, line.available) for line in cart.items])
+        for cart in queries.cart_data.values()
+    ]
+    return items, carts
+
+
+def _generations(directory: Path, prefix: str) -> List[int]:
+    return sorted(int(path.stem.removeprefix(prefix)) for path in directory.glob(f"{prefix}*.bin"))
+
+
+def _fsync_directory(directory: Path) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    # Append-only log of the in-memory store mutations, kept in
+    # directory/journal-N.bin segments next to snapshot-N.bin files, where
+    # snapshot N holds the store as it was when segment N was started.
+    #
+    # A mutation is applied to the store first, then its record is buffered;
+    # the caller awaits the fsync that covers it. Records buffered while one
+    # fsync runs all go out with the next one (group commit), so concurrent
+    # requests share the cost of a sync. Writes and syncs run in order on a
+    # single background thread.
+    #
+    # After a failed write or sync nothing more is written and `failed` is
+    # set: the store may hold changes that were never made durable, so it
+    # must not serve them; a restart brings back what the journal holds.
+
+    def __init__(self, directory: Path, generation: int, snapshot_every: int = SNAPSHOT_EVERY) -> None:
+        self.directory = directory
+        self.generation = generation
+        self.snapshot_every = snapshot_every
+        self._fd = self._open_segment(generation)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal")
+        self._buffer = bytearray()
+        self._waiters: list[asyncio.Future] = []
+        self._since_snapshot = 0
+        self._closed = False
+        self.failed: JournalFailed | None = None
+        self.syncs = 0
+        self.records = 0
+
+    @classmethod
+    def open(cls, directory: str | Path, snapshot_every: int = SNAPSHOT_EVERY) -> "Journal":
+        # loads the latest snapshot into the (empty) store and replays the
+        # segments written after it; new records go to a fresh segment
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        snapshots = _generations(directory, "snapshot-")
+        segments = _generations(directory, "journal-")
+        start = snapshots[-1] if snapshots else 0
+        replayed = 0
+        # a restore creates millions of objects and none of them are garbage;
+        # collections triggered along the way would only slow it down
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            if snapshots:
+                queries.restore(*decode_snapshot((directory / f"snapshot-{start}.bin").read_bytes()))
+            for generation in segments:
+                if generation >= start:
+                    for body in read_records((directory / f"journal-{generation}.bin").read_bytes()):
+                        apply_record(body)
+                        replayed += 1
+        finally:
+            if collecting:
+                gc.enable()
+
+        journal = cls(directory, max([start, *segments]) + 1, snapshot_every)
+        journal._since_snapshot = replayed
+        if replayed >= snapshot_every:
+            journal.snapshot()
+        return journal
+
+    def _open_segment(self, generation: int) -> int:
+        return os.open(self.directory / f"journal-{generation}.bin", os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    async def append(self, record: bytes) -> None:
+        if self.failed is not None:
+            raise self.failed
+        if self._closed:
+            raise JournalFailed("journal is closed")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self._waiters:
+            loop.call_soon(self._flush)
+        self._buffer += record
+        self._waiters.append(future)
+        self._since_snapshot += 1
+        await future
+
+    def _flush(self) -> None:
+        # scheduled with call_soon, it can run after close
+        if not self._waiters or self._closed:
+            return
+        data, waiters = bytes(self._buffer), self._waiters
+        self._buffer, self._waiters = bytearray(), []
+        done = asyncio.wrap_future(self._executor.submit(self._write, self._fd, data, len(waiters)))
+        done.add_done_callback(lambda done: _resolve(waiters, done))
+        if self._since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def _write(self, fd: int, data: bytes, records: int) -> None:
+        if self.failed is not None:
+            raise self.failed
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view) :]
+            os.fdatasync(fd)
+        except OSError as error:
+            logger.error("journal write failed, the store stops serving: %s", error)
+            self.failed = JournalFailed(f"journal write failed: {error}")
+            raise self.failed from error
+        self.syncs += 1
+        self.records += records
+
+    def snapshot(self) -> Future:
+        # later records go to a new segment; the snapshot covers everything
+        # before it and, once durable, replaces the older files
+        self._flush()
+        self.generation += 1
+        old_fd, self._fd = self._fd, self._open_segment(self.generation)
+        self._since_snapshot = 0
+        return self._executor.submit(self._write_snapshot, self.generation, capture_store(), old_fd)
+
+    def _write_snapshot(self, generation: int, state: Tuple[List[tuple], List[tuple]], old_fd: int) -> None:
+        os.close(old_fd)
+        if self.failed is not None:
+            # the captured store may hold changes the journal lost
+            raise self.failed
+        path = self.directory / f"snapshot-{generation}.bin"
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as file:
+            file.write(encode_snapshot(*state))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, path)
+        _fsync_directory(self.directory)
+        for prefix in ("journal-", "snapshot-"):
+            for old in _generations(self.directory, prefix):
+                if old < generation:
+                    (self.directory / f"{prefix}{old}.bin").unlink()
+
+    def close(self) -> None:
+        self._closed = True
+        data, waiters = bytes(self._buffer), self._waiters
+        self._buffer, self._waiters = bytearray(), []
+        done = self._executor.submit(self._write, self._fd, data, len(waiters)) if waiters else None
+        self._executor.shutdown(wait=True)
+        os.close(self._fd)
+        if done is not None:
+            _resolve(waiters, done)
+
+
+def _resolve(waiters: List[asyncio.Future], done: asyncio.Future) -> None:
+    error = done.exception()
+    for waiter in waiters:
+        if waiter.done():
+            continue
+        if error is None:
+            waiter.set_result(None)
+        else:
+            waiter.set_exception(error)
@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import List
+from typing import Dict, List
 
 @dataclass(slots=True)
 class Item:
@@ -19,4 +19,7 @@ class ItemInCart:
 class Cart:
     id: int
     items: List[ItemInCart] = field(default_factory=list)
-    price: float = 0
\ No newline at end of file
+    price: float = 0
+    quantity: int = 0
+    # the same ItemInCart objects as items, by item id
+    items_by_id: Dict[int, ItemInCart] = field(default_factory=dict, repr=False, compare=False)
\ No newline at end of file
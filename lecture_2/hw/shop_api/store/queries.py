@@ -1,5 +1,10 @@
-from typing import Iterable, List
+from bisect import bisect_right
+from heapq import merge
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Tuple
 
+from lecture_2.hw.shop_api.store.cursors import decode_cursor, encode_cursor
+from lecture_2.hw.shop_api.store.indexes import Entry, SortedIndex
 from lecture_2.hw.shop_api.store.models import (
     Cart, 
     ItemInCart, 
@@ -13,9 +18,19 @@ from lecture_2.hw.shop_api.api.item.contracts import (
 
 item_data = dict[int, Item]()
 cart_data = dict[int, Cart]()
-
-def int_id_generator() -> Iterable[int]:
-    i = 0
+# ids in creation order, nothing is ever removed from the stores
+item_ids = list[int]()
+cart_ids = list[int]()
+# ids of the carts holding each item, so item changes reach only those carts
+item_carts = dict[int, List[int]]()
+# items by price; deleted items move to their own index and never come back
+item_price_index = SortedIndex()
+deleted_item_price_index = SortedIndex()
+cart_price_index = SortedIndex()
+cart_quantity_index = SortedIndex()
+
+def int_id_generator(start: int = 0) -> Iterable[int]:
+    i = start
     while True:
         yield i
         i += 1
@@ -23,12 +38,55 @@ def int_id_generator() -> Iterable[int]:
 _cart_id_generator = int_id_generator()
 _item_id_generator = int_id_generator()
 
+def restore(items: List[Item], carts: List[Cart]) -> None:
+    # fills an empty store from a snapshot; indexes are bulk loaded rather
+    # than updated item by item as create_item and add_item do
+    global _cart_id_generator, _item_id_generator
+    for item in items:
+        item_data[item.id] = item
+    item_ids.extend(sorted(item_data))
+    item_price_index.extend((item.price, item.id) for item in items if not item.deleted)
+    deleted_item_price_index.extend((item.price, item.id) for item in items if item.deleted)
+    for cart in carts:
+        cart_data[cart.id] = cart
+        for item_in_cart in cart.items:
+            cart.items_by_id[item_in_cart.id] = item_in_cart
+            item_carts.setdefault(item_in_cart.id, []).append(cart.id)
+    cart_ids.extend(sorted(cart_data))
+    cart_price_index.extend((cart.price, cart.id) for cart in carts)
+    cart_quantity_index.extend((cart.quantity, cart.id) for cart in carts)
+    _item_id_generator = int_id_generator(max(item_data, default=-1) + 1)
+    _cart_id_generator = int_id_generator(max(cart_data, default=-1) + 1)
+
+def use_cart_ids(ids: Iterator[int]) -> None:
+    # new carts take their ids from here, ascending like the default ones
+    global _cart_id_generator
+    _cart_id_generator = ids
+
 def add_cart() -> int:
     _id = next(_cart_id_generator)
     cart = Cart(id=_id)
     cart_data[_id] = cart
+    cart_ids.append(_id)
+    cart_price_index.add(cart.price, _id)
+    cart_quantity_index.add(cart.quantity, _id)
     return cart
 
+def _ids_after(ids: List[int], after: Entry | None) -> Iterator[Entry]:
+    start = 0 if after is None else bisect_right(ids, after[1])
+    for i in range(start, len(ids)):
+        yield ids[i], ids[i]
+
+def _page(entries: Iterator[Entry], data: dict, keep: Callable[[object], bool] | None,
+          order: str, offset: int, limit: int) -> Tuple[list, str | None]:
+    # one row past the page tells whether a next page exists
+    rows = ((entry, data[entry[1]]) for entry in entries)
+    if keep is not None:
+        rows = (row for row in rows if keep(row[1]))
+    page = list(islice(rows, offset, offset + limit + 1))
+    next_cursor = encode_cursor(order, page[limit - 1][0]) if len(page) > limit else None
+    return [row for _, row in page[:limit]], next_cursor
+
 def find_cart(id: int) -> Cart | None:
     return cart_data.get(id)
 
@@ -37,13 +95,37 @@ def find_carts(min_price: float | None,
                    min_quantity: int | None, 
                    max_quantity: int | None, 
                    offset: int = 0, 
-                   limit: int = 10) -> List[Cart]:    
-    filtered_carts = [cart for cart in cart_data.values() if (min_price is None or cart.price >= min_price) and (max_price is None or cart.price <= max_price)]    
-    if max_quantity is not None:
-        filtered_carts = [cart for cart in filtered_carts if sum(item.quantity for item in cart.items) <= max_quantity]
-    if min_quantity is not None:
-        filtered_carts = [cart for cart in filtered_carts if sum(item.quantity for item in cart.items) >= min_quantity]    
-    return filtered_carts[offset : offset + limit]
+                   limit: int = 10,
+                   cursor: str | None = None) -> List[Cart]:    
+    return find_carts_page(min_price, max_price, min_quantity, max_quantity, offset, limit, cursor)[0]
+
+def find_carts_page(min_price: float | None,
+                    max_price: float | None,
+                    min_quantity: int | None,
+                    max_quantity: int | None,
+                    offset: int = 0,
+                    limit: int = 10,
+                    cursor: str | None = None) -> Tuple[List[Cart], str | None]:
+    # the price index drives a price filter, the quantity index a quantity
+    # filter alone; either way results come ordered by that key and only
+    # carts inside its range are looked at. A cursor resumes right after
+    # the last cart of the previous page.
+    keep = None
+    if min_price is not None or max_price is not None:
+        order = "price"
+        entries = cart_price_index.range(min_price, max_price, decode_cursor(cursor, order))
+        if min_quantity is not None or max_quantity is not None:
+            def in_quantity_range(cart: Cart) -> bool:
+                return ((min_quantity is None or cart.quantity >= min_quantity) and
+                        (max_quantity is None or cart.quantity <= max_quantity))
+            keep = in_quantity_range
+    elif min_quantity is not None or max_quantity is not None:
+        order = "quantity"
+        entries = cart_quantity_index.range(min_quantity, max_quantity, decode_cursor(cursor, order))
+    else:
+        order = "id"
+        entries = _ids_after(cart_ids, decode_cursor(cursor, order))
+    return _page(entries, cart_data, keep, order, offset, limit)
 
 def add_item(cart_id: int, item_id: int) -> Cart:
     cart = find_cart(cart_id)
@@ -53,57 +135,106 @@ def add_item(cart_id: int, item_id: int) -> Cart:
     item = find_item(item_id)
     if item is None:
         raise ValueError(f"cant found item: {item_id}")
+    return add_item_to_cart(cart, item)
 
-    item_dict = {it.id: it for it in cart.items}
-
-    if item_id in item_dict:
-        item_in_cart = item_dict[item_id]
+def add_item_to_cart(cart: Cart, item: Item) -> Cart:
+    item_id = item.id
+    item_in_cart = cart.items_by_id.get(item_id)
+    if item_in_cart is not None:
         item_in_cart.quantity += 1
     else:
-        cart.items.append(ItemInCart(id=item.id, name=item.name, quantity=1, available=True))
-
-    cart.price += item.price
+        item_in_cart = ItemInCart(id=item.id, name=item.name, quantity=1, available=not item.deleted)
+        cart.items.append(item_in_cart)
+        cart.items_by_id[item_id] = item_in_cart
+        item_carts.setdefault(item_id, []).append(cart.id)
+
+    # deleted items stay in the cart but are not paid for
+    if item_in_cart.available:
+        _set_cart_price(cart, cart.price + item.price)
+    cart_quantity_index.move(cart.quantity, cart.quantity + 1, cart.id)
+    cart.quantity += 1
     return cart
 
+def _set_cart_price(cart: Cart, price: float) -> None:
+    cart_price_index.move(cart.price, price, cart.id)
+    cart.price = price
+
+def propagate_item(item: Item, old_price: float) -> None:
+    for cart_id in item_carts.get(item.id, ()):
+        cart = cart_data[cart_id]
+        item_in_cart = cart.items_by_id[item.id]
+        item_in_cart.name = item.name
+        if not item_in_cart.available:
+            continue
+        if item.deleted:
+            item_in_cart.available = False
+            _set_cart_price(cart, cart.price - old_price * item_in_cart.quantity)
+        elif item.price != old_price:
+            _set_cart_price(cart, cart.price + (item.price - old_price) * item_in_cart.quantity)
+
 def create_item(item_request: ItemRequest) -> Item:
     _id = next(_item_id_generator)
     item = Item(id=_id, name=item_request.name, price=item_request.price)
     item_data[_id] = item
+    item_ids.append(_id)
+    item_price_index.add(item.price, _id)
     return item
 
 def find_item(id: int) -> Item | None:
     return item_data.get(id)
 
-def find_items(offset: int, limit: int, min_price: float | None, max_price: float | None, show_deleted: bool) -> List[Item]:
-    result = [
-        item for item in item_data.values()
-        if (min_price is None or item.price >= min_price) and
-           (max_price is None or item.price <= max_price) and
-           (show_deleted or not item.deleted)
-    ]
-    return result[offset: offset + limit]
+def find_items(offset: int, limit: int, min_price: float | None, max_price: float | None, show_deleted: bool,
+               cursor: str | None = None) -> List[Item]:
+    return find_items_page(offset, limit, min_price, max_price, show_deleted, cursor)[0]
+
+def find_items_page(offset: int, limit: int, min_price: float | None, max_price: float | None, show_deleted: bool,
+                    cursor: str | None = None) -> Tuple[List[Item], str | None]:
+    if min_price is None and max_price is None:
+        order = "id"
+        entries = _ids_after(item_ids, decode_cursor(cursor, order))
+        keep = None if show_deleted else lambda item: not item.deleted
+        return _page(entries, item_data, keep, order, offset, limit)
+
+    # a price filter returns items ordered by price, reading only the first
+    # offset + limit entries of the matching range
+    order = "price"
+    after = decode_cursor(cursor, order)
+    entries = item_price_index.range(min_price, max_price, after)
+    if show_deleted:
+        entries = merge(entries, deleted_item_price_index.range(min_price, max_price, after))
+    return _page(entries, item_data, None, order, offset, limit)
 
 def update_item(id: int, item_request: ItemRequest) -> Item:
     item = find_item(id)
     if not item or item.deleted:
         return None
+    old_price = item.price
     item.name = item_request.name
+    item_price_index.move(item.price, item_request.price, id)
     item.price = item_request.price
+    propagate_item(item, old_price)
     return item
 
 def patch_item(id: int, patch_item_request: PatchItemRequest) -> Item:
     item = find_item(id)
     if not item or item.deleted:
         return None
+    old_price = item.price
     if patch_item_request.name:
         item.name = patch_item_request.name
     if patch_item_request.price:
+        item_price_index.move(item.price, patch_item_request.price, id)
         item.price = patch_item_request.price
+    propagate_item(item, old_price)
     return item
 
 def delete_item(id: int) -> Item | None:
     item = item_data.get(id)
     if not item:
         return None
-    item.deleted = True
+    if not item.deleted:
+        item_price_index.remove(item.price, id)
+        deleted_item_price_index.add(item.price, id)
+        item.deleted = True
+        propagate_item(item, item.price)
     return item
\ No newline at end of file
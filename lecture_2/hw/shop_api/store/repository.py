@@ -0,0 +1,170 @@
+import os
+from abc import ABC, abstractmethod
+from typing import List, Tuple
+
+from lecture_2.hw.shop_api.api.item.contracts import ItemRequest, PatchItemRequest
+from lecture_2.hw.shop_api.store import journal, queries
+from lecture_2.hw.shop_api.store.journal import Journal
+from lecture_2.hw.shop_api.store.models import Cart, Item
+
+# "sqlite:///path/to/shop.db" keeps the shop in SQLite, "journal:///path/to/dir"
+# in memory backed by a journal there, "shared:///dev/shm/shop-catalog" items in
+# a memory-mapped file shared by all workers, anything else in memory only
+DATABASE_URL_ENV = "SHOP_DATABASE_URL"
+
+
+class ForeignCart(LookupError):
+    # the cart exists in the memory of another worker process
+    pass
+
+
+class Repository(ABC):
+    @abstractmethod
+    async def add_cart(self) -> Cart: ...
+
+    @abstractmethod
+    async def find_cart(self, id: int) -> Cart | None: ...
+
+    @abstractmethod
+    async def find_carts_page(self,
+                              min_price: float | None,
+                              max_price: float | None,
+                              min_quantity: int | None,
+                              max_quantity: int | None,
+                              offset: int = 0,
+                              limit: int = 10,
+                              cursor: str | None = None) -> Tuple[List[Cart], str | None]: ...
+
+    @abstractmethod
+    async def add_item(self, cart_id: int, item_id: int) -> Cart: ...
+
+    @abstractmethod
+    async def create_item(self, item_request: ItemRequest) -> Item: ...
+
+    @abstractmethod
+    async def find_item(self, id: int) -> Item | None: ...
+
+    @abstractmethod
+    async def find_items_page(self, offset: int, limit: int, min_price: float | None, max_price: float | None,
+                              show_deleted: bool, cursor: str | None = None) -> Tuple[List[Item], str | None]: ...
+
+    @abstractmethod
+    async def update_item(self, id: int, item_request: ItemRequest) -> Item | None: ...
+
+    @abstractmethod
+    async def patch_item(self, id: int, patch_item_request: PatchItemRequest) -> Item | None: ...
+
+    @abstractmethod
+    async def delete_item(self, id: int) -> Item | None: ...
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryRepository(Repository):
+    # the module level store in queries.py, private to one worker process;
+    # with a journal its changes survive restarts, and once the journal
+    # fails every request does, see Journal
+
+    def __init__(self, journal: Journal | None = None) -> None:
+        self.journal = journal
+
+    def _check(self) -> None:
+        if self.journal is not None and self.journal.failed is not None:
+            raise self.journal.failed
+
+    async def _log(self, record: bytes) -> None:
+        if self.journal is not None:
+            await self.journal.append(record)
+
+    async def add_cart(self) -> Cart:
+        self._check()
+        cart = queries.add_cart()
+        await self._log(journal.add_cart_record(cart.id))
+        return cart
+
+    async def find_cart(self, id: int) -> Cart | None:
+        self._check()
+        return queries.find_cart(id)
+
+    async def find_carts_page(self, min_price, max_price, min_quantity, max_quantity,
+                              offset=0, limit=10, cursor=None) -> Tuple[List[Cart], str | None]:
+        self._check()
+        return queries.find_carts_page(min_price, max_price, min_quantity, max_quantity, offset, limit, cursor)
+
+    async def add_item(self, cart_id: int, item_id: int) -> Cart:
+        self._check()
+        cart = queries.add_item(cart_id, item_id)
+        await self._log(journal.add_item_record(cart_id, item_id))
+        return cart
+
+    async def create_item(self, item_request: ItemRequest) -> Item:
+        self._check()
+        item = queries.create_item(item_request)
+        await self._log(journal.create_item_record(item))
+        return item
+
+    async def find_item(self, id: int) -> Item | None:
+        self._check()
+        return queries.find_item(id)
+
+    async def find_items_page(self, offset, limit, min_price, max_price, show_deleted,
+                              cursor=None) -> Tuple[List[Item], str | None]:
+        self._check()
+        return queries.find_items_page(offset, limit, min_price, max_price, show_deleted, cursor)
+
+    async def update_item(self, id: int, item_request: ItemRequest) -> Item | None:
+        self._check()
+        item = queries.update_item(id, item_request)
+        if item is not None:
+            await self._log(journal.set_item_record(item))
+        return item
+
+    async def patch_item(self, id: int, patch_item_request: PatchItemRequest) -> Item | None:
+        self._check()
+        item = queries.patch_item(id, patch_item_request)
+        if item is not None:
+            await self._log(journal.set_item_record(item))
+        return item
+
+    async def delete_item(self, id: int) -> Item | None:
+        self._check()
+        item = queries.delete_item(id)
+        if item is not None:
+            await self._log(journal.delete_item_record(id))
+        return item
+
+    def close(self) -> None:
+        if self.journal is not None:
+            self.journal.close()
+
+
+def create_repository(url: str | None) -> Repository:
+    if url and url.startswith("sqlite:///"):
+        from lecture_2.hw.shop_api.store.sqlite import SqliteRepository
+
+        return SqliteRepository(url.removeprefix("sqlite:///"))
+    if url and url.startswith("journal:///"):
+        return MemoryRepository(Journal.open(url.removeprefix("journal:///")))
+    if url and url.startswith("shared:///"):
+        from lecture_2.hw.shop_api.store.shared import SharedCatalog, SharedCatalogRepository
+
+        return SharedCatalogRepository(SharedCatalog(url.removeprefix("shared:///")))
+    return MemoryRepository()
+
+
+_repository: Repository | None = None
+
+
+def get_repository() -> Repository:
+    global _repository
+    if _repository is None:
+        _repository = create_repository(os.environ.get(DATABASE_URL_ENV))
+    return _repository
+
+
+def close_repository() -> None:
+    global _repository
+    if _repository is not None:
+        _repository.close()
+        _repository = None
@@ -0,0 +1,413 @@
+import fcntl
+import mmap
+import os
+import struct
+from contextlib import contextmanager
+from heapq import merge
+from itertools import islice
+from typing import Callable, Iterator, List, Tuple
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, bulk record checks fall back to plain python
+    numpy = None
+
+from lecture_2.hw.shop_api.api.item.contracts import ItemRequest, PatchItemRequest
+from lecture_2.hw.shop_api.store import queries
+from lecture_2.hw.shop_api.store.cursors import decode_cursor, encode_cursor
+from lecture_2.hw.shop_api.store.indexes import Entry, SortedIndex
+from lecture_2.hw.shop_api.store.models import Cart, Item
+from lecture_2.hw.shop_api.store.repository import ForeignCart, MemoryRepository
+
+MAGIC = b"SHOPCAT2"
+# magic, record capacity, arena size, items created, arena bytes used,
+# item changes logged, carts created
+HEADER = struct.Struct("<8sQQQQQQ")
+COUNT_OFFSET = 24
+ARENA_USED_OFFSET = 32
+CHANGES_OFFSET = 40
+CARTS_OFFSET = 48
+HEADER_SIZE = mmap.PAGESIZE
+U64 = struct.Struct("<Q")
+# ids of changed items, a ring of the latest LOG_SIZE changes after the header
+LOG_SIZE = 1 << 20
+# seq, price, name offset, name size, deleted; the id is the record number
+RECORD = struct.Struct("<QdQIB3x")
+
+CAPACITY = 1 << 20
+ARENA_SIZE = 64 << 20
+# fewer records than this are checked without numpy, it only pays off in bulk
+NUMPY_MIN = 4096
+# reads of a record a writer holds before waiting for the writers' lock
+READ_SPINS = 100
+
+Row = Tuple[int, float, int, int, int]
+
+
+class CatalogFull(ValueError):
+    pass
+
+
+class SharedCatalog:
+    # Items in a memory-mapped file shared by every worker process that
+    # opens it: a header, a log of changed item ids, fixed size records
+    # indexed by item id and an append-only arena of item names. A rename
+    # appends the new name and the old one is never reclaimed: readers take
+    # names from the arena outside the record's seqlock, so a name is never
+    # overwritten, and once the arena is full creates and renames fail with
+    # CatalogFull until the file is rebuilt with a larger arena.
+    #
+    # Writers take an flock on the file, so one process writes at a time.
+    # Readers take no lock: every record carries a sequence number that a
+    # writer makes odd before changing the record and even again after
+    # (a seqlock), and a reader that sees it odd or changed reads again.
+    # Python cannot emit memory fences, this relies on the store ordering of
+    # x86 and similar CPUs.
+    #
+    # Each worker keeps its own price indexes over the catalog. Before a
+    # price query it reads the items created since and looks up the items
+    # changed since in the log, so a query costs a bisect, not a scan.
+    # on_change hears of every change the indexes take in, with the price
+    # they held before, so the worker can reprice the carts it keeps.
+
+    def __init__(self, path: str, capacity: int = CAPACITY, arena_size: int = ARENA_SIZE) -> None:
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        with self._locked():
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, HEADER_SIZE + LOG_SIZE * U64.size + capacity * RECORD.size + arena_size)
+                os.pwrite(self._fd, HEADER.pack(MAGIC, capacity, arena_size, 0, 0, 0, 0), 0)
+            magic, capacity, arena_size, count, *_ = HEADER.unpack(os.pread(self._fd, HEADER.size, 0))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a shop catalog")
+            self.capacity = capacity
+            self.arena_size = arena_size
+            self._records = HEADER_SIZE + LOG_SIZE * U64.size
+            self._arena = self._records + capacity * RECORD.size
+            self._map = mmap.mmap(self._fd, 0)
+            self._repair(count)
+        # this worker's indexes and the price and deleted flag they hold per id
+        self._price_index = SortedIndex()
+        self._deleted_price_index = SortedIndex()
+        self._prices: List[float] = []
+        self._deleted: List[int] = []
+        # logged changes the indexes include
+        self._seen = 0
+        self.on_change: Callable[[int, float], None] | None = None
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _repair(self, count: int) -> None:
+        # a writer killed halfway leaves its record odd, readers would wait
+        for id in range(count):
+            self._settle(id)
+
+    def _store(self, offset: int, value: int) -> None:
+        # pack_into zeroes its target before packing, a reader could catch
+        # the zero; a slice assignment copies the packed bytes in one go
+        self._map[offset : offset + U64.size] = U64.pack(value)
+
+    def __len__(self) -> int:
+        return U64.unpack_from(self._map, COUNT_OFFSET)[0]
+
+    def _read(self, id: int) -> Row:
+        offset = self._records + id * RECORD.size
+        for _ in range(READ_SPINS):
+            row = RECORD.unpack_from(self._map, offset)
+            if not row[0] & 1 and U64.unpack_from(self._map, offset)[0] == row[0]:
+                return row
+        # the writer is descheduled or died halfway: the lock waits for a
+        # live one, and a record still odd under it was left by a dead one
+        with self._locked():
+            return self._settle(id)
+
+    def _settle(self, id: int) -> Row:
+        # reads a record under the writers' lock, where nothing changes it
+        offset = self._records + id * RECORD.size
+        row = RECORD.unpack_from(self._map, offset)
+        if row[0] & 1:
+            self._store(offset, row[0] + 1)
+            row = (row[0] + 1, *row[1:])
+        return row
+
+    def _write(self, id: int, price: float, name_offset: int, name_size: int, deleted: bool,
+               log: bool = True) -> None:
+        offset = self._records + id * RECORD.size
+        (seq,) = U64.unpack_from(self._map, offset)
+        self._store(offset, seq + 1)
+        if log:
+            # logged while the record is odd, so a worker that finds the id
+            # in the log and reads the record waits for the change
+            (changes,) = U64.unpack_from(self._map, CHANGES_OFFSET)
+            self._store(HEADER_SIZE + changes % LOG_SIZE * U64.size, id)
+            self._store(CHANGES_OFFSET, changes + 1)
+        self._map[offset + U64.size : offset + RECORD.size] = RECORD.pack(
+            seq + 1, price, name_offset, name_size, deleted
+        )[U64.size :]
+        self._store(offset, seq + 2)
+
+    def _name(self, name_offset: int, name_size: int) -> str:
+        start = self._arena + name_offset
+        return self._map[start : start + name_size].decode()
+
+    def _append_name(self, name: str) -> Tuple[int, int]:
+        data = name.encode()
+        (used,) = U64.unpack_from(self._map, ARENA_USED_OFFSET)
+        if used + len(data) > self.arena_size:
+            raise CatalogFull("no room left for item names")
+        self._map[self._arena + used : self._arena + used + len(data)] = data
+        self._store(ARENA_USED_OFFSET, used + len(data))
+        return used, len(data)
+
+    def _item(self, id: int, row: Row) -> Item:
+        _, price, name_offset, name_size, deleted = row
+        return Item(id, self._name(name_offset, name_size), price, deleted == 1)
+
+    def create(self, name: str, price: float) -> Item:
+        with self._locked():
+            id = len(self)
+            if id == self.capacity:
+                raise CatalogFull(f"the catalog holds at most {self.capacity} items")
+            # new items are found by the item count, not the log
+            self._write(id, price, *self._append_name(name), False, log=False)
+            # the item becomes visible to readers only now
+            self._store(COUNT_OFFSET, id + 1)
+        return Item(id, name, price)
+
+    def get(self, id: int) -> Item | None:
+        if not 0 <= id < len(self):
+            return None
+        return self._item(id, self._read(id))
+
+    def update(self, id: int, name: str | None, price: float | None) -> Item | None:
+        with self._locked():
+            if not 0 <= id < len(self):
+                return None
+            _, old_price, name_offset, name_size, deleted = self._settle(id)
+            if deleted:
+                return None
+            if name is not None and name != self._name(name_offset, name_size):
+                name_offset, name_size = self._append_name(name)
+            new_price = old_price if price is None else price
+            # renames are logged too, carts show the names of their items
+            self._write(id, new_price, name_offset, name_size, False)
+            return Item(id, self._name(name_offset, name_size), new_price)
+
+    def delete(self, id: int) -> Item | None:
+        with self._locked():
+            if not 0 <= id < len(self):
+                return None
+            row = self._settle(id)
+            if not row[4]:
+                self._write(id, row[1], row[2], row[3], True)
+            return Item(id, self._name(row[2], row[3]), row[1], True)
+
+    def new_cart_id(self) -> int:
+        # carts live in worker memory, their ids come from here so that no
+        # two workers hand out the same one
+        with self._locked():
+            (id,) = U64.unpack_from(self._map, CARTS_OFFSET)
+            self._store(CARTS_OFFSET, id + 1)
+        return id
+
+    def carts(self) -> int:
+        return U64.unpack_from(self._map, CARTS_OFFSET)[0]
+
+    def _copy(self, start: int, stop: int) -> bytearray:
+        # records copied in bulk, then the ones a writer touched meanwhile
+        # are read again one at a time
+        first = bytearray(self._map[self._records + start * RECORD.size : self._records + stop * RECORD.size])
+        second = self._map[self._records + start * RECORD.size : self._records + stop * RECORD.size]
+        if numpy is not None and stop - start >= NUMPY_MIN:
+            seqs = numpy.frombuffer(first, dtype="<u8")[::4]
+            again = numpy.frombuffer(second, dtype="<u8")[::4]
+            touched = numpy.flatnonzero((seqs != again) | (seqs & 1 == 1)).tolist()
+        else:
+            seqs = memoryview(first).cast("Q")[::4]
+            again = memoryview(second).cast("Q")[::4]
+            touched = [i for i, (seq, other) in enumerate(zip(seqs, again)) if seq != other or seq & 1]
+        for i in touched:
+            RECORD.pack_into(first, i * RECORD.size, *self._read(start + i))
+        return first
+
+    def _logged(self, start: int, stop: int) -> List[int] | None:
+        # ids of the changes start..stop, None once the ring has overwritten some
+        if stop - start >= LOG_SIZE:
+            return None
+        ids = [U64.unpack_from(self._map, HEADER_SIZE + i % LOG_SIZE * U64.size)[0] for i in range(start, stop)]
+        if U64.unpack_from(self._map, CHANGES_OFFSET)[0] - start >= LOG_SIZE:
+            return None
+        return ids
+
+    def refresh(self) -> None:
+        # records are read after the change count, so they hold at least the
+        # logged changes; a worker too far behind the log indexes afresh
+        (changes,) = U64.unpack_from(self._map, CHANGES_OFFSET)
+        count = len(self)
+        changed = self._logged(self._seen, changes)
+        stale = None
+        if changed is None:
+            stale = self._prices
+            self._price_index, self._deleted_price_index = SortedIndex(), SortedIndex()
+            self._prices, self._deleted, changed = [], [], []
+        known = len(self._prices)
+        if count > known:
+            records = memoryview(self._copy(known, count))
+            prices, deleted = records.cast("d")[1::4].tolist(), records[28::RECORD.size].tolist()
+            self._prices += prices
+            self._deleted += deleted
+            for index, flag in ((self._price_index, 0), (self._deleted_price_index, 1)):
+                entries = [(price, known + i) for i, (price, d) in enumerate(zip(prices, deleted)) if d == flag]
+                if len(entries) > len(index):
+                    index.extend(entries)
+                else:
+                    for price, id in entries:
+                        index.add(price, id)
+        for id in dict.fromkeys(changed):
+            if id < known:
+                old_price = self._prices[id]
+                _, price, _, _, deleted = self._read(id)
+                self._reindex(id, price, deleted)
+                if self.on_change is not None:
+                    self.on_change(id, old_price)
+        if stale is not None and self.on_change is not None:
+            # the log no longer tells what changed, any item known before may have
+            for id, old_price in enumerate(stale):
+                self.on_change(id, old_price)
+        self._seen = changes
+
+    def _reindex(self, id: int, price: float, deleted: int) -> None:
+        old_price, old_deleted = self._prices[id], self._deleted[id]
+        if old_price == price and old_deleted == deleted:
+            return
+        (self._deleted_price_index if old_deleted else self._price_index).remove(old_price, id)
+        (self._deleted_price_index if deleted else self._price_index).add(price, id)
+        self._prices[id], self._deleted[id] = price, deleted
+
+    def indexed(self, id: int) -> Item | None:
+        # the item at the price and deleted flag this worker's indexes hold,
+        # which a change another worker made meanwhile may already be past
+        if not 0 <= id < len(self._prices):
+            return None
+        _, _, name_offset, name_size, _ = self._read(id)
+        return Item(id, self._name(name_offset, name_size), self._prices[id], self._deleted[id] == 1)
+
+    def _by_price(self, min_price: float | None, max_price: float | None, show_deleted: bool,
+                  after: Entry | None, n: int) -> List[Entry]:
+        self.refresh()
+        entries = self._price_index.range(min_price, max_price, after)
+        if show_deleted:
+            entries = merge(entries, self._deleted_price_index.range(min_price, max_price, after))
+        return list(islice(entries, n))
+
+    def _by_id(self, show_deleted: bool, after: Entry | None, n: int) -> List[Entry]:
+        count = len(self)
+        start = 0 if after is None else after[1] + 1
+        found = []
+        while start < count and len(found) < n:
+            stop = min(start + n - len(found), count)
+            for i, row in enumerate(RECORD.iter_unpack(self._copy(start, stop))):
+                if show_deleted or not row[4]:
+                    found.append((start + i, start + i))
+            start = stop
+        return found[:n]
+
+    def find_page(self, offset: int, limit: int, min_price: float | None, max_price: float | None,
+                  show_deleted: bool, cursor: str | None = None) -> Tuple[List[Item], str | None]:
+        # the same orders, cursors and pages as queries.find_items_page
+        if min_price is None and max_price is None:
+            order = "id"
+            entries = self._by_id(show_deleted, decode_cursor(cursor, order), offset + limit + 1)
+        else:
+            order = "price"
+            entries = self._by_price(
+                min_price, max_price, show_deleted, decode_cursor(cursor, order), offset + limit + 1
+            )
+        page = entries[offset : offset + limit + 1]
+        next_cursor = encode_cursor(order, page[limit - 1]) if len(page) > limit else None
+        return [self._item(id, self._read(id)) for _, id in page[:limit]], next_cursor
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+
+class SharedCatalogRepository(MemoryRepository):
+    # Items live in a SharedCatalog, so every worker reads and changes the
+    # same catalog. Carts stay in the memory of the worker that created
+    # them: another worker answers ForeignCart for them. Carts are priced
+    # at the prices of the worker's indexes, and every cart read or write
+    # first refreshes them, so a change any worker makes reaches the carts
+    # of all of them through the catalog's change log.
+
+    def __init__(self, catalog: SharedCatalog) -> None:
+        super().__init__()
+        self.catalog = catalog
+        catalog.on_change = self._reprice
+        queries.use_cart_ids(iter(catalog.new_cart_id, None))
+        # indexing a million items takes over a second, do it before serving
+        catalog.refresh()
+
+    def _cart(self, id: int) -> Cart | None:
+        cart = queries.find_cart(id)
+        if cart is None and 0 <= id < self.catalog.carts():
+            raise ForeignCart(f"cart {id} is not held by this worker")
+        return cart
+
+    def _reprice(self, id: int, old_price: float) -> None:
+        if id in queries.item_carts:
+            queries.propagate_item(self.catalog.indexed(id), old_price)
+
+    async def find_cart(self, id: int) -> Cart | None:
+        self.catalog.refresh()
+        return self._cart(id)
+
+    async def find_carts_page(self, min_price, max_price, min_quantity, max_quantity,
+                              offset=0, limit=10, cursor=None) -> Tuple[List[Cart], str | None]:
+        self.catalog.refresh()
+        return await super().find_carts_page(min_price, max_price, min_quantity, max_quantity, offset, limit, cursor)
+
+    async def add_item(self, cart_id: int, item_id: int) -> Cart:
+        self.catalog.refresh()
+        cart = self._cart(cart_id)
+        if cart is None:
+            raise ValueError(f"cant found cart: {cart_id}")
+        item = self.catalog.indexed(item_id)
+        if item is None:
+            raise ValueError(f"cant found item: {item_id}")
+        return queries.add_item_to_cart(cart, item)
+
+    async def create_item(self, item_request: ItemRequest) -> Item:
+        return self.catalog.create(item_request.name, item_request.price)
+
+    async def find_item(self, id: int) -> Item | None:
+        return self.catalog.get(id)
+
+    async def find_items_page(self, offset, limit, min_price, max_price, show_deleted,
+                              cursor=None) -> Tuple[List[Item], str | None]:
+        return self.catalog.find_page(offset, limit, min_price, max_price, show_deleted, cursor)
+
+    def _changed(self, item: Item | None) -> Item | None:
+        # this worker's carts take the change from the log like everyone's
+        if item is not None:
+            self.catalog.refresh()
+        return item
+
+    async def update_item(self, id: int, item_request: ItemRequest) -> Item | None:
+        return self._changed(self.catalog.update(id, item_request.name, item_request.price))
+
+    async def patch_item(self, id: int, patch_item_request: PatchItemRequest) -> Item | None:
+        # like the memory store, empty values leave a field as it is
+        change = self.catalog.update(id, patch_item_request.name or None, patch_item_request.price or None)
+        return self._changed(change)
+
+    async def delete_item(self, id: int) -> Item | None:
+        return self._changed(self.catalog.delete(id))
+
+    def close(self) -> None:
+        self.catalog.close()
@@ -0,0 +1,371 @@
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from queue import SimpleQueue
+from typing import Any, Callable, List, Tuple
+
+from lecture_2.hw.shop_api.api.item.contracts import ItemRequest, PatchItemRequest
+from lecture_2.hw.shop_api.store.cursors import decode_cursor, encode_cursor
+from lecture_2.hw.shop_api.store.models import Cart, Item, ItemInCart
+from lecture_2.hw.shop_api.store.repository import Repository
+
+READERS = 4
+# sqlite3 compiles each distinct SQL text once per connection and keeps it
+STATEMENT_CACHE = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    price REAL NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS items_price ON items (price, id);
+CREATE INDEX IF NOT EXISTS items_live_price ON items (price, id) WHERE deleted = 0;
+
+CREATE TABLE IF NOT EXISTS carts (
+    id INTEGER PRIMARY KEY,
+    price REAL NOT NULL DEFAULT 0,
+    quantity INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS carts_price ON carts (price, id);
+CREATE INDEX IF NOT EXISTS carts_quantity ON carts (quantity, id);
+
+-- rowid keeps the order lines were added in
+CREATE TABLE IF NOT EXISTS cart_items (
+    cart_id INTEGER NOT NULL REFERENCES carts (id),
+    item_id INTEGER NOT NULL REFERENCES items (id),
+    quantity INTEGER NOT NULL,
+    UNIQUE (cart_id, item_id)
+);
+CREATE INDEX IF NOT EXISTS cart_items_item ON cart_items (item_id);
+"""
+
+ITEM_COLUMNS = "id, name, price, deleted"
+LINE_QUERY = """
+    SELECT ci.cart_id, ci.item_id, i.name, ci.quantity, i.deleted
+    FROM cart_items AS ci JOIN items AS i ON i.id = ci.item_id
+    WHERE ci.cart_id IN ({})
+    ORDER BY ci.rowid
+"""
+REPRICE_CARTS = """
+    UPDATE carts SET price = carts.price + ? * ci.quantity
+    FROM cart_items AS ci
+    WHERE ci.item_id = ? AND ci.cart_id = carts.id
+"""
+
+
+def connect(path: str) -> sqlite3.Connection:
+    # autocommit, transactions are opened explicitly by the writer
+    conn = sqlite3.connect(
+        path, isolation_level=None, check_same_thread=False, cached_statements=STATEMENT_CACHE
+    )
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA busy_timeout = 5000")
+    return conn
+
+
+class ConnectionPool:
+    # sqlite3 calls block, so they run on a thread pool; each call borrows
+    # one of the connections. In WAL mode readers never wait for a writer.
+
+    def __init__(self, path: str, size: int, executor: ThreadPoolExecutor) -> None:
+        self._idle = SimpleQueue[sqlite3.Connection]()
+        self._connections = [connect(path) for _ in range(size)]
+        for conn in self._connections:
+            self._idle.put(conn)
+        self._executor = executor
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._run, func, args)
+
+    def _run(self, func: Callable[..., Any], args: tuple) -> Any:
+        conn = self._idle.get()
+        try:
+            return func(conn, *args)
+        finally:
+            self._idle.put(conn)
+
+    def close(self) -> None:
+        for conn in self._connections:
+            conn.close()
+
+
+class WriteBatcher:
+    # Writes issued while the event loop is busy are committed together:
+    # the first one schedules a flush, everything queued until it runs
+    # shares a single transaction. Each write gets its own savepoint, so a
+    # failing one is rolled back alone and the rest still commit.
+
+    def __init__(self, path: str, executor: ThreadPoolExecutor) -> None:
+        self._conn = connect(path)
+        self._conn.executescript(SCHEMA)
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._pending: list[tuple[Callable[..., Any], tuple, asyncio.Future]] = []
+        self._flushes: set[asyncio.Task] = set()
+        self.batches = 0
+        self.writes = 0
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((func, args, future))
+        if len(self._pending) == 1:
+            loop.call_soon(self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        batch, self._pending = self._pending, []
+        # the commit runs as its own task, a cancelled caller cannot stop it
+        task = asyncio.ensure_future(self._commit(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _commit(self, batch: list) -> None:
+        loop = asyncio.get_running_loop()
+        ops = [(func, args) for func, args, _ in batch]
+        try:
+            outcomes = await loop.run_in_executor(self._executor, self._execute, ops)
+        except Exception as e:
+            outcomes = [(False, e)] * len(batch)
+        for (_, _, future), (ok, value) in zip(batch, outcomes):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _execute(self, ops: list) -> list:
+        with self._lock:
+            conn = self._conn
+            outcomes = []
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for func, args in ops:
+                    conn.execute("SAVEPOINT write")
+                    try:
+                        outcomes.append((True, func(conn, *args)))
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO write")
+                        outcomes.append((False, e))
+                    conn.execute("RELEASE write")
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            self.batches += 1
+            self.writes += len(ops)
+            return outcomes
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def _item(row: tuple) -> Item:
+    return Item(id=row[0], name=row[1], price=row[2], deleted=bool(row[3]))
+
+
+def _select_item(conn: sqlite3.Connection, id: int) -> Item | None:
+    row = conn.execute(f"SELECT {ITEM_COLUMNS} FROM items WHERE id = ?", (id,)).fetchone()
+    return None if row is None else _item(row)
+
+
+def _select_carts(conn: sqlite3.Connection, rows: list) -> List[Cart]:
+    carts = {id: Cart(id=id, price=price, quantity=quantity) for id, price, quantity in rows}
+    if carts:
+        query = LINE_QUERY.format(", ".join("?" * len(carts)))
+        for cart_id, item_id, name, quantity, deleted in conn.execute(query, list(carts)):
+            line = ItemInCart(id=item_id, name=name, quantity=quantity, available=not deleted)
+            carts[cart_id].items.append(line)
+            carts[cart_id].items_by_id[item_id] = line
+    return list(carts.values())
+
+
+def _select_cart(conn: sqlite3.Connection, id: int) -> Cart | None:
+    rows = conn.execute("SELECT id, price, quantity FROM carts WHERE id = ?", (id,)).fetchall()
+    carts = _select_carts(conn, rows)
+    return carts[0] if carts else None
+
+
+def _page(conn: sqlite3.Connection, table: str, columns: str, conditions: list, params: list,
+          order: str, cursor: str | None, offset: int, limit: int) -> Tuple[list, str | None]:
+    # keyset paging on (order key, id), the same cursors as the memory store
+    after = decode_cursor(cursor, order)
+    if after is not None:
+        if order == "id":
+            conditions.append("id > ?")
+            params.append(after[1])
+        else:
+            conditions.append(f"({order}, id) > (?, ?)")
+            params += after
+    order_by = "id" if order == "id" else f"{order}, id"
+    where = " AND ".join(conditions) or "1"
+    rows = conn.execute(
+        f"SELECT {columns} FROM {table} WHERE {where} ORDER BY {order_by} LIMIT ? OFFSET ?",
+        [*params, limit + 1, offset],
+    ).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        key = rows[limit - 1][columns.split(", ").index(order)]
+        next_cursor = encode_cursor(order, (key, rows[limit - 1][0]))
+    return rows[:limit], next_cursor
+
+
+def _find_items_page(conn, offset, limit, min_price, max_price, show_deleted, cursor):
+    conditions, params = [], []
+    if min_price is None and max_price is None:
+        order = "id"
+    else:
+        order = "price"
+    if min_price is not None:
+        conditions.append("price >= ?")
+        params.append(min_price)
+    if max_price is not None:
+        conditions.append("price <= ?")
+        params.append(max_price)
+    if not show_deleted:
+        conditions.append("deleted = 0")
+    rows, next_cursor = _page(conn, "items", ITEM_COLUMNS, conditions, params, order, cursor, offset, limit)
+    return [_item(row) for row in rows], next_cursor
+
+
+def _find_carts_page(conn, min_price, max_price, min_quantity, max_quantity, offset, limit, cursor):
+    conditions, params = [], []
+    bounds = [
+        ("price >= ?", min_price), ("price <= ?", max_price),
+        ("quantity >= ?", min_quantity), ("quantity <= ?", max_quantity),
+    ]
+    for condition, value in bounds:
+        if value is not None:
+            conditions.append(condition)
+            params.append(value)
+    if min_price is not None or max_price is not None:
+        order = "price"
+    elif min_quantity is not None or max_quantity is not None:
+        order = "quantity"
+    else:
+        order = "id"
+    rows, next_cursor = _page(
+        conn, "carts", "id, price, quantity", conditions, params, order, cursor, offset, limit
+    )
+    return _select_carts(conn, rows), next_cursor
+
+
+def _add_cart(conn: sqlite3.Connection) -> Cart:
+    (id,) = conn.execute("INSERT INTO carts DEFAULT VALUES RETURNING id").fetchone()
+    return Cart(id=id)
+
+
+def _add_item(conn: sqlite3.Connection, cart_id: int, item_id: int) -> Cart:
+    if conn.execute("SELECT 1 FROM carts WHERE id = ?", (cart_id,)).fetchone() is None:
+        raise ValueError(f"cant found cart: {cart_id}")
+    item = _select_item(conn, item_id)
+    if item is None:
+        raise ValueError(f"cant found item: {item_id}")
+
+    conn.execute(
+        "INSERT INTO cart_items (cart_id, item_id, quantity) VALUES (?, ?, 1) "
+        "ON CONFLICT (cart_id, item_id) DO UPDATE SET quantity = quantity + 1",
+        (cart_id, item_id),
+    )
+    # deleted items stay in the cart but are not paid for
+    if item.deleted:
+        conn.execute("UPDATE carts SET quantity = quantity + 1 WHERE id = ?", (cart_id,))
+    else:
+        conn.execute(
+            "UPDATE carts SET price = price + ?, quantity = quantity + 1 WHERE id = ?",
+            (item.price, cart_id),
+        )
+    return _select_cart(conn, cart_id)
+
+
+def _create_item(conn: sqlite3.Connection, name: str, price: float) -> Item:
+    row = conn.execute(
+        f"INSERT INTO items (name, price) VALUES (?, ?) RETURNING {ITEM_COLUMNS}", (name, price)
+    ).fetchone()
+    return _item(row)
+
+
+def _update_item(conn: sqlite3.Connection, id: int, name: str | None, price: float | None) -> Item | None:
+    item = _select_item(conn, id)
+    if not item or item.deleted:
+        return None
+    if price is not None and price != item.price:
+        conn.execute(REPRICE_CARTS, (price - item.price, id))
+        item.price = price
+    if name is not None:
+        item.name = name
+    conn.execute("UPDATE items SET name = ?, price = ? WHERE id = ?", (item.name, item.price, id))
+    return item
+
+
+def _delete_item(conn: sqlite3.Connection, id: int) -> Item | None:
+    item = _select_item(conn, id)
+    if not item:
+        return None
+    if not item.deleted:
+        conn.execute(REPRICE_CARTS, (-item.price, id))
+        conn.execute("UPDATE items SET deleted = 1 WHERE id = ?", (id,))
+        item.deleted = True
+    return item
+
+
+class SqliteRepository(Repository):
+    # The shop in one SQLite file: it survives restarts and every uvicorn
+    # worker opening the same file sees the same data. Line names and
+    # availability are joined from items, cart totals are kept in carts.
+
+    def __init__(self, path: str, readers: int = READERS) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=readers + 1, thread_name_prefix="sqlite")
+        self.writer = WriteBatcher(path, self._executor)
+        self.readers = ConnectionPool(path, readers, self._executor)
+
+    async def add_cart(self) -> Cart:
+        return await self.writer.run(_add_cart)
+
+    async def find_cart(self, id: int) -> Cart | None:
+        return await self.readers.run(_select_cart, id)
+
+    async def find_carts_page(self, min_price, max_price, min_quantity, max_quantity,
+                              offset=0, limit=10, cursor=None) -> Tuple[List[Cart], str | None]:
+        return await self.readers.run(
+            _find_carts_page, min_price, max_price, min_quantity, max_quantity, offset, limit, cursor
+        )
+
+    async def add_item(self, cart_id: int, item_id: int) -> Cart:
+        return await self.writer.run(_add_item, cart_id, item_id)
+
+    async def create_item(self, item_request: ItemRequest) -> Item:
+        return await self.writer.run(_create_item, item_request.name, item_request.price)
+
+    async def find_item(self, id: int) -> Item | None:
+        return await self.readers.run(_select_item, id)
+
+    async def find_items_page(self, offset, limit, min_price, max_price, show_deleted,
+                              cursor=None) -> Tuple[List[Item], str | None]:
+        return await self.readers.run(
+            _find_items_page, offset, limit, min_price, max_price, show_deleted, cursor
+        )
+
+    async def update_item(self, id: int, item_request: ItemRequest) -> Item | None:
+        return await self.writer.run(_update_item, id, item_request.name, item_request.price)
+
+    async def patch_item(self, id: int, patch_item_request: PatchItemRequest) -> Item | None:
+        # like the memory store, empty values leave a field as it is
+        return await self.writer.run(
+            _update_item, id, patch_item_request.name or None, patch_item_request.price or None
+        )
+
+    async def delete_item(self, id: int) -> Item | None:
+        return await self.writer.run(_delete_item, id)
+
+    def close(self) -> None:
+        self.readers.close()
+        self.writer.close()
+        self._executor.shutdown(wait=True)
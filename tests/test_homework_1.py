@@ -1,10 +1,46 @@
+import asyncio
+import base64
+import json as json_module
+import math
+import statistics
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
+from random import Random
 from typing import Any
+from urllib.parse import parse_qs
 
 import pytest
 from async_asgi_testclient import TestClient
 
-from lecture_1.hw.math_plain_asgi import app
+from lecture_1 import math_example
+from lecture_1.hw import batch as batch_engine
+from lecture_1.hw import factorial as factorial_engine
+from lecture_1.hw import fibonacci as fibonacci_engine
+from lecture_1.hw import math_plain_asgi, modular
+from lecture_1.hw import primes as primes_engine
+from lecture_1.hw import query_string as query_string_module
+from lecture_1.hw import stats as stats_module
+from lecture_1.hw.math_plain_asgi import app, response_cache
+from lecture_1.hw.offload import (
+    ClientDisconnected,
+    OffloadTimeout,
+    Offloader,
+    Overloaded,
+)
+from lecture_1.hw.query_string import QueryParams, TooManyParams
+from lecture_1.hw.response_cache import ResponseCache
+from lecture_1.hw.result_encoding import decimal_bytes, decimal_digits
+from lecture_1.hw.routing import (
+    InvalidPathParam,
+    MethodNotAllowed,
+    RouteNotFound,
+    Router,
+)
+from lecture_1.hw.single_flight import SingleFlight
+from lecture_1.hw.streaming import MeanAccumulator, NumberArrayParser
 
 
 @pytest.mark.asyncio
@@ -26,6 +62,23 @@ async def test_not_found(method: str, path: str):
         assert response.status_code == HTTPStatus.NOT_FOUND
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("method", "path"),
+    [
+        ("POST", "/factorial"),
+        ("DELETE", "/fibonacci/10"),
+        ("PUT", "/mean"),
+    ],
+)
+async def test_method_not_allowed(method: str, path: str):
+    async with TestClient(app) as client:
+        response = await client.open(path, method=method)
+
+    assert response.status_code == HTTPStatus.METHOD_NOT_ALLOWED
+    assert response.headers["allow"] == "GET"
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize(
     ("query", "status_code"),
@@ -38,6 +91,8 @@ async def test_not_found(method: str, path: str):
         ({"n": 0}, HTTPStatus.OK),
         ({"n": 1}, HTTPStatus.OK),
         ({"n": 10}, HTTPStatus.OK),
+        ({"n": 300_000}, HTTPStatus.BAD_REQUEST),
+        ({"n": 10**100}, HTTPStatus.BAD_REQUEST),
     ],
 )
 async def test_factorial(query: dict[str, Any], status_code: int):
@@ -58,6 +113,11 @@ async def test_factorial(query: dict[str, Any], status_code: int):
         ("/0", HTTPStatus.OK),
         ("/1", HTTPStatus.OK),
         ("/10", HTTPStatus.OK),
+        ("/10000000", HTTPStatus.BAD_REQUEST),
+        (f"/{10**100}", HTTPStatus.BAD_REQUEST),
+        (f"/{10**100}?mod=1000", HTTPStatus.OK),
+        (f"/{10**100}?mod={2**4096}", HTTPStatus.BAD_REQUEST),
+        (f"/{10**100}?mod={2**4096 - 1}", HTTPStatus.OK),
     ],
 )
 async def test_fibonacci(params: str, status_code: int):
@@ -69,6 +129,26 @@ async def test_fibonacci(params: str, status_code: int):
         assert "result" in response.json()
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("query", "status_code", "result"),
+    [
+        ({"mod": 1000}, HTTPStatus.OK, 25),
+        ({"mod": 1}, HTTPStatus.OK, 0),
+        ({"mod": 0}, HTTPStatus.BAD_REQUEST, None),
+        ({"mod": "lol"}, HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        ({}, HTTPStatus.OK, 12586269025),
+    ],
+)
+async def test_fibonacci_mod(query: dict[str, Any], status_code: int, result: int | None):
+    async with TestClient(app) as client:
+        response = await client.get("/fibonacci/50", query_string=query)
+
+    assert response.status_code == status_code
+    if status_code == HTTPStatus.OK:
+        assert response.json()["result"] == result
+
+
 @pytest.mark.asyncio()
 @pytest.mark.parametrize(
     ("json", "status_code"),
@@ -87,3 +167,955 @@ async def test_mean(json: dict[str, Any] | None, status_code: int):
     assert response.status_code == status_code
     if status_code == HTTPStatus.OK:
         assert "result" in response.json()
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 255, 256, 1000, 1100, 1250, 3000])
+def test_factorial_engine(n: int):
+    assert factorial_engine.factorial(n) == math.factorial(n)
+
+
+def _int_bytes(value: int) -> int:
+    return (value.bit_length() + 7) // 8
+
+
+def test_factorial_engine_cache_is_bounded():
+    cache = factorial_engine.FactorialCache(
+        max_bytes=_int_bytes(math.factorial(400)) + _int_bytes(math.factorial(500))
+    )
+    for n in (300, 400, 500):
+        cache.put(n, math.factorial(n))
+
+    assert len(cache) == 2
+    assert cache.size == cache.max_bytes
+    assert cache.get(300) is None
+    assert cache.floor(450) == (400, math.factorial(400))
+    assert cache.floor(299) is None
+
+    # one large value pushes out several small ones, a too large one is not kept
+    cache.put(600, math.factorial(600))
+    assert len(cache) == 1
+    cache.put(2000, math.factorial(2000))
+    assert cache.get(2000) is None
+    assert cache.size == _int_bytes(math.factorial(600))
+
+
+@pytest.mark.parametrize(("lo", "hi"), [(1, 0), (5, 5), (3, 17), (100, 1000)])
+def test_product_range(lo: int, hi: int):
+    assert factorial_engine.product_range(lo, hi) == math.prod(range(lo, hi + 1))
+
+
+def _fibonacci_loop(n: int) -> int:
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 3, 10, 99, 100, 101, 1000, 4097])
+def test_fibonacci_engine(n: int):
+    assert fibonacci_engine.fibonacci(n) == _fibonacci_loop(n)
+
+
+@pytest.mark.parametrize(("n", "mod"), [(0, 7), (1, 1), (10, 7), (1000, 10**9 + 7)])
+def test_fibonacci_engine_mod(n: int, mod: int):
+    assert fibonacci_engine.fibonacci(n, mod) == _fibonacci_loop(n) % mod
+
+
+async def call_app(
+    method: str,
+    path: str,
+    chunks: list[bytes],
+    query_string: bytes = b"",
+    headers: list[tuple[bytes, bytes]] | None = None,
+) -> tuple[int, dict[str, Any]]:
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks or [b""])
+    ]
+    sent = []
+
+    async def receive():
+        if not messages:
+            await asyncio.Event().wait()
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query_string,
+        "headers": headers or [],
+    }
+    await app(scope, receive, send)
+    body = b"".join(message.get("body", b"") for message in sent[1:])
+    return sent[0]["status"], json_module.loads(body)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("body", "status_code"),
+    [
+        (b"[1, 2.5, -3e2, 4]", HTTPStatus.OK),
+        (b" [ ] ", HTTPStatus.BAD_REQUEST),
+        (b"", HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"null", HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b'{"a": [1]}', HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"[1, 2", HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"[1, 2]]", HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"[1,, 2]", HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"[, 1]", HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"[1, 2,]", HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b'[1, "2"]', HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b'[1, "a,b", 2]', HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"[1, [2], 3]", HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"[1, null]", HTTPStatus.UNPROCESSABLE_ENTITY),
+    ],
+)
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1024])
+async def test_mean_chunked(body: bytes, status_code: int, chunk_size: int):
+    chunks = [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)]
+    status, response = await call_app("GET", "/mean", chunks)
+
+    assert status == status_code
+    if status_code == HTTPStatus.OK:
+        assert response["result"] == pytest.approx(-73.125)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("body", "status_code"),
+    [
+        (struct.pack("<4d", 1, 2.5, -300, 4), HTTPStatus.OK),
+        (b"", HTTPStatus.BAD_REQUEST),
+        (struct.pack("<2d", 1, 2) + b"\x00", HTTPStatus.UNPROCESSABLE_ENTITY),
+    ],
+)
+@pytest.mark.parametrize("chunk_size", [1, 3, 8, 1024])
+async def test_mean_float64(body: bytes, status_code: int, chunk_size: int):
+    chunks = [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)]
+    headers = [(b"content-type", b"application/octet-stream")]
+    status, response = await call_app("GET", "/mean", chunks, headers=headers)
+
+    assert status == status_code
+    if status_code == HTTPStatus.OK:
+        assert response["result"] == pytest.approx(-73.125)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("body", "status_code", "result"),
+    [
+        (b"[1e308, 1e308]", HTTPStatus.OK, 1e308),
+        (b"[1e308, 1e308, -1e308, 1]", HTTPStatus.OK, 2.5e307),
+        (b"[1.7e308, 1.7e308, 1.7e308, 1.7e308]", HTTPStatus.OK, 1.7e308),
+        (b"[1, " + b"1" * 400 + b"]", HTTPStatus.UNPROCESSABLE_ENTITY, None),
+    ],
+)
+@pytest.mark.parametrize("chunk_size", [8, 1024])
+async def test_mean_sum_beyond_float_range(body: bytes, status_code: int, result, chunk_size: int):
+    # the chunk size also splits the sum between batches
+    chunks = [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)]
+    status, response = await call_app("GET", "/mean", chunks)
+
+    assert status == status_code
+    if status_code == HTTPStatus.OK:
+        assert response["result"] == pytest.approx(result)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("path", ["/mean", "/stats"])
+@pytest.mark.parametrize(
+    ("body", "content_type"),
+    [
+        (b"[Infinity]", b"application/json"),
+        (b"[1, -Infinity]", b"application/json"),
+        (b"[Infinity, -Infinity]", b"application/json"),
+        (b"[NaN, 1]", b"application/json"),
+        (struct.pack("<2d", 1, math.inf), b"application/octet-stream"),
+        (struct.pack("<2d", math.nan, 1), b"application/octet-stream"),
+    ],
+)
+async def test_non_finite_elements_are_rejected(path: str, body: bytes, content_type: bytes):
+    status, response = await call_app("GET", path, [body], headers=[(b"content-type", content_type)])
+
+    assert status == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert response == {"error": "elements must be finite"}
+
+
+@pytest.fixture(params=["numpy", "python"])
+def stats_backend(request, monkeypatch) -> str:
+    if request.param == "python":
+        monkeypatch.setattr(stats_module, "numpy", None)
+    elif stats_module.numpy is None:
+        pytest.skip("numpy is not installed")
+    return request.param
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("content_type", [b"application/json", b"application/octet-stream"])
+async def test_stats(stats_backend: str, content_type: bytes):
+    random = Random(42)
+    values = [random.gauss(10, 3) for _ in range(5000)] + [0.0, -1.5]
+    if content_type == b"application/json":
+        body = json_module.dumps(values).encode()
+    else:
+        body = struct.pack(f"<{len(values)}d", *values)
+    chunks = [body[i : i + 4096] for i in range(0, len(body), 4096)]
+
+    status, response = await call_app(
+        "GET", "/stats", chunks, headers=[(b"content-type", content_type)]
+    )
+
+    assert status == HTTPStatus.OK
+    assert response["count"] == len(values)
+    assert response["mean"] == pytest.approx(statistics.fmean(values))
+    assert response["variance"] == pytest.approx(statistics.pvariance(values))
+    assert response["stddev"] == pytest.approx(statistics.pstdev(values))
+    assert response["min"] == min(values)
+    assert response["max"] == max(values)
+    ordered = sorted(values)
+    for p, estimate in response["percentiles"].items():
+        exact = ordered[int(int(p) / 100 * (len(values) - 1))]
+        assert estimate == pytest.approx(exact, rel=stats_module.RELATIVE_ACCURACY)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("body", "status_code"),
+    [
+        (b"[]", HTTPStatus.BAD_REQUEST),
+        (b"[1, true]", HTTPStatus.OK),
+        (b'[1, "2"]', HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"[1, NaN]", HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"[1, 2", HTTPStatus.UNPROCESSABLE_ENTITY),
+    ],
+)
+async def test_stats_errors(stats_backend: str, body: bytes, status_code: int):
+    status, _ = await call_app("GET", "/stats", [body])
+
+    assert status == status_code
+
+
+@pytest.mark.asyncio
+async def test_stats_sum_beyond_float_range(stats_backend: str):
+    status, response = await call_app("GET", "/stats", [b"[1e308, 1e308, 1e308]"])
+
+    assert status == HTTPStatus.OK
+    assert response["mean"] == pytest.approx(1e308)
+    assert response["variance"] == 0.0
+
+
+def test_number_array_parser_keeps_only_tail():
+    parser = NumberArrayParser()
+    accumulator = MeanAccumulator()
+    accumulator.add(parser.feed(b"[" + b"0.1," * 100_000))
+    for _ in range(9):
+        accumulator.add(parser.feed(b"0.1," * 100_000))
+    accumulator.add(parser.feed(b"0.1]"))
+    parser.close()
+
+    assert accumulator.count == 1_000_001
+    assert accumulator.mean() == pytest.approx(0.1, rel=1e-15)
+
+
+async def _endpoint(scope, receive, params):
+    return 200, ""
+
+
+def test_router_resolve():
+    router = Router()
+    router.add("GET", "/items", _endpoint)
+    router.add("POST", "/items", _endpoint)
+    router.add("GET", "/items/{item_id:int}", _endpoint)
+    router.add("GET", "/items/latest", _endpoint)
+    router.add("GET", "/items/{item_id:int}/tags/{tag}", _endpoint)
+
+    assert router.resolve("GET", "/items") == (_endpoint, {})
+    assert router.resolve("GET", "/items/7") == (_endpoint, {"item_id": 7})
+    assert router.resolve("GET", "/items/latest") == (_endpoint, {})
+    assert router.resolve("GET", "/items/7/tags/new") == (
+        _endpoint,
+        {"item_id": 7, "tag": "new"},
+    )
+    with pytest.raises(RouteNotFound):
+        router.resolve("GET", "/items/7/tags")
+    with pytest.raises(MethodNotAllowed) as e:
+        router.resolve("DELETE", "/items")
+    assert e.value.allowed == ["GET", "POST"]
+    with pytest.raises(InvalidPathParam):
+        router.resolve("GET", "/items/lol")
+
+
+@pytest.mark.asyncio
+async def test_response_cache_metrics():
+    response_cache.clear()
+    before = response_cache.metrics()
+
+    for n in ("12", "12", "012"):
+        status, response = await call_app("GET", "/factorial", [], f"n={n}".encode())
+        assert status == HTTPStatus.OK
+        assert response["result"] == math.factorial(12)
+    await call_app("GET", "/fibonacci/12", [])
+    await call_app("GET", "/fibonacci/12", [], b"mod=7")
+
+    status, metrics = await call_app("GET", "/metrics", [])
+    assert status == HTTPStatus.OK
+    cache_metrics = metrics["response_cache"]
+    assert cache_metrics["hits"] - before["hits"] == 2
+    assert cache_metrics["misses"] - before["misses"] == 3
+    assert cache_metrics["entries"] == 3
+
+
+def test_response_cache_evicts_by_bytes():
+    cache = ResponseCache(max_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    cache.put("huge", b"x" * 11)
+    assert cache.get("a") == b"1234"
+    cache.put("c", b"1234")
+
+    assert cache.get("b") is None
+    assert cache.get("huge") is None
+    assert cache.metrics() == {
+        "hits": 1,
+        "misses": 2,
+        "evictions": 1,
+        "entries": 2,
+        "bytes": 8,
+        "max_bytes": 10,
+    }
+
+
+@pytest.mark.asyncio
+async def test_offloaded_calculations(monkeypatch):
+    monkeypatch.setattr(math_plain_asgi, "FACTORIAL_OFFLOAD_N", 20)
+    monkeypatch.setattr(math_plain_asgi, "FIBONACCI_OFFLOAD_N", 20)
+    response_cache.clear()
+    completed = math_plain_asgi.offloader.completed
+
+    factorial = call_app("GET", "/factorial", [], b"n=100")
+    fibonacci = call_app("GET", "/fibonacci/100", [])
+    small = call_app("GET", "/factorial", [], b"n=10")
+    # a small n, but a wide modulus
+    wide_mod = call_app("GET", f"/fibonacci/{10**100}", [], f"mod={10**300 + 7}".encode())
+    narrow_mod = call_app("GET", f"/fibonacci/{10**100}", [], b"mod=1000000007")
+    results = await asyncio.gather(factorial, fibonacci, small, wide_mod, narrow_mod)
+
+    assert results == [
+        (HTTPStatus.OK, {"result": math.factorial(100)}),
+        (HTTPStatus.OK, {"result": _fibonacci_loop(100)}),
+        (HTTPStatus.OK, {"result": math.factorial(10)}),
+        (HTTPStatus.OK, {"result": fibonacci_engine.fibonacci(10**100, 10**300 + 7)}),
+        (HTTPStatus.OK, {"result": fibonacci_engine.fibonacci(10**100, 1000000007)}),
+    ]
+    assert math_plain_asgi.offloader.completed - completed == 3
+
+
+@pytest.mark.asyncio
+async def test_offloader_limits():
+    offloader = Offloader(max_workers=1, max_queue=1, timeout=0.5)
+    try:
+        assert await offloader.run(math.factorial, 5) == 120
+
+        running = asyncio.ensure_future(offloader.run(time.sleep, 0.05))
+        queued = asyncio.ensure_future(offloader.run(time.sleep, 0.05))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await offloader.run(math.factorial, 5)
+        await asyncio.gather(running, queued)
+
+        with pytest.raises(OffloadTimeout):
+            await offloader.run(time.sleep, 2)
+
+        async def disconnect():
+            return {"type": "http.disconnect"}
+
+        with pytest.raises(ClientDisconnected):
+            await offloader.run(time.sleep, 1, receive=disconnect)
+    finally:
+        offloader.shutdown()
+
+    assert offloader.metrics()["timeouts"] == 1
+    assert offloader.metrics()["rejected"] == 1
+    assert offloader.metrics()["cancelled"] == 1
+
+
+@pytest.mark.asyncio
+async def test_identical_requests_are_coalesced(monkeypatch):
+    monkeypatch.setattr(math_plain_asgi, "FACTORIAL_OFFLOAD_N", 20)
+    response_cache.clear()
+    completed = math_plain_asgi.offloader.completed
+    coalesced = math_plain_asgi.single_flight.coalesced
+
+    results = await asyncio.gather(
+        *(call_app("GET", "/factorial", [], b"n=321") for _ in range(10))
+    )
+
+    assert results == [(HTTPStatus.OK, {"result": math.factorial(321)})] * 10
+    assert math_plain_asgi.offloader.completed - completed == 1
+    assert math_plain_asgi.single_flight.coalesced - coalesced == 9
+
+
+@pytest.mark.asyncio
+async def test_single_flight_survives_one_disconnect():
+    single_flight = SingleFlight()
+    started = 0
+
+    async def compute():
+        nonlocal started
+        started += 1
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def disconnect():
+        return {"type": "http.disconnect"}
+
+    async def stay_connected():
+        await asyncio.Event().wait()
+
+    results = await asyncio.gather(
+        single_flight.do("key", compute, disconnect),
+        single_flight.do("key", compute, stay_connected),
+        return_exceptions=True,
+    )
+
+    assert isinstance(results[0], ClientDisconnected)
+    assert results[1] == "done"
+    assert started == 1
+    assert single_flight.metrics() == {
+        "calls": 1,
+        "coalesced": 1,
+        "cancelled": 0,
+        "in_flight": 0,
+    }
+
+    with pytest.raises(ClientDisconnected):
+        await single_flight.do("key", compute, disconnect)
+    assert single_flight.metrics()["cancelled"] == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("jobs", "status_code"),
+    [
+        ([{"op": "fibonacci", "n": n} for n in range(0, 500, 3)], HTTPStatus.OK),
+        (
+            [
+                {"op": "factorial", "n": 300},
+                {"op": "fibonacci", "n": 90},
+                {"op": "factorial", "n": 7},
+                {"op": "factorial", "n": 300},
+            ],
+            HTTPStatus.OK,
+        ),
+        ([], HTTPStatus.BAD_REQUEST),
+        ([{"op": "factorial", "n": -1}], HTTPStatus.BAD_REQUEST),
+        ({"op": "factorial", "n": 1}, HTTPStatus.UNPROCESSABLE_ENTITY),
+        ([{"op": "mean", "n": 1}], HTTPStatus.UNPROCESSABLE_ENTITY),
+        ([{"op": "factorial", "n": "1"}], HTTPStatus.UNPROCESSABLE_ENTITY),
+        ([{"op": "factorial"}], HTTPStatus.UNPROCESSABLE_ENTITY),
+        ([{"op": "factorial", "n": 1}] * 10_001, HTTPStatus.UNPROCESSABLE_ENTITY),
+        ([{"op": "fibonacci", "n": 500_000}] * 20, HTTPStatus.BAD_REQUEST),
+    ],
+)
+async def test_batch(jobs: Any, status_code: int):
+    body = json_module.dumps(jobs).encode()
+    status, response = await call_app("POST", "/batch", [body])
+
+    assert status == status_code
+    if status_code == HTTPStatus.OK:
+        assert response["results"] == [
+            math.factorial(job["n"]) if job["op"] == "factorial" else _fibonacci_loop(job["n"])
+            for job in jobs
+        ]
+
+
+@pytest.mark.asyncio
+async def test_batch_offloads_on_total_size():
+    completed = math_plain_asgi.offloader.completed
+    small = json_module.dumps([{"op": "fibonacci", "n": 10_000}] * 2).encode()
+    # every job is small, together they are not
+    large = json_module.dumps([{"op": "fibonacci", "n": 10_000 + i} for i in range(20)]).encode()
+
+    assert (await call_app("POST", "/batch", [small]))[0] == HTTPStatus.OK
+    assert math_plain_asgi.offloader.completed == completed
+    status, response = await call_app("POST", "/batch", [large])
+    assert status == HTTPStatus.OK
+    assert response["results"][-1] == _fibonacci_loop(10_019)
+    assert math_plain_asgi.offloader.completed == completed + 1
+
+
+def test_batch_sweeps():
+    ns = [40, 3, 1000, 41, 3, 0, 700]
+
+    assert batch_engine.factorial_sweep(ns) == {n: math.factorial(n) for n in ns}
+    assert batch_engine.fibonacci_sweep(ns) == {n: _fibonacci_loop(n) for n in ns}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("encoding", "decode"),
+    [
+        ("decimal", None),
+        ("hex", lambda result: int(result, 16)),
+        ("base64", lambda result: int.from_bytes(base64.b64decode(result), "big")),
+    ],
+)
+@pytest.mark.parametrize("n", [0, 25, 3000])
+async def test_factorial_encoding(encoding: str, decode, n: int):
+    async with TestClient(app) as client:
+        response = await client.get(
+            "/factorial", query_string={"n": n, "encoding": encoding}
+        )
+
+    assert response.status_code == HTTPStatus.OK
+    result = json_module.loads(response.content, parse_int=str)["result"]
+    if encoding == "decimal":
+        assert result == decimal_bytes(math.factorial(n)).decode()
+    else:
+        assert decode(result) == math.factorial(n)
+
+
+@pytest.mark.asyncio
+async def test_fibonacci_digits_summary():
+    status, response = await call_app("GET", "/fibonacci/10000", [], b"encoding=digits")
+
+    assert status == HTTPStatus.OK
+    assert response["result"]["digits"] == 2090
+    assert response["result"]["log10"] == pytest.approx(2089.5, abs=1)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("method", "path", "body"),
+    [
+        ("GET", "/factorial?n=5", b""),
+        ("GET", "/fibonacci/5", b""),
+        ("POST", "/batch", b'[{"op": "factorial", "n": 5}]'),
+    ],
+)
+async def test_invalid_encoding(method: str, path: str, body: bytes):
+    path, _, query = path.partition("?")
+    query = (query + "&" if query else "") + "encoding=octal"
+    status, response = await call_app(method, path, [body], query.encode())
+
+    assert status == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_large_result_is_streamed():
+    sent = []
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        if not messages:
+            await asyncio.Event().wait()
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/factorial", "query_string": b"n=40000"}
+    await app(scope, receive, send)
+
+    chunks = [message for message in sent if message["type"] == "http.response.body"]
+    assert len(chunks) > 1
+    assert all(message["more_body"] for message in chunks[:-1])
+    assert not chunks[-1]["more_body"]
+    body = b"".join(message["body"] for message in chunks)
+    assert body.startswith(b'{"result": ') and body.endswith(b"}")
+    assert len(body) == len('{"result": }') + decimal_digits(math.factorial(40000))
+
+
+@pytest.mark.parametrize("value", [0, 1, 9, 10, 99, 100, 10**50 - 1, 10**50, 10**400 + 7])
+def test_decimal_digits(value: int):
+    assert decimal_digits(value) == len(str(value))
+
+
+@pytest.mark.asyncio
+async def test_batch_encoding():
+    body = b'[{"op": "factorial", "n": 20}, {"op": "fibonacci", "n": 20}]'
+    status, response = await call_app("POST", "/batch", [body], b"encoding=hex")
+
+    assert status == HTTPStatus.OK
+    assert response["results"] == [format(math.factorial(20), "x"), format(6765, "x")]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("query", "status_code", "result"),
+    [
+        (b"n=20&mod=1000003", HTTPStatus.OK, math.factorial(20) % 1000003),
+        (b"n=10006&mod=10007", HTTPStatus.OK, 10006),
+        (b"n=9990&mod=10007", HTTPStatus.OK, math.factorial(9990) % 10007),
+        (b"n=50&mod=50", HTTPStatus.OK, 0),
+        (b"n=30&mod=1", HTTPStatus.OK, 0),
+        (b"n=5&mod=0", HTTPStatus.BAD_REQUEST, None),
+        (b"n=5&mod=lol", HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        (b"n=10000000000000&mod=100000000000000", HTTPStatus.BAD_REQUEST, None),
+        # beyond int64 products the plain python loop runs, with its lower limit
+        (b"n=500000000&mod=10000000000", HTTPStatus.BAD_REQUEST, None),
+        (b"n=20&mod=" + str(10**300).encode(), HTTPStatus.OK, math.factorial(20)),
+        # 1287836182261 * 2575672364521, where is_prime is no longer reliable
+        (
+            b"n=3317044064679887385961980&mod=3317044064679887385961981",
+            HTTPStatus.BAD_REQUEST,
+            None,
+        ),
+    ],
+)
+async def test_factorial_mod(query: bytes, status_code: int, result: int | None):
+    status, response = await call_app("GET", "/factorial", [], query)
+
+    assert status == status_code
+    if status_code == HTTPStatus.OK:
+        assert response["result"] == result
+
+
+@pytest.fixture(params=["numpy", "python"])
+def modular_backend(request, monkeypatch) -> str:
+    monkeypatch.setattr(modular, "SEGMENT", 64)
+    modular.clear_checkpoints()
+    if request.param == "python":
+        monkeypatch.setattr(modular, "numpy", None)
+    elif modular.numpy is None:
+        pytest.skip("numpy is not installed")
+    yield request.param
+    modular.clear_checkpoints()
+
+
+@pytest.mark.parametrize("m", [1, 2, 4, 97, 100, 1009, 4096])
+def test_factorial_mod_matches_math(modular_backend: str, m: int):
+    for n in list(range(0, 200)) + [m - 2, m - 1, m, m + 1]:
+        if n >= 0:
+            assert modular.factorial_mod(n, m) == math.factorial(n) % m, n
+
+
+def test_terms_limit_follows_the_backend(modular_backend: str):
+    numpy_limit = modular.NUMPY_MAX_TERMS if modular_backend == "numpy" else modular.MAX_TERMS
+
+    assert modular.terms_limit(10**9 + 7) == numpy_limit
+    assert modular.terms_limit(modular.NUMPY_MAX_MODULUS + 2) == modular.MAX_TERMS
+    assert modular.terms_limit(10**300) < modular.MAX_TERMS // 7
+
+
+def test_is_prime():
+    primes = [n for n in range(2, 3000) if all(n % d for d in range(2, int(n**0.5) + 1))]
+
+    assert [n for n in range(3000) if modular.is_prime(n)] == primes
+    assert modular.is_prime(10**9 + 7)
+    assert not modular.is_prime(3215031751)  # strong pseudoprime to bases 2, 3, 5, 7
+
+
+async def run_lifespan(*events: str) -> list[dict[str, Any]]:
+    messages = [{"type": f"lifespan.{event}"} for event in events]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app({"type": "lifespan"}, receive, send)
+    return sent
+
+
+@pytest.mark.asyncio
+async def test_lifespan_warm_up(monkeypatch, caplog):
+    monkeypatch.setenv("MATH_WARMUP_FACTORIAL", "30, 40")
+    monkeypatch.setenv("MATH_WARMUP_FIBONACCI", "50")
+    response_cache.clear()
+    caplog.set_level("INFO", logger=math_plain_asgi.logger.name)
+
+    sent = await run_lifespan("startup", "shutdown")
+
+    assert sent == [
+        {"type": "lifespan.startup.complete"},
+        {"type": "lifespan.shutdown.complete"},
+    ]
+    assert response_cache.metrics()["entries"] == 3
+    assert "warm-up finished in" in caplog.text
+
+    hits = response_cache.hits
+    assert await call_app("GET", "/factorial", [], b"n=40") == (
+        HTTPStatus.OK, {"result": math.factorial(40)}
+    )
+    assert response_cache.hits == hits + 1
+
+
+@pytest.mark.asyncio
+async def test_lifespan_warm_up_more_values_than_workers(monkeypatch):
+    # every value is offloaded, and the pool takes only one call at a time
+    monkeypatch.setenv("MATH_WARMUP_FACTORIAL", "5000, 5001, 5002, 5003")
+    monkeypatch.setattr(math_plain_asgi.offloader, "max_workers", 1)
+    monkeypatch.setattr(math_plain_asgi.offloader, "max_queue", 0)
+    response_cache.clear()
+
+    sent = await run_lifespan("startup", "shutdown")
+
+    assert sent == [
+        {"type": "lifespan.startup.complete"},
+        {"type": "lifespan.shutdown.complete"},
+    ]
+    assert response_cache.metrics()["entries"] == 4
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name, value", [
+    ("MATH_WARMUP_FACTORIAL", "10,ten"),
+    ("MATH_WARMUP_FIBONACCI", "-1"),
+])
+async def test_lifespan_warm_up_failure(monkeypatch, name: str, value: str):
+    monkeypatch.setenv(name, value)
+
+    sent = await run_lifespan("startup")
+
+    assert [message["type"] for message in sent] == ["lifespan.startup.failed"]
+    assert sent[0]["message"]
+
+
+def _primes_naive(lo: int, hi: int) -> list[int]:
+    return [n for n in range(max(lo, 2), hi + 1) if all(n % d for d in range(2, math.isqrt(n) + 1))]
+
+
+@pytest.mark.parametrize(
+    ("lo", "hi"),
+    [(0, 0), (0, 2), (0, 3), (1, 1), (0, 1000), (63, 65), (64, 64), (127, 129), (500, 2000)],
+)
+def test_primes_engine(monkeypatch, lo: int, hi: int):
+    monkeypatch.setattr(primes_engine, "SEGMENT", 64)
+    primes_engine.clear_segments()
+    try:
+        assert primes_engine.primes(lo, hi) == _primes_naive(lo, hi)
+        # the second pass is served from cached segments
+        assert primes_engine.primes(lo, hi) == _primes_naive(lo, hi)
+    finally:
+        primes_engine.clear_segments()
+
+
+def test_primes_engine_large_range():
+    lo = 10**10
+    found = primes_engine.primes(lo, lo + 1000)
+
+    assert found == [n for n in range(lo, lo + 1001) if modular.is_prime(n)]
+
+
+def test_sieve_steps(monkeypatch):
+    monkeypatch.setattr(primes_engine, "SEGMENT", 64)
+    primes_engine.clear_segments()
+    try:
+        # the same span costs more higher up
+        assert primes_engine.sieve_steps(10**12 - 100, 10**12) > 100 * primes_engine.sieve_steps(900, 1000)
+        primes_engine.primes(900, 1000)
+        assert primes_engine.sieve_steps(900, 1000) == 0
+    finally:
+        primes_engine.clear_segments()
+
+
+def test_factorize_trial_divides_small_primes_only():
+    primes_engine.base_primes(10**6)
+    divided = []
+
+    class Recorder(int):
+        def __mod__(self, p):
+            divided.append(p)
+            return int(self) % p
+
+    # a prime far above the trial bound squared walks every trial prime
+    assert primes_engine.factorize(Recorder(10**12 + 39)) == [10**12 + 39]
+    assert divided and max(divided) < primes_engine._TRIAL_PRIMES
+
+
+@pytest.mark.parametrize(
+    "n",
+    [1, 2, 12, 97, 1024, 600851475143, 999983 * 1000003, 1000003**2, 2**61 - 1,
+     (10**9 + 7) * (10**9 + 9) * 3**5, 2**64 + 1],
+)
+def test_factorize_engine(n: int):
+    factors = primes_engine.factorize(n)
+
+    assert math.prod(factors) == n
+    assert factors == sorted(factors)
+    assert all(modular.is_prime(p) for p in factors)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("query", "status_code", "result"),
+    [
+        (b"lo=10&hi=30", HTTPStatus.OK, [11, 13, 17, 19, 23, 29]),
+        (b"hi=10", HTTPStatus.OK, [2, 3, 5, 7]),
+        (b"lo=24&hi=28", HTTPStatus.OK, []),
+        (b"lo=10", HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        (b"lo=a&hi=10", HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        (b"lo=10&hi=5", HTTPStatus.BAD_REQUEST, None),
+        (b"lo=-1&hi=5", HTTPStatus.BAD_REQUEST, None),
+        (b"lo=0&hi=100000000", HTTPStatus.BAD_REQUEST, None),
+    ],
+)
+async def test_primes(query: bytes, status_code: int, result: list[int] | None):
+    status, response = await call_app("GET", "/primes", [], query)
+
+    assert status == status_code
+    if status_code == HTTPStatus.OK:
+        assert response["result"] == result
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("path", "status_code", "result"),
+    [
+        ("/factorize/360", HTTPStatus.OK, [2, 2, 2, 3, 3, 5]),
+        ("/factorize/1", HTTPStatus.OK, []),
+        ("/factorize/1000000016000000063", HTTPStatus.OK, [1000000007, 1000000009]),
+        ("/factorize/0", HTTPStatus.BAD_REQUEST, None),
+        ("/factorize/" + "9" * 30, HTTPStatus.BAD_REQUEST, None),
+        ("/factorize/lol", HTTPStatus.UNPROCESSABLE_ENTITY, None),
+    ],
+)
+async def test_factorize(path: str, status_code: int, result: list[int] | None):
+    status, response = await call_app("GET", path, [])
+
+    assert status == status_code
+    if status_code == HTTPStatus.OK:
+        assert response["result"] == result
+
+
+@pytest.mark.parametrize("keep_blank_values", [False, True])
+@pytest.mark.parametrize(
+    "query_string",
+    [
+        b"",
+        b"n=10",
+        b"n=10&mod=7",
+        b"a=b=c",
+        b"n=1&n=2&n=3",
+        b"city=New%20York&name=J+Doe",
+        b"%6E=%31%30",
+        b"q=%D0%BF%D1%80%D0%B8%D0%B2%D0%B5%D1%82",
+        b"q=\xd0\xbf\xd1\x80",
+        b"q=%ff%fe",
+        b"q=%zz&r=%4",
+        b"key=&n&=value",
+        b"&&n=1&&",
+        b"a%26b=c%3Dd",
+        b"plus=%2B+%2B",
+    ],
+)
+def test_query_params_match_parse_qs(query_string: bytes, keep_blank_values: bool):
+    params = QueryParams(query_string, keep_blank_values=keep_blank_values)
+    expected = parse_qs(
+        query_string.decode(errors="surrogateescape"),
+        keep_blank_values=keep_blank_values,
+        errors="replace",
+    )
+
+    assert params.to_dict() == {
+        key: [value.encode(errors="surrogateescape").decode(errors="replace") for value in values]
+        for key, values in expected.items()
+    }
+    assert len(params) == len(expected)
+    for key in expected:
+        assert key in params
+    assert params.get("missing") is None
+    assert params.get("missing", []) == []
+
+
+def test_query_params_decode_lazily(monkeypatch):
+    decoded = []
+    unquote = query_string_module.unquote
+    monkeypatch.setattr(
+        query_string_module, "unquote", lambda raw: decoded.append(raw) or unquote(raw)
+    )
+    params = QueryParams(b"n=%31%30&mod=%37")
+    assert decoded == []
+
+    assert params["n"] == ["10"]
+    assert params["n"] == ["10"]
+    assert b"%37" not in decoded
+    assert decoded.count(b"%31%30") == 1
+
+
+@pytest.mark.parametrize(("pairs", "allowed"), [(1, True), (100, True), (101, False)])
+def test_query_params_limit(pairs: int, allowed: bool):
+    query_string = b"&".join(b"k%d=%d" % (i, i) for i in range(pairs))
+    if allowed:
+        assert len(QueryParams(query_string)) == pairs
+    else:
+        with pytest.raises(TooManyParams):
+            QueryParams(query_string)
+
+
+@pytest.mark.asyncio
+async def test_too_many_query_params():
+    query_string = b"n=5&" + b"&".join(b"x=1" for _ in range(200))
+
+    assert await call_app("GET", "/factorial", [], query_string) == (
+        HTTPStatus.BAD_REQUEST,
+        {"error": "at most 100 query parameters are allowed"},
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("body", "headers", "status_code", "result"),
+    [
+        (b"[1, 2, 3.5]", {}, HTTPStatus.OK, 2.1666666666666665),
+        (b'["1.5", 2]', {}, HTTPStatus.OK, 1.75),
+        (b"[true, 1]", {}, HTTPStatus.OK, 1.0),
+        (b"[]", {}, HTTPStatus.BAD_REQUEST, None),
+        (b'["a"]', {}, HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        (b"[null]", {}, HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        (b'{"a": 1}', {}, HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        (b"[1, 2", {}, HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        (b"", {}, HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        (b"[1, 2]", {"content-type": "text/plain"}, HTTPStatus.UNPROCESSABLE_ENTITY, None),
+    ],
+)
+async def test_fastapi_mean_fast_path(
+    monkeypatch, body: bytes, headers: dict[str, str], status_code: int, result: float | None
+):
+    headers = {"content-type": "application/json", **headers}
+    async with TestClient(math_example.app) as client:
+        response = await client.get("/mean", data=body, headers=headers)
+        monkeypatch.setattr(math_example, "fast_mean", lambda request, body: None)
+        validated = await client.get("/mean", data=body, headers=headers)
+
+    assert response.status_code == status_code
+    if status_code == HTTPStatus.OK:
+        assert response.json()["result"] == pytest.approx(result)
+    # the fast path answers exactly what the validated endpoint does
+    assert validated.status_code == response.status_code
+    if status_code == HTTPStatus.OK:
+        assert validated.json()["result"] == pytest.approx(response.json()["result"])
+    else:
+        assert validated.json() == response.json()
+
+
+def test_factorial_mod_checkpoints_are_thread_safe(modular_backend: str, monkeypatch):
+    product_mod = modular.product_mod
+
+    def slow_product_mod(lo: int, hi: int, m: int) -> int:
+        # lets the threads overlap while a segment is being computed
+        time.sleep(0.001)
+        return product_mod(lo, hi, m)
+
+    monkeypatch.setattr(modular, "product_mod", slow_product_mod)
+    m = 1_000_003
+    n = 5 * modular.SEGMENT + 7
+    expected = math.factorial(n) % m
+    barrier = threading.Barrier(4)
+
+    def compute() -> int:
+        barrier.wait()
+        return modular.factorial_mod(n, m)
+
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda _: compute(), range(4)))
+
+    assert results == [expected] * 4
+    assert modular.factorial_mod(n + modular.SEGMENT, m) == math.factorial(n + modular.SEGMENT) % m
@@ -1,5 +1,6 @@
 from http import HTTPStatus
 from http.client import UNPROCESSABLE_ENTITY
+from random import Random
 from typing import Any
 from uuid import uuid4
 
@@ -7,9 +8,14 @@ import pytest
 from faker import Faker
 from fastapi.testclient import TestClient
 
+from lecture_2.hw.shop_api.api.item.contracts import ItemRequest, PatchItemRequest
 from lecture_2.hw.shop_api.main import app
+from lecture_2.hw.shop_api.store import indexes, queries
+from lecture_2.hw.shop_api.store.repository import MemoryRepository, get_repository
 
 client = TestClient(app)
+# the suite also runs against the other backends, see test_homework_2_*.py
+memory_backend = type(get_repository()) is MemoryRepository
 faker = Faker()
 
 
@@ -283,3 +289,247 @@ def test_delete_item(existing_item: dict[str, Any]) -> None:
 
     response = client.delete(f"/item/{item_id}")
     assert response.status_code == HTTPStatus.OK
+
+
+def _find_items_by_scan(
+    offset: int, limit: int, min_price: float | None, max_price: float | None, show_deleted: bool
+) -> list[int]:
+    items = sorted(
+        (item.price, item.id)
+        for item in queries.item_data.values()
+        if (min_price is None or item.price >= min_price)
+        and (max_price is None or item.price <= max_price)
+        and (show_deleted or not item.deleted)
+    )
+    return [id for _, id in items[offset : offset + limit]]
+
+
+def test_find_items_price_index() -> None:
+    rng = Random(18)
+    items = [
+        queries.create_item(
+            ItemRequest(name=f"indexed {i}", price=rng.choice([1.0, 2.5, 7.0, 99.0]))
+        )
+        for i in range(200)
+    ]
+    for item in rng.sample(items, 40):
+        queries.update_item(item.id, ItemRequest(name=item.name, price=rng.uniform(0.0, 100.0)))
+    for item in rng.sample(items, 40):
+        queries.patch_item(item.id, PatchItemRequest(price=rng.uniform(0.0, 100.0)))
+    for item in rng.sample(items, 40):
+        queries.delete_item(item.id)
+
+    for min_price, max_price in [(None, 5.0), (2.5, None), (2.5, 7.0), (7.0, 7.0), (50.0, 10.0)]:
+        for show_deleted in (False, True):
+            for offset, limit in [(0, 10), (5, 3), (0, 1000)]:
+                found = queries.find_items(offset, limit, min_price, max_price, show_deleted)
+
+                assert [item.id for item in found] == _find_items_by_scan(
+                    offset, limit, min_price, max_price, show_deleted
+                )
+
+
+def test_sorted_index(monkeypatch) -> None:
+    monkeypatch.setattr(indexes, "BUCKET_SIZE", 4)
+    rng = Random(7)
+    index = indexes.SortedIndex()
+    entries = set()
+    for id in range(300):
+        key = float(rng.randrange(50))
+        index.add(key, id)
+        entries.add((key, id))
+    for key, id in rng.sample(sorted(entries), 100):
+        index.remove(key, id)
+        entries.discard((key, id))
+    for key, id in rng.sample(sorted(entries), 50):
+        index.move(key, key + 0.5, id)
+        entries.discard((key, id))
+        entries.add((key + 0.5, id))
+    index.remove(1000.0, 1)
+
+    assert len(index) == len(entries)
+    assert list(index.range()) == sorted(entries)
+    for lo, hi in [(None, 10.0), (10.0, None), (10.0, 20.0), (10.5, 10.5), (60.0, None), (5.0, 1.0)]:
+        assert list(index.range(lo, hi)) == sorted(
+            entry
+            for entry in entries
+            if (lo is None or entry[0] >= lo) and (hi is None or entry[0] <= hi)
+        )
+
+
+def test_find_carts_indexes() -> None:
+    rng = Random(19)
+    items = [
+        queries.create_item(ItemRequest(name=f"cart item {i}", price=float(rng.randrange(1, 20))))
+        for i in range(10)
+    ]
+    for _ in range(100):
+        cart = queries.add_cart()
+        for item in rng.choices(items, k=rng.randrange(8)):
+            queries.add_item(cart.id, item.id)
+
+    for cart in queries.cart_data.values():
+        assert cart.quantity == sum(item.quantity for item in cart.items)
+
+    filters = [
+        (None, 30.0, None, None),
+        (10.0, 40.0, 2, None),
+        (None, None, 3, 5),
+        (None, None, None, 0),
+        (20.0, 20.0, None, None),
+        (None, None, None, None),
+    ]
+    for min_price, max_price, min_quantity, max_quantity in filters:
+        carts = [
+            cart for cart in queries.cart_data.values()
+            if (min_price is None or cart.price >= min_price)
+            and (max_price is None or cart.price <= max_price)
+            and (min_quantity is None or cart.quantity >= min_quantity)
+            and (max_quantity is None or cart.quantity <= max_quantity)
+        ]
+        if min_price is not None or max_price is not None:
+            carts.sort(key=lambda cart: (cart.price, cart.id))
+        elif min_quantity is not None or max_quantity is not None:
+            carts.sort(key=lambda cart: (cart.quantity, cart.id))
+
+        for offset, limit in [(0, 10), (3, 5), (0, 1000)]:
+            found = queries.find_carts(min_price, max_price, min_quantity, max_quantity, offset, limit)
+
+            assert found == carts[offset : offset + limit]
+
+
+def _walk_pages(path: str, params: dict[str, Any]) -> list[dict[str, Any]]:
+    rows = []
+    cursor = None
+    while True:
+        response = client.get(path, params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == HTTPStatus.OK
+        rows += response.json()
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            return rows
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"limit": 3},
+        {"limit": 4, "min_price": 10.0, "max_price": 300.0},
+        {"limit": 5, "show_deleted": True, "max_price": 200.0},
+    ],
+)
+def test_item_cursor_pagination(params: dict[str, Any]) -> None:
+    expected = client.get("/item", params={**params, "limit": 10**6}).json()
+
+    assert _walk_pages("/item", params) == expected
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"limit": 3},
+        {"limit": 4, "min_price": 10.0},
+        {"limit": 2, "min_quantity": 2, "max_quantity": 10},
+        {"limit": 3, "max_price": 2000.0, "min_quantity": 3},
+    ],
+)
+def test_cart_cursor_pagination(params: dict[str, Any]) -> None:
+    expected = client.get("/cart", params={**params, "limit": 10**6}).json()
+
+    assert _walk_pages("/cart", params) == expected
+
+
+def test_cursor_pages_do_not_shift_on_insert() -> None:
+    first = client.get("/item", params={"min_price": 0.0, "limit": 2})
+    cursor = first.headers["x-next-cursor"]
+    # a new cheapest item lands before the cursor and is not served again
+    client.post("/item", json={"name": "cheapest", "price": 0.0})
+
+    second = client.get("/item", params={"min_price": 0.0, "limit": 2, "cursor": cursor})
+
+    assert second.status_code == HTTPStatus.OK
+    first_ids = {item["id"] for item in first.json()}
+    assert not first_ids & {item["id"] for item in second.json()}
+    assert all(item["name"] != "cheapest" for item in second.json())
+
+
+@pytest.mark.parametrize(
+    ("path", "params"),
+    [
+        ("/item", {"cursor": "not a cursor"}),
+        ("/item", {"cursor": "WzEsMl0"}),
+        ("/cart", {"cursor": "%%%"}),
+    ],
+)
+def test_invalid_cursor(path: str, params: dict[str, Any]) -> None:
+    response = client.get(path, params=params)
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_cursor_from_another_order() -> None:
+    cursor = client.get("/item", params={"limit": 1}).headers["x-next-cursor"]
+
+    response = client.get("/item", params={"min_price": 1.0, "cursor": cursor})
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.skipif(not memory_backend, reason="inspects the in-memory store")
+def test_add_item_keeps_lines_by_id(existing_items: list[int]) -> None:
+    cart = queries.add_cart()
+    for item_id in existing_items[:3] + existing_items[:2] + existing_items[:1]:
+        queries.add_item(cart.id, item_id)
+
+    assert [(line.id, line.quantity) for line in cart.items] == [
+        (existing_items[0], 3),
+        (existing_items[1], 2),
+        (existing_items[2], 1),
+    ]
+    assert cart.items_by_id == {line.id: line for line in cart.items}
+    assert all(cart.items_by_id[line.id] is line for line in cart.items)
+
+    response = client.get(f"/cart/{cart.id}").json()
+    assert set(response) == {"id", "items", "price"}
+
+
+def _expected_cart_price(cart) -> float:
+    return sum(
+        queries.item_data[line.id].price * line.quantity for line in cart.items if line.available
+    )
+
+
+def test_item_changes_reach_carts() -> None:
+    apple = client.post("/item", json={"name": "apple", "price": 2.0}).json()["id"]
+    pear = client.post("/item", json={"name": "pear", "price": 3.0}).json()["id"]
+    carts = [client.post("/cart").json()["id"] for _ in range(3)]
+    for cart_id, item_ids in zip(carts, [[apple, apple, pear], [pear], [apple]]):
+        for item_id in item_ids:
+            client.post(f"/cart/{cart_id}/add/{item_id}")
+
+    client.put(f"/item/{apple}", json={"name": "green apple", "price": 5.0})
+    client.patch(f"/item/{pear}", json={"price": 4.0})
+    responses = [client.get(f"/cart/{cart_id}").json() for cart_id in carts]
+
+    assert [response["price"] for response in responses] == [14.0, 4.0, 5.0]
+    assert responses[0]["items"][0]["name"] == "green apple"
+
+    client.delete(f"/item/{apple}")
+    responses = [client.get(f"/cart/{cart_id}").json() for cart_id in carts]
+
+    assert [response["price"] for response in responses] == [4.0, 4.0, 0.0]
+    assert [line["available"] for line in responses[0]["items"]] == [False, True]
+    assert responses[2]["items"] == [
+        {"id": apple, "name": "green apple", "quantity": 1, "available": False}
+    ]
+
+    # adding a deleted item keeps it unavailable and unpaid
+    client.post(f"/cart/{carts[1]}/add/{apple}")
+    assert client.get(f"/cart/{carts[1]}").json()["price"] == 4.0
+
+    if not memory_backend:
+        return
+    for cart_id in carts:
+        cart = queries.cart_data[cart_id]
+        assert cart.price == pytest.approx(_expected_cart_price(cart))
+        assert (cart.price, cart_id) in queries.cart_price_index.range(cart.price, cart.price)
@@ -0,0 +1,170 @@
+import asyncio
+import errno
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from lecture_2.hw.shop_api.api.item.contracts import ItemRequest, PatchItemRequest
+from lecture_2.hw.shop_api.store import queries
+from lecture_2.hw.shop_api.store.indexes import SortedIndex
+from lecture_2.hw.shop_api.store.journal import Journal, JournalFailed, capture_store
+from lecture_2.hw.shop_api.store.repository import DATABASE_URL_ENV, MemoryRepository
+
+ROOT = Path(__file__).parent.parent
+
+
+def empty_store(monkeypatch) -> None:
+    # the store is module state shared with the API tests, each restart here
+    # starts from a fresh one and the old one is put back afterwards
+    for name, value in {
+        "item_data": {}, "cart_data": {}, "item_ids": [], "cart_ids": [], "item_carts": {},
+        "_item_id_generator": queries.int_id_generator(),
+        "_cart_id_generator": queries.int_id_generator(),
+    }.items():
+        monkeypatch.setattr(queries, name, value)
+    for name in ("item_price_index", "deleted_item_price_index", "cart_price_index", "cart_quantity_index"):
+        monkeypatch.setattr(queries, name, SortedIndex())
+
+
+async def fill(repository: MemoryRepository, items: int = 20, carts: int = 5) -> None:
+    ids = [
+        (await repository.create_item(ItemRequest(name=f"item {i}", price=float(i % 7)))).id
+        for i in range(items)
+    ]
+    for i in range(carts):
+        cart = await repository.add_cart()
+        for item_id in ids[i : i + 4] + ids[i : i + 2]:
+            await repository.add_item(cart.id, item_id)
+    await repository.update_item(ids[1], ItemRequest(name="renamed", price=10.5))
+    await repository.patch_item(ids[2], PatchItemRequest(price=3.25))
+    await repository.delete_item(ids[3])
+    await repository.create_item(ItemRequest(name="ёлка", price=99.0))
+
+
+def state() -> tuple:
+    found = queries.find_items(0, 100, 1.0, 50.0, True), queries.find_carts(None, None, 3, None, 0, 100)
+    return capture_store(), [item.id for item in found[0]], [cart.id for cart in found[1]]
+
+
+def restart(monkeypatch, directory: Path, snapshot_every: int) -> MemoryRepository:
+    empty_store(monkeypatch)
+    return MemoryRepository(Journal.open(directory, snapshot_every))
+
+
+@pytest.mark.parametrize("snapshot_every", [1_000, 10, 1])
+def test_restart_restores_store(monkeypatch, tmp_path, snapshot_every: int) -> None:
+    repository = restart(monkeypatch, tmp_path, snapshot_every)
+    asyncio.run(fill(repository))
+    repository.close()
+    before = state()
+
+    repository = restart(monkeypatch, tmp_path, snapshot_every)
+    assert state() == before
+
+    # ids continue where they stopped and new writes survive the next restart
+    item = asyncio.run(repository.create_item(ItemRequest(name="after", price=1.0)))
+    assert item.id == len(before[0][0])
+    repository.close()
+    before = state()
+
+    repository = restart(monkeypatch, tmp_path, snapshot_every)
+    assert state() == before
+    repository.close()
+
+
+def test_snapshot_replaces_old_files(monkeypatch, tmp_path) -> None:
+    repository = restart(monkeypatch, tmp_path, 10)
+    asyncio.run(fill(repository))
+    repository.close()
+
+    files = sorted(path.name for path in tmp_path.iterdir())
+    generation = repository.journal.generation
+    assert files == [f"journal-{generation}.bin", f"snapshot-{generation}.bin"]
+
+
+def test_concurrent_writes_share_a_sync(monkeypatch, tmp_path) -> None:
+    repository = restart(monkeypatch, tmp_path, 1_000)
+
+    async def create():
+        await asyncio.gather(
+            *(repository.create_item(ItemRequest(name=f"item {i}", price=float(i))) for i in range(50))
+        )
+
+    asyncio.run(create())
+    repository.close()
+
+    assert repository.journal.records == 50
+    assert repository.journal.syncs == 1
+
+
+def test_torn_record_is_dropped(monkeypatch, tmp_path) -> None:
+    repository = restart(monkeypatch, tmp_path, 1_000)
+    asyncio.run(fill(repository))
+    repository.close()
+    before = state()
+    segment = tmp_path / f"journal-{repository.journal.generation}.bin"
+    data = segment.read_bytes()
+    segment.write_bytes(data + data[:5])
+
+    restart(monkeypatch, tmp_path, 1_000).close()
+    assert state() == before
+
+
+def test_failed_sync_stops_the_store(monkeypatch, tmp_path) -> None:
+    repository = restart(monkeypatch, tmp_path, 1_000)
+    kept = asyncio.run(repository.create_item(ItemRequest(name="kept", price=1.0)))
+    failing = True
+    fdatasync = os.fdatasync
+
+    def flaky_fdatasync(fd: int) -> None:
+        if failing:
+            raise OSError(errno.EIO, "disk gone")
+        fdatasync(fd)
+
+    monkeypatch.setattr(os, "fdatasync", flaky_fdatasync)
+    with pytest.raises(JournalFailed):
+        asyncio.run(repository.create_item(ItemRequest(name="lost", price=2.0)))
+    failing = False
+    # the lost item is still in memory, so nothing is served until a restart
+    with pytest.raises(JournalFailed):
+        asyncio.run(repository.find_items_page(0, 10, None, None, False))
+    with pytest.raises(JournalFailed):
+        asyncio.run(repository.create_item(ItemRequest(name="refused", price=3.0)))
+    repository.close()
+
+    # whether the unsynced record reached the disk is up to the kernel
+    repository = restart(monkeypatch, tmp_path, 1_000)
+    assert asyncio.run(repository.find_item(kept.id)) == kept
+    repository.close()
+
+
+def test_close_resolves_pending_writes(monkeypatch, tmp_path) -> None:
+    repository = restart(monkeypatch, tmp_path, 1_000)
+
+    async def create_and_close():
+        pending = asyncio.create_task(repository.create_item(ItemRequest(name="pending", price=1.0)))
+        await asyncio.sleep(0)
+        # the write is buffered and its flush not run yet
+        repository.close()
+        return await asyncio.wait_for(pending, 1.0)
+
+    item = asyncio.run(create_and_close())
+
+    repository = restart(monkeypatch, tmp_path, 1_000)
+    assert asyncio.run(repository.find_item(item.id)) == item
+    repository.close()
+
+
+@pytest.mark.slow
+def test_shop_suite_on_journal(tmp_path) -> None:
+    env = {**os.environ, DATABASE_URL_ENV: f"journal:///{tmp_path}"}
+    result = subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", "tests/test_homework_2.py"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+
+    assert result.returncode == 0, result.stdout[-3000:]
+    assert list(tmp_path.glob("journal-*.bin"))
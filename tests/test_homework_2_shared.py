@@ -0,0 +1,207 @@
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+from pathlib import Path
+from random import Random
+
+import pytest
+
+from lecture_2.hw.shop_api.store import queries, shared
+from lecture_2.hw.shop_api.store.indexes import SortedIndex
+from lecture_2.hw.shop_api.store.repository import DATABASE_URL_ENV, ForeignCart
+from lecture_2.hw.shop_api.store.shared import U64, CatalogFull, SharedCatalog, SharedCatalogRepository
+
+ROOT = Path(__file__).parent.parent
+VERSIONS = [("a", 1.0), ("bbbbbbbb", 2.0)]
+
+
+@pytest.fixture()
+def catalog(tmp_path):
+    catalog = SharedCatalog(str(tmp_path / "catalog"), capacity=1_000, arena_size=1 << 20)
+    yield catalog
+    catalog.close()
+
+
+def _create(path: str, n: int) -> None:
+    catalog = SharedCatalog(path)
+    for i in range(n):
+        catalog.create(f"from worker {i}", float(i))
+    catalog.close()
+
+
+def _flip(path: str, n: int) -> None:
+    catalog = SharedCatalog(path)
+    for i in range(n):
+        catalog.update(0, *VERSIONS[i % 2])
+    catalog.close()
+
+
+def test_workers_share_items(catalog: SharedCatalog, tmp_path) -> None:
+    catalog.create("from parent", 5.0)
+    worker = multiprocessing.get_context("spawn").Process(target=_create, args=(str(tmp_path / "catalog"), 10))
+    worker.start()
+    worker.join()
+
+    assert len(catalog) == 11
+    assert catalog.get(10).name == "from worker 9"
+    assert catalog.find_page(0, 3, None, None, False)[0][1].name == "from worker 0"
+
+
+def test_readers_never_see_a_torn_item(catalog: SharedCatalog, tmp_path) -> None:
+    catalog.create(*VERSIONS[0])
+    worker = multiprocessing.get_context("spawn").Process(target=_flip, args=(str(tmp_path / "catalog"), 5_000))
+    worker.start()
+    seen = set()
+    while worker.is_alive():
+        item = catalog.get(0)
+        seen.add((item.name, item.price))
+    worker.join()
+
+    assert seen <= set(VERSIONS)
+
+
+@pytest.mark.parametrize("with_numpy", [True, False])
+def test_find_page_matches_a_scan(monkeypatch, catalog: SharedCatalog, with_numpy: bool) -> None:
+    if not with_numpy:
+        monkeypatch.setattr(shared, "numpy", None)
+    elif shared.numpy is None:
+        pytest.skip("numpy is not installed")
+    rng = Random(25)
+    for i in range(300):
+        catalog.create(f"item {i}", float(rng.randrange(50)))
+    # the price index is built now and follows the changes below
+    catalog.find_page(0, 1, 0.0, None, False)
+    for id in rng.sample(range(300), 60):
+        catalog.delete(id)
+    for id in rng.sample(range(300), 60):
+        catalog.update(id, f"renamed {id}", float(rng.randrange(50)))
+
+    items = [catalog.get(id) for id in range(300)]
+    for min_price, max_price in [(None, None), (10.0, None), (None, 20.0), (5.0, 5.0), (10.0, 30.0)]:
+        for show_deleted in (False, True):
+            expected = [
+                item for item in items
+                if (min_price is None or item.price >= min_price) and (max_price is None or item.price <= max_price)
+                and (show_deleted or not item.deleted)
+            ]
+            if min_price is not None or max_price is not None:
+                expected.sort(key=lambda item: (item.price, item.id))
+            found, cursor = catalog.find_page(3, 7, min_price, max_price, show_deleted)
+            while cursor is not None:
+                page, cursor = catalog.find_page(0, 7, min_price, max_price, show_deleted, cursor)
+                found += page
+            assert found == expected[3:]
+
+
+@pytest.mark.parametrize("log_size", [shared.LOG_SIZE, 4])
+def test_price_index_follows_other_workers(monkeypatch, tmp_path, log_size: int) -> None:
+    # with a short log the reader falls behind it and indexes afresh
+    monkeypatch.setattr(shared, "LOG_SIZE", log_size)
+    path = str(tmp_path / "catalog")
+    reader, writer = SharedCatalog(path), SharedCatalog(path)
+    for i in range(10):
+        writer.create(f"item {i}", float(i))
+    assert [item.id for item in reader.find_page(0, 3, 2.0, None, False)[0]] == [2, 3, 4]
+
+    writer.update(2, None, 100.0)
+    writer.update(3, "renamed", None)
+    writer.delete(4)
+    writer.create("new", 2.5)
+    for i in range(10):
+        writer.update(9, None, 9.0 + i % 2)
+
+    assert [item.id for item in reader.find_page(0, 3, 2.0, None, False)[0]] == [10, 3, 5]
+    assert [item.id for item in reader.find_page(0, 3, 3.0, 5.0, True)[0]] == [3, 4, 5]
+    assert reader.find_page(0, 3, 50.0, None, False)[0][0].name == "item 2"
+    reader.close()
+    writer.close()
+
+
+def test_catalog_limits(catalog: SharedCatalog) -> None:
+    catalog.create("kept", 1.0)
+    item = catalog.update(0, None, 2.0)
+
+    assert (item.name, item.price) == ("kept", 2.0)
+    assert catalog.update(1, "missing", 1.0) is None
+    with pytest.raises(CatalogFull):
+        catalog.create("x" * (2 << 20), 1.0)
+    for i in range(999):
+        catalog.create(f"item {i}", 1.0)
+    with pytest.raises(CatalogFull):
+        catalog.create("one too many", 1.0)
+
+
+def test_half_written_record_is_repaired(tmp_path) -> None:
+    path = str(tmp_path / "catalog")
+    catalog = SharedCatalog(path)
+    catalog.create("kept", 1.0)
+    # a writer that died between marking the record and finishing it
+    U64.pack_into(catalog._map, catalog._records, U64.unpack_from(catalog._map, catalog._records)[0] + 1)
+    # a reader stops waiting for it and repairs it under the writers' lock
+    assert catalog.get(0).name == "kept"
+    U64.pack_into(catalog._map, catalog._records, U64.unpack_from(catalog._map, catalog._records)[0] + 1)
+    catalog.close()
+
+    catalog = SharedCatalog(path)
+    assert catalog.get(0).name == "kept"
+    catalog.close()
+
+
+def test_other_workers_carts_are_refused(monkeypatch, catalog: SharedCatalog) -> None:
+    monkeypatch.setattr(queries, "cart_data", {})
+    monkeypatch.setattr(queries, "_cart_id_generator", queries._cart_id_generator)
+    repository = SharedCatalogRepository(catalog)
+    # another worker created this cart
+    id = catalog.new_cart_id()
+
+    with pytest.raises(ForeignCart):
+        asyncio.run(repository.find_cart(id))
+    with pytest.raises(ForeignCart):
+        asyncio.run(repository.add_item(id, 0))
+    assert asyncio.run(repository.find_cart(id + 1)) is None
+
+
+@pytest.mark.parametrize("log_size", [shared.LOG_SIZE, 2])
+def test_carts_follow_other_workers_changes(monkeypatch, tmp_path, log_size: int) -> None:
+    # with a short log the worker holding the cart falls behind it
+    monkeypatch.setattr(shared, "LOG_SIZE", log_size)
+    monkeypatch.setattr(queries, "cart_data", {})
+    monkeypatch.setattr(queries, "cart_ids", [])
+    monkeypatch.setattr(queries, "item_carts", {})
+    monkeypatch.setattr(queries, "cart_price_index", SortedIndex())
+    monkeypatch.setattr(queries, "cart_quantity_index", SortedIndex())
+    monkeypatch.setattr(queries, "_cart_id_generator", queries._cart_id_generator)
+    path = str(tmp_path / "catalog")
+    holder = SharedCatalogRepository(SharedCatalog(path))
+    other = SharedCatalog(path)
+    for i in range(3):
+        other.create(f"item {i}", 10.0)
+    cart = asyncio.run(holder.add_cart())
+    for id in (0, 0, 1, 2):
+        asyncio.run(holder.add_item(cart.id, id))
+
+    other.update(0, None, 20.0)
+    other.update(1, "renamed", None)
+    other.delete(2)
+
+    cart = asyncio.run(holder.find_cart(cart.id))
+    assert cart.price == 50.0
+    assert [(line.name, line.available) for line in cart.items] == [
+        ("item 0", True), ("renamed", True), ("item 2", False)
+    ]
+    assert asyncio.run(holder.find_carts_page(40.0, 60.0, None, None))[0] == [cart]
+    holder.close()
+    other.close()
+
+
+@pytest.mark.slow
+def test_shop_suite_on_shared_catalog(tmp_path) -> None:
+    env = {**os.environ, DATABASE_URL_ENV: f"shared:///{tmp_path / 'catalog'}"}
+    result = subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", "tests/test_homework_2.py"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+
+    assert result.returncode == 0, result.stdout[-3000:]
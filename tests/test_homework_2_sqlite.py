@@ -0,0 +1,97 @@
+import asyncio
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from lecture_2.hw.shop_api.api.item.contracts import ItemRequest, PatchItemRequest
+from lecture_2.hw.shop_api.store.repository import DATABASE_URL_ENV
+from lecture_2.hw.shop_api.store.sqlite import SqliteRepository
+
+ROOT = Path(__file__).parent.parent
+
+
+@pytest.fixture()
+def repository(tmp_path):
+    repository = SqliteRepository(str(tmp_path / "shop.db"))
+    yield repository
+    repository.close()
+
+
+@pytest.mark.slow
+def test_shop_suite_on_sqlite(tmp_path) -> None:
+    # the repository is picked once per process, so the API tests run again
+    # in a fresh interpreter pointed at a database file
+    env = {**os.environ, DATABASE_URL_ENV: f"sqlite:///{tmp_path / 'shop.db'}"}
+    result = subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", "tests/test_homework_2.py"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+
+    assert result.returncode == 0, result.stdout[-3000:]
+
+
+def test_concurrent_writes_share_a_commit(repository: SqliteRepository) -> None:
+    async def create():
+        return await asyncio.gather(
+            *(repository.create_item(ItemRequest(name=f"item {i}", price=float(i))) for i in range(50))
+        )
+
+    items = asyncio.run(create())
+
+    assert [item.name for item in items] == [f"item {i}" for i in range(50)]
+    assert len({item.id for item in items}) == 50
+    assert repository.writer.writes == 50
+    assert repository.writer.batches == 1
+
+
+def test_failed_write_keeps_the_rest_of_the_batch(repository: SqliteRepository) -> None:
+    async def write():
+        return await asyncio.gather(
+            repository.create_item(ItemRequest(name="kept", price=1.0)),
+            repository.add_item(100, 100),
+            repository.add_cart(),
+            return_exceptions=True,
+        )
+
+    item, error, cart = asyncio.run(write())
+
+    assert isinstance(error, ValueError)
+    assert repository.writer.batches == 1
+    assert asyncio.run(repository.find_item(item.id)) == item
+    assert asyncio.run(repository.find_cart(cart.id)) == cart
+
+
+def test_cart_price_follows_item_changes(repository: SqliteRepository) -> None:
+    async def scenario():
+        apple = await repository.create_item(ItemRequest(name="apple", price=2.0))
+        cart = await repository.add_cart()
+        for _ in range(3):
+            await repository.add_item(cart.id, apple.id)
+        await repository.patch_item(apple.id, PatchItemRequest(price=5.0))
+        repriced = await repository.find_cart(cart.id)
+        await repository.delete_item(apple.id)
+        return repriced, await repository.find_cart(cart.id)
+
+    repriced, emptied = asyncio.run(scenario())
+
+    assert (repriced.price, repriced.quantity) == (15.0, 3)
+    assert emptied.price == 0.0
+    assert [line.available for line in emptied.items] == [False]
+
+
+def test_data_survives_reopen(tmp_path) -> None:
+    path = str(tmp_path / "shop.db")
+    repository = SqliteRepository(path)
+    item = asyncio.run(repository.create_item(ItemRequest(name="kept", price=1.0)))
+    repository.close()
+
+    repository = SqliteRepository(path)
+    try:
+        assert asyncio.run(repository.find_item(item.id)) == item
+        journal_mode = repository.readers.run(lambda conn: conn.execute("PRAGMA journal_mode").fetchone())
+        assert asyncio.run(journal_mode) == ("wal",)
+    finally:
+        repository.close()